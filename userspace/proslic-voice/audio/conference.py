@@ -0,0 +1,173 @@
+import itertools
+import logging
+import threading
+
+from functools import partial
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from audio.tdm import TDMDemux, TDMMux
+
+class _Participant:
+    def __init__(self, row: int, conference: int, demux: TDMDemux, mux: TDMMux, slot: int):
+        self.row = row
+        self.conference = conference
+        self.demux = demux
+        self.mux = mux
+        self.slot = slot
+
+class _MuxTap:
+    """TDMMux source rendering the participants of one mux."""
+    def __init__(self, mixer: "ConferenceMixer", mux: TDMMux):
+        self._mixer = mixer
+        self._mux = mux
+
+    def render(self, out: np.ndarray, frame: int):
+        self._mixer._render(self._mux, out)
+
+class ConferenceMixer:
+    """N-party conferences between TDM slots, of one or more devices.
+
+    Captured periods land in one row per participant, conference sums are a
+    single matrix product and everyone hears the sum minus their own voice,
+    saturated to int16. All the conferences are mixed at once into
+    preallocated buffers, only joining and leaving touch the layout.
+    """
+    def __init__(self, period_size: int, capacity: int = 16):
+        self._logger = logging.getLogger("ConferenceMixer")
+
+        self.period_size = period_size
+        self.capacity = capacity
+
+        # Row per participant, the last sum row stays zero for free rows.
+        # float32 so the product goes through BLAS, sums of int16 stay exact
+        self._inputs = np.zeros((capacity, period_size), dtype=np.float32)
+        self._mixed = np.zeros((capacity, period_size), dtype=np.float32)
+        self._membership = np.zeros((capacity + 1, capacity), dtype=np.float32)
+        self._sums = np.zeros((capacity + 1, period_size), dtype=np.float32)
+        self._conference_of = np.full(capacity, capacity, dtype=np.intp)
+
+        self._ids = itertools.count(1)
+        # conference id -> membership row
+        self._conferences: Dict[int, int] = {}
+        self._participants: Dict[Tuple[TDMMux, int], _Participant] = {}
+        self._free_rows = list(range(capacity))
+
+        # Taps registered on the streams of the participants
+        self._listeners: Dict[TDMDemux, partial] = {}
+        self._sources: Dict[TDMMux, _MuxTap] = {}
+        # Participants grouped by stream, replaced on changes only
+        self._by_demux: Dict[TDMDemux, Tuple[_Participant, ...]] = {}
+        self._by_mux: Dict[TDMMux, Tuple[_Participant, ...]] = {}
+
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"ConferenceMixer(conferences={len(self._conferences)} participants={len(self._participants)})"
+
+    def create(self) -> int:
+        with self._lock:
+            if len(self._conferences) >= self.capacity:
+                raise RuntimeError("No conference left")
+            used = set(self._conferences.values())
+            row = next(row for row in range(self.capacity) if row not in used)
+            conference = next(self._ids)
+            self._conferences[conference] = row
+        self._logger.info(f"Created conference={conference}")
+        return conference
+
+    def destroy(self, conference: int):
+        with self._lock:
+            for key, participant in list(self._participants.items()):
+                if participant.conference == conference:
+                    self._leave(key)
+            self._conferences.pop(conference, None)
+            self._regroup()
+        self._logger.info(f"Destroyed conference={conference}")
+
+    def join(self, conference: int, demux: TDMDemux, mux: TDMMux, slot: int):
+        with self._lock:
+            if conference not in self._conferences:
+                raise KeyError(f"Unknown conference={conference}")
+            if (mux, slot) in self._participants:
+                raise ValueError(f"Slot {slot} is already in a conference")
+            if not self._free_rows:
+                raise RuntimeError("Conference mixer is full")
+
+            row = self._free_rows.pop(0)
+            participant = _Participant(row, conference, demux, mux, slot)
+            self._participants[(mux, slot)] = participant
+            self._membership[self._conferences[conference], row] = 1
+            self._conference_of[row] = self._conferences[conference]
+            self._regroup()
+        self._logger.debug(f"Slot {slot} joined conference={conference}")
+
+    def leave(self, mux: TDMMux, slot: int):
+        with self._lock:
+            if self._leave((mux, slot)):
+                self._regroup()
+
+    def close(self):
+        with self._lock:
+            for key in list(self._participants):
+                self._leave(key)
+            self._conferences.clear()
+            self._regroup()
+
+    def _leave(self, key):
+        participant = self._participants.pop(key, None)
+        if participant is None:
+            return False
+
+        row = participant.row
+        self._membership[:, row] = 0
+        self._conference_of[row] = self.capacity
+        self._inputs[row] = 0
+        self._free_rows.append(row)
+        return True
+
+    def _regroup(self):
+        by_demux: Dict[TDMDemux, List[_Participant]] = {}
+        by_mux: Dict[TDMMux, List[_Participant]] = {}
+        for participant in self._participants.values():
+            by_demux.setdefault(participant.demux, []).append(participant)
+            by_mux.setdefault(participant.mux, []).append(participant)
+        self._by_demux = {demux: tuple(group) for demux, group in by_demux.items()}
+        self._by_mux = {mux: tuple(group) for mux, group in by_mux.items()}
+
+        # Only tap the streams with participants
+        for demux in set(self._listeners) - set(by_demux):
+            demux.removeListener(self._listeners.pop(demux))
+        for demux in set(by_demux) - set(self._listeners):
+            self._listeners[demux] = partial(self._capture, demux)
+            demux.addListener(self._listeners[demux])
+        for mux in set(self._sources) - set(by_mux):
+            mux.removeSource(self._sources.pop(mux))
+        for mux in set(by_mux) - set(self._sources):
+            self._sources[mux] = _MuxTap(self, mux)
+            mux.addSource(self._sources[mux])
+
+    def _capture(self, demux: TDMDemux, frames: np.ndarray, timestamp):
+        count = min(len(frames), self.period_size)
+        with self._lock:
+            for participant in self._by_demux.get(demux, ()):
+                np.copyto(self._inputs[participant.row, :count], frames[:count, participant.slot])
+            self._dirty = True
+
+    def _mix(self):
+        np.matmul(self._membership, self._inputs, out=self._sums)
+        # Indices are always valid, mode "raise" would buffer out in a temporary every period
+        np.take(self._sums, self._conference_of, axis=0, out=self._mixed, mode="clip")
+        np.subtract(self._mixed, self._inputs, out=self._mixed)
+        np.clip(self._mixed, -32768, 32767, out=self._mixed)
+        self._dirty = False
+
+    def _render(self, mux: TDMMux, out: np.ndarray):
+        count = min(len(out), self.period_size)
+        with self._lock:
+            if self._dirty:
+                self._mix()
+            for participant in self._by_mux.get(mux, ()):
+                np.copyto(out[:count, participant.slot], self._mixed[participant.row, :count], casting="unsafe")
@@ -0,0 +1,146 @@
+import logging
+
+from typing import List
+
+import numpy as np
+
+from audio.pcm import PCM_RATE
+from audio.tdm import TDMDemux
+
+DTMF_ROWS = (697.0, 770.0, 852.0, 941.0)
+DTMF_COLS = (1209.0, 1336.0, 1477.0, 1633.0)
+DTMF_KEYS = (
+    "123A",
+    "456B",
+    "789C",
+    "*0#D",
+)
+
+# 20 ms analysis blocks, a valid digit must last at least 40 ms
+DTMF_BLOCK_SIZE = 320
+# Consecutive blocks with the same key before reporting it
+DTMF_HITS = 2
+
+_NO_KEY = -1
+
+class DTMFDetector:
+    """DTMF detector running a Goertzel bank over all channels at once.
+
+    Each Goertzel filter is a single DFT bin, so the whole bank for every
+    channel is evaluated as one matrix product per block.
+    """
+    def __init__(self, channels: int, rate=PCM_RATE, block_size=DTMF_BLOCK_SIZE,
+                 min_level=-36.0, tone_ratio=0.6, normal_twist=8.0, reverse_twist=4.0, peak_ratio=6.0):
+        self.channels = channels
+        self.block_size = block_size
+
+        # Goertzel basis, (samples, 8 tones) for the cosine and sine parts
+        n = np.arange(block_size)[:, np.newaxis]
+        omega = 2 * np.pi * np.array(DTMF_ROWS + DTMF_COLS) / rate
+        self._basis = np.hstack([np.cos(omega * n), np.sin(omega * n)]).astype(np.float32)
+
+        # Thresholds, tone power is normalized to the mean power of the tone
+        full_scale = 32768.0 ** 2 / 2
+        self._min_power = full_scale * 10 ** (min_level / 10)
+        self._tone_ratio = tone_ratio
+        self._normal_twist = 10 ** (-normal_twist / 10)
+        self._reverse_twist = 10 ** (reverse_twist / 10)
+        self._peak_ratio = 10 ** (peak_ratio / 10)
+
+        self._block = np.zeros((block_size, channels), dtype=np.float32)
+        self._fill = 0
+
+        self._candidate = np.full(channels, _NO_KEY)
+        self._hits = np.zeros(channels, dtype=np.int64)
+        self._reported = np.full(channels, _NO_KEY)
+
+    def process(self, frames: np.ndarray):
+        """Feed (frames, channels) int16 samples, returns a list of (channel, key)."""
+        digits = []
+        offset = 0
+        while offset < len(frames):
+            count = min(self.block_size - self._fill, len(frames) - offset)
+            self._block[self._fill:self._fill + count] = frames[offset:offset + count]
+            self._fill += count
+            offset += count
+
+            if self._fill == self.block_size:
+                self._fill = 0
+                digits += self._detect_block()
+        return digits
+
+    def _classify(self, block: np.ndarray) -> np.ndarray:
+        """Returns the key index of every channel for a single block."""
+        # (channels, 16) -> (channels, 8) bin power, scaled to the tone mean power
+        parts = block.T @ self._basis
+        power = (parts[:, :8] ** 2 + parts[:, 8:] ** 2) * (2.0 / self.block_size ** 2)
+        energy = np.einsum("ij,ij->j", block, block) / self.block_size
+
+        rows, cols = power[:, :4], power[:, 4:]
+        row = rows.argmax(axis=1)
+        col = cols.argmax(axis=1)
+        index = np.arange(self.channels)
+        row_power = rows[index, row]
+        col_power = cols[index, col]
+
+        # Every other tone of the group must be well below the peak
+        rows_sorted = np.sort(rows, axis=1)
+        cols_sorted = np.sort(cols, axis=1)
+
+        valid = (
+            (row_power >= self._min_power)
+            & (col_power >= self._min_power)
+            & (row_power + col_power >= self._tone_ratio * energy)
+            & (col_power >= row_power * self._normal_twist)
+            & (col_power <= row_power * self._reverse_twist)
+            & (rows_sorted[:, -2] * self._peak_ratio <= row_power)
+            & (cols_sorted[:, -2] * self._peak_ratio <= col_power)
+        )
+        return np.where(valid, row * 4 + col, _NO_KEY)
+
+    def _detect_block(self):
+        keys = self._classify(self._block)
+
+        same = keys == self._candidate
+        self._hits = np.where(same, self._hits + 1, 1)
+        self._candidate = keys
+
+        stable = self._hits >= DTMF_HITS
+        fire = stable & (keys != _NO_KEY) & (keys != self._reported)
+        # A digit is released by silence, not by a single bad block
+        self._reported = np.where(stable, keys, self._reported)
+
+        return [(int(channel), DTMF_KEYS[keys[channel] // 4][keys[channel] % 4])
+                for channel in np.flatnonzero(fire)]
+
+class DTMFCapture:
+    """Runs a DTMFDetector on the slots of a TDM capture stream.
+
+    slots lists the stream channels to analyze, on_digit is called as
+    fn(slot, digit, timestamp) from the capture thread.
+    """
+    def __init__(self, demux: TDMDemux, slots: List[int], on_digit):
+        self._logger = logging.getLogger("DTMFCapture")
+
+        self._demux = demux
+        self._slots = list(slots)
+        self._on_digit = on_digit
+        # Contiguous slots are a strided view, others are gathered
+        self._columns = self._slots
+        if self._slots and self._slots == list(range(self._slots[0], self._slots[-1] + 1)):
+            self._columns = slice(self._slots[0], self._slots[-1] + 1)
+        self._detector = DTMFDetector(len(self._slots), demux.rate)
+
+    def __str__(self):
+        return f"DTMFCapture(demux={self._demux} slots={self._slots})"
+
+    def setup(self):
+        self._demux.addListener(self._process)
+
+    def close(self):
+        self._demux.removeListener(self._process)
+
+    def _process(self, frames: np.ndarray, timestamp):
+        for channel, digit in self._detector.process(frames[:, self._columns]):
+            self._logger.debug(f"DTMF digit={digit} slot={self._slots[channel]}")
+            self._on_digit(self._slots[channel], digit, timestamp)
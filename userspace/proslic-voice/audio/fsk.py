@@ -0,0 +1,184 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+import traceback
+
+from typing import Dict, Tuple
+
+from audio.oscillator import oscillator_coefficients
+from config import FSKStandard
+from core.device import SiDevice
+from core.io_actor import IOPriority, set_io_priority
+from utils.resources import ProSLIC_CommonREGs, ProSLIC_IRQ1
+
+FSK_BAUD = 1200
+# (space, mark) frequencies
+FSK_TONES = {
+    FSKStandard.BELL202: (2200.0, 1200.0),
+    FSKStandard.V23: (2100.0, 1300.0),
+}
+# FIXME: FSK runs at 24 kHz on the other ProSLIC parts, unverified here
+FSK_RATE = 24000
+FSK_LEVEL = -13.0
+
+# Chip FIFO size, the IRQ is raised once it drains down to _FSK_DEPTH bytes
+_FSK_FIFO = 8
+_FSK_DEPTH = 3
+# Start, 8 data and stop bits
+_FSK_BYTE_TIME = 10 / FSK_BAUD
+
+_IRQ_FSK = ProSLIC_IRQ1.IRQ_FSKBUF_AVAIL.value
+
+def transmission_time(data: bytes):
+    return len(data) * _FSK_BYTE_TIME
+
+class _FSKJob:
+    def __init__(self, device: SiDevice, channel: int, data: bytes, standard: FSKStandard):
+        self.device = device
+        self.channel = channel
+        self.data = memoryview(data)
+        self.standard = standard
+        self.offset = 0
+        self.started = False
+
+class CallerIDFeeder:
+    """Streams on-hook caller ID to the FSK FIFO of any number of lines.
+
+    One thread serves every line: jobs start at their deadline and are
+    refilled in chunks on IRQ_FSKBUF_AVAIL, the thread sleeps in between.
+    """
+    def __init__(self):
+        self._logger = logging.getLogger("CallerIDFeeder")
+
+        self._events = queue.Queue()
+        # (device, channel) -> job, only touched by the feeder thread
+        self._jobs: Dict[Tuple[SiDevice, int], _FSKJob] = {}
+        # (time, seq, key, job, action)
+        self._deadlines = []
+        self._seq = itertools.count()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return "CallerIDFeeder()"
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        self._events.put(None)
+        if self._thread.is_alive():
+            self._thread.join()
+        for job in self._jobs.values():
+            self._finish(job)
+        self._jobs.clear()
+
+    def send(self, device: SiDevice, channel: int, data: bytes, standard: FSKStandard, delay=0.0):
+        """Starts sending data in delay seconds, replaces a pending transmission."""
+        job = _FSKJob(device, channel, data, standard)
+        self._events.put(("send", (device, channel), job, time.monotonic() + delay))
+
+    def cancel(self, device: SiDevice, channel: int):
+        self._events.put(("cancel", (device, channel), None, None))
+
+    def notify(self, device: SiDevice, channel: int):
+        """Called on IRQ_FSKBUF_AVAIL."""
+        self._events.put(("refill", (device, channel), None, None))
+
+    def _schedule(self, when, key, job, action):
+        heapq.heappush(self._deadlines, (when, next(self._seq), key, job, action))
+
+    def _run(self):
+        self._logger.debug("Starting caller ID feeder thread")
+        # Refills are due within the FIFO time, as ring cadence
+        set_io_priority(IOPriority.RING)
+        try:
+            while not self._stop_event.is_set():
+                timeout = None
+                if self._deadlines:
+                    timeout = max(0.0, self._deadlines[0][0] - time.monotonic())
+                try:
+                    event = self._events.get(timeout=timeout)
+                    if event is not None:
+                        self._handle(*event)
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, _, key, job, action = heapq.heappop(self._deadlines)
+                    # Skip deadlines of jobs cancelled or replaced meanwhile
+                    if self._jobs.get(key) is not job:
+                        continue
+                    if action == "start":
+                        self._start(job)
+                    else:
+                        self._finish(job)
+                        del self._jobs[key]
+        except Exception as e:
+            self._logger.error("Unexpected error in caller ID feeder loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("Caller ID feeder thread exiting...")
+
+    def _handle(self, action, key, job, when):
+        current = self._jobs.get(key)
+        if action == "send":
+            if current is not None:
+                self._finish(current)
+            self._jobs[key] = job
+            self._schedule(when, key, job, "start")
+        elif action == "cancel":
+            if current is not None:
+                self._finish(current)
+                del self._jobs[key]
+                self._logger.debug(f"Caller ID cancelled channel={key[1]}")
+        elif current is not None and current.started:
+            self._fill(current, _FSK_FIFO - _FSK_DEPTH)
+
+    def _start(self, job: _FSKJob):
+        space, mark = FSK_TONES[job.standard]
+        job.device.setupFSK(job.channel,
+            oscillator_coefficients(space, FSK_LEVEL, FSK_RATE),
+            oscillator_coefficients(mark, FSK_LEVEL, FSK_RATE),
+            FSK_RATE // FSK_BAUD - 1, _FSK_DEPTH)
+        job.device.enableFSK(job.channel)
+        job.started = True
+
+        self._fill(job, _FSK_FIFO)
+        self._setIRQ(job, True)
+        self._logger.debug(f"Caller ID started channel={job.channel} bytes={len(job.data)}")
+
+    def _fill(self, job: _FSKJob, count):
+        if job.offset >= len(job.data):
+            return
+
+        chunk = job.data[job.offset:job.offset + count]
+        job.device.writeFSKData(job.channel, chunk)
+        job.offset += len(chunk)
+
+        if job.offset >= len(job.data):
+            # No more refills, stop once the FIFO drained
+            self._setIRQ(job, False)
+            self._schedule(time.monotonic() + _FSK_FIFO * _FSK_BYTE_TIME,
+                           (job.device, job.channel), job, "finish")
+
+    def _finish(self, job: _FSKJob):
+        if not job.started:
+            return
+        job.device.disableFSK(job.channel)
+        self._setIRQ(job, False)
+        job.started = False
+        self._logger.debug(f"Caller ID done channel={job.channel} sent={job.offset}/{len(job.data)}")
+
+    def _setIRQ(self, job: _FSKJob, enable):
+        if enable:
+            job.device.updateRegister(job.channel, ProSLIC_CommonREGs.IRQEN1.value, set_mask=_IRQ_FSK)
+        else:
+            job.device.updateRegister(job.channel, ProSLIC_CommonREGs.IRQEN1.value, clear_mask=_IRQ_FSK)
@@ -0,0 +1,85 @@
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from statuses import AudioPCMFormat
+
+# Segment ends, as in the ITU-T G.711 reference code
+_ALAW_SEG_END = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+_ULAW_SEG_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159
+
+def _alaw_decode(codes: np.ndarray) -> np.ndarray:
+    codes = codes ^ 0x55
+    seg = (codes & 0x70) >> 4
+    value = ((codes & 0x0F) << 4) + np.where(seg == 0, 8, 0x108)
+    value = np.where(seg > 1, value << np.maximum(seg - 1, 0), value)
+    return np.where(codes & 0x80, value, -value)
+
+def _ulaw_decode(codes: np.ndarray) -> np.ndarray:
+    codes = ~codes & 0xFF
+    value = (((codes & 0x0F) << 3) + _ULAW_BIAS) << ((codes & 0x70) >> 4)
+    return np.where(codes & 0x80, _ULAW_BIAS - value, value - _ULAW_BIAS)
+
+def _alaw_encode(pcm: np.ndarray) -> np.ndarray:
+    pcm = pcm >> 3
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(_ALAW_SEG_END, pcm)
+    value = (seg << 4) | ((pcm >> np.maximum(seg, 1)) & 0x0F)
+    return np.where(seg >= 8, 0x7F, value) ^ mask
+
+def _ulaw_encode(pcm: np.ndarray) -> np.ndarray:
+    pcm = pcm >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    pcm = np.minimum(np.abs(pcm), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    seg = np.searchsorted(_ULAW_SEG_END, pcm)
+    value = (seg << 4) | ((pcm >> (seg + 1)) & 0x0F)
+    return np.where(seg >= 8, 0x7F, value) ^ mask
+
+_CODECS = {
+    AudioPCMFormat.FMT_UNKOWN_A: (_alaw_decode, _alaw_encode),
+    AudioPCMFormat.FMT_UNKNOWN_B: (_ulaw_decode, _ulaw_encode),
+}
+
+@lru_cache(maxsize=None)
+def _tables(format: AudioPCMFormat):
+    decode, encode = _CODECS[format]
+    decode_table = decode(np.arange(256, dtype=np.int32)).astype(np.int16)
+    # Indexed by the sample bits seen as unsigned, so int16 periods are a plain view
+    encode_table = encode(np.arange(65536, dtype=np.int32).astype(np.uint16).view(np.int16).astype(np.int32)).astype(np.uint8)
+    decode_table.flags.writeable = False
+    encode_table.flags.writeable = False
+    return decode_table, encode_table
+
+class G711Codec:
+    """Table driven G.711 codec working on whole periods.
+
+    Decoding is a lookup in a 256 entry table, encoding a lookup in a 64K
+    entry table indexed by the raw 16 bit sample, both through np.take so a
+    period of every channel is converted in one call.
+    """
+    def __init__(self, format: AudioPCMFormat):
+        if format not in _CODECS:
+            raise ValueError(f"{format} is not a companded format")
+        self.format = format
+        self._decode, self._encode = _tables(format)
+
+    def __str__(self):
+        return f"G711Codec(format={self.format.name})"
+
+    def decode(self, codes: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """uint8 codes to int16 samples, any shape."""
+        return np.take(self._decode, codes, out=out)
+
+    def encode(self, samples: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """int16 samples to uint8 codes, any shape."""
+        return np.take(self._encode, samples.view(np.uint16), out=out)
+
+def codec_for(format: AudioPCMFormat) -> Optional[G711Codec]:
+    """Codec of a device audio format, None for linear PCM."""
+    if format == AudioPCMFormat.FMT_PCM:
+        return None
+    return G711Codec(format)
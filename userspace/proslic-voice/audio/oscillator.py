@@ -0,0 +1,216 @@
+import logging
+import math
+import threading
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from audio.tones import ToneSpec
+from core.device import SiDevice
+from statuses import InterrupFlags
+from utils.resources import ProSLIC_CommonREGs, ProSLIC_IRQ1
+
+# Tone oscillators and their timers run at the narrowband rate
+OSC_RATE = 8000
+# Cadence timers are 16 bit, in samples
+OSC_TIMER_MAX = 0xFFFF
+
+# RAM values are 29 bit two's complement, 1.0 is 2^27
+_RAM_ONE = 1 << 27
+_RAM_MASK = (1 << 29) - 1
+# Full scale sine is +3.14 dBm0 (G.711)
+_FULL_SCALE_DBM0 = 3.14
+
+# OCON bits for one oscillator, OSC2 is the same shifted by 4
+_OCON_ENABLE = 0x01
+_OCON_TIMERS = 0x06
+
+_IRQ_CADENCE = ProSLIC_IRQ1.IRQ_OSC1_T1.value | ProSLIC_IRQ1.IRQ_OSC1_T2.value
+
+@dataclass(frozen=True)
+class OscillatorTone:
+    # (freq, amp) RAM values for OSC1 and OSC2
+    oscillators: Tuple[Tuple[int, int], ...]
+
+@dataclass(frozen=True)
+class OscillatorPreset:
+    tones: Tuple[OscillatorTone, ...]
+    # (active, inactive, tone) in timer ticks, empty for a continuous tone
+    cadence: Tuple[Tuple[int, int, int], ...]
+    duration: float
+
+    @property
+    def count(self):
+        """Number of oscillators in use."""
+        return max(len(tone.oscillators) for tone in self.tones)
+
+    @property
+    def stepped(self):
+        """Cadence needs the host to reprogram the timers on every segment."""
+        return len(self.cadence) > 1
+
+    @property
+    def ocon(self):
+        enable = _OCON_ENABLE | (_OCON_TIMERS if self.cadence else 0)
+        return enable | (enable << 4 if self.count > 1 else 0)
+
+def _ticks(seconds: float, spec: str):
+    ticks = int(round(seconds * OSC_RATE))
+    if not 0 < ticks <= OSC_TIMER_MAX:
+        raise ValueError(f"Cadence times must be between 1/{OSC_RATE} and {OSC_TIMER_MAX / OSC_RATE:.2f}s: {spec}")
+    return ticks
+
+def oscillator_coefficients(freq: float, level: float, rate=OSC_RATE) -> Tuple[int, int]:
+    """(FREQ, AMP) RAM values of a resonator running at rate.
+
+    FREQ = cos(2*pi*f/fs) and AMP scales the initial state so the output
+    peaks at level (dBm0).
+    """
+    coeff = math.cos(2 * math.pi * freq / rate)
+    # FIXME: amplitude scaling taken from the other ProSLIC parts, not measured
+    amp = 0.25 * math.sqrt((1 - coeff) / (1 + coeff)) * 10 ** ((level - _FULL_SCALE_DBM0) / 20)
+    return int(round(coeff * _RAM_ONE)) & _RAM_MASK, int(round(amp * _RAM_ONE))
+
+@lru_cache(maxsize=32)
+def oscillator_preset(spec: str) -> OscillatorPreset:
+    """Oscillator RAM and timer values playing a tone spec on the chip."""
+    tone = ToneSpec.parse(spec)
+
+    tones = []
+    for freqs, level in tone.tones:
+        if len(freqs) > 2:
+            raise ValueError(f"Only two frequencies can be mixed on the chip: {spec}")
+
+        for freq in freqs:
+            if not 0 < freq < OSC_RATE / 2:
+                raise ValueError(f"Frequency {freq} out of oscillator range: {spec}")
+        tones.append(OscillatorTone(tuple(oscillator_coefficients(freq, level) for freq in freqs)))
+
+    cadence = ()
+    if not tone.continuous:
+        cadence = tuple((_ticks(segment.on, spec), _ticks(segment.off, spec), segment.tone)
+                        for segment in tone.cadence)
+
+    return OscillatorPreset(tuple(tones), cadence, tone.duration)
+
+class _ToneState:
+    def __init__(self, preset: OscillatorPreset):
+        self.preset = preset
+        self.segment = 0
+        self.timer: Optional[threading.Timer] = None
+
+class OscillatorToneEngine:
+    """Plays call progress tones with the on-chip oscillators of a device.
+
+    Single segment cadences run on the oscillator timers alone, longer ones
+    are stepped from the OSC1 timer IRQs, so the host only acts on segment
+    boundaries. Tones are keyed by chip channel.
+    """
+    def __init__(self, device: SiDevice):
+        self._logger = logging.getLogger("OscillatorToneEngine")
+
+        self._device = device
+        self._playing: Dict[int, _ToneState] = {}
+        # channel -> tone currently in the oscillator RAM
+        self._loaded: Dict[int, OscillatorTone] = {}
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"OscillatorToneEngine(device={self._device})"
+
+    def setup(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            for channel in list(self._playing):
+                self._stop(channel)
+
+    def play(self, channel: int, spec: str):
+        preset = oscillator_preset(spec)
+
+        with self._lock:
+            self._stop(channel)
+
+            state = _ToneState(preset)
+            self._load(channel, preset.tones[preset.cadence[0][2] if preset.cadence else 0], preset.count)
+            if preset.cadence:
+                active, inactive, _ = preset.cadence[0]
+                for osc in range(preset.count):
+                    self._device.setOscillatorActiveTimer(channel, osc, active)
+                    self._device.setOscillatorInactiveTimer(channel, osc, inactive)
+            if preset.stepped:
+                self._setCadenceIRQ(channel, True)
+            self._device.startOscillators(channel, preset.ocon)
+
+            if preset.duration > 0:
+                state.timer = threading.Timer(preset.duration, self._expire, (channel, state))
+                state.timer.daemon = True
+                state.timer.start()
+            self._playing[channel] = state
+        self._logger.debug(f"Playing tone={spec} channel={channel}")
+
+    def stop(self, channel: int):
+        with self._lock:
+            if self._stop(channel):
+                self._logger.debug(f"Stopped tone channel={channel}")
+
+    def isPlaying(self, channel: int):
+        with self._lock:
+            return channel in self._playing
+
+    def handleInterrupt(self, channel: int, flags):
+        """Steps multi segment cadences, called with the flags of the OSC1 timer IRQs."""
+        with self._lock:
+            state = self._playing.get(channel)
+            if state is None or not state.preset.stepped:
+                return
+
+            preset = state.preset
+            following = preset.cadence[(state.segment + 1) % len(preset.cadence)]
+            # Tone went off: the next active time (and tone) is loaded while silent
+            if InterrupFlags.TONE_ON_END in flags:
+                # FIXME: untested if the resonator restarts cleanly after a FREQ/AMP change
+                self._load(channel, preset.tones[following[2]], preset.count)
+                for osc in range(preset.count):
+                    self._device.setOscillatorActiveTimer(channel, osc, following[0])
+            # Tone is on again: the inactive timer is free to take the next off time
+            if InterrupFlags.TONE_OFF_END in flags:
+                for osc in range(preset.count):
+                    self._device.setOscillatorInactiveTimer(channel, osc, following[1])
+                state.segment = (state.segment + 1) % len(preset.cadence)
+
+    def _load(self, channel, tone: OscillatorTone, count):
+        # Skip the RAM writes when the tone is already there
+        if self._loaded.get(channel) == tone:
+            return
+        for osc in range(count):
+            freq, amp = tone.oscillators[osc] if osc < len(tone.oscillators) else (0, 0)
+            self._device.setupOscillator(channel, osc, freq, amp)
+        self._loaded[channel] = tone
+
+    def _setCadenceIRQ(self, channel, enable):
+        if enable:
+            self._device.updateRegister(channel, ProSLIC_CommonREGs.IRQEN1.value, set_mask=_IRQ_CADENCE)
+        else:
+            self._device.updateRegister(channel, ProSLIC_CommonREGs.IRQEN1.value, clear_mask=_IRQ_CADENCE)
+
+    def _stop(self, channel):
+        state = self._playing.pop(channel, None)
+        if state is None:
+            return False
+
+        if state.timer is not None:
+            state.timer.cancel()
+        self._device.stopOscillators(channel)
+        if state.preset.stepped:
+            self._setCadenceIRQ(channel, False)
+        return True
+
+    def _expire(self, channel, state):
+        with self._lock:
+            # Ignore timers of tones already replaced
+            if self._playing.get(channel) is state:
+                self._stop(channel)
+                self._logger.debug(f"Tone ended channel={channel}")
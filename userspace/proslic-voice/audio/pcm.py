@@ -0,0 +1,185 @@
+import logging
+import time
+import wave
+
+from abc import ABC, abstractmethod
+
+# The kernel DAI only advertises 16 kHz S16_LE (see proslic-spi.c)
+PCM_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+# 20 ms periods
+PCM_PERIOD_SIZE = 320
+
+class _Pacer:
+    """Sleeps until the next period is due, like a blocking ALSA PCM."""
+    def __init__(self, period_size: int):
+        self._period = period_size / PCM_RATE
+        self._next_period = None
+
+    def wait(self):
+        now = time.monotonic()
+        if self._next_period is None:
+            self._next_period = now
+        elif self._next_period > now:
+            time.sleep(self._next_period - now)
+        self._next_period += self._period
+
+class PCMCapture(ABC):
+    """Interleaved S16_LE capture stream, one channel per TDM slot."""
+    def __init__(self, name: str, device: str, channels: int, period_size: int):
+        self._logger = logging.getLogger(name)
+
+        self.device = device
+        self.channels = channels
+        self.period_size = period_size
+        self.rate = PCM_RATE
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(device={self.device} channels={self.channels})"
+
+    @abstractmethod
+    def read(self) -> bytes:
+        """Blocks until a period is available, returns b'' when the stream ended."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+class AlsaCapture(PCMCapture):
+    def __init__(self, device: str, channels: int, period_size: int = PCM_PERIOD_SIZE):
+        super().__init__("AlsaCapture", device, channels, period_size)
+
+        # Only needed when audio features are enabled
+        import alsaaudio
+
+        self._pcm = alsaaudio.PCM(
+            type=alsaaudio.PCM_CAPTURE,
+            mode=alsaaudio.PCM_NORMAL,
+            device=device,
+            channels=channels,
+            rate=PCM_RATE,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=period_size,
+        )
+
+    def read(self):
+        length, data = self._pcm.read()
+        if length < 0:
+            # Overrun, the driver already recovered the stream
+            self._logger.warning(f"Capture overrun on {self.device}")
+            return self.read()
+        return data
+
+    def close(self):
+        self._pcm.close()
+
+class WaveCapture(PCMCapture):
+    """File-backed stand-in for the ALSA capture device.
+
+    Set realtime to pace reads like the hardware would.
+    """
+    def __init__(self, device: str, channels: int, period_size: int = PCM_PERIOD_SIZE, realtime=False):
+        super().__init__("WaveCapture", device, channels, period_size)
+
+        self._pacer = _Pacer(period_size) if realtime else None
+
+        self._wave = wave.open(device, "rb")
+        if self._wave.getsampwidth() != PCM_SAMPLE_WIDTH or self._wave.getframerate() != PCM_RATE:
+            self._wave.close()
+            raise ValueError(f"{device} must be {PCM_RATE} Hz S16_LE")
+        if self._wave.getnchannels() != channels:
+            self._wave.close()
+            raise ValueError(f"{device} has {self._wave.getnchannels()} channels, expected {channels}")
+
+    def read(self):
+        if self._pacer:
+            self._pacer.wait()
+
+        return self._wave.readframes(self.period_size)
+
+    def close(self):
+        self._wave.close()
+
+def openCapture(device: str, channels: int, period_size: int = PCM_PERIOD_SIZE) -> PCMCapture:
+    """Open the capture stream, a path to a .wav file replaces the ALSA PCM."""
+    if device.endswith(".wav"):
+        return WaveCapture(device, channels, period_size, realtime=True)
+    return AlsaCapture(device, channels, period_size)
+
+class PCMPlayback(ABC):
+    """Interleaved S16_LE playback stream, one channel per TDM slot."""
+    def __init__(self, name: str, device: str, channels: int, period_size: int):
+        self._logger = logging.getLogger(name)
+
+        self.device = device
+        self.channels = channels
+        self.period_size = period_size
+        self.rate = PCM_RATE
+
+    def __str__(self):
+        return f"{self.__class__.__name__}(device={self.device} channels={self.channels})"
+
+    @abstractmethod
+    def write(self, data):
+        """Blocks until the period (any bytes-like object) is queued."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+class AlsaPlayback(PCMPlayback):
+    def __init__(self, device: str, channels: int, period_size: int = PCM_PERIOD_SIZE):
+        super().__init__("AlsaPlayback", device, channels, period_size)
+
+        # Only needed when audio features are enabled
+        import alsaaudio
+
+        self._pcm = alsaaudio.PCM(
+            type=alsaaudio.PCM_PLAYBACK,
+            mode=alsaaudio.PCM_NORMAL,
+            device=device,
+            channels=channels,
+            rate=PCM_RATE,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=period_size,
+        )
+
+    def write(self, data):
+        if self._pcm.write(data) < 0:
+            # Underrun, the driver already recovered the stream
+            self._logger.warning(f"Playback underrun on {self.device}")
+
+    def close(self):
+        self._pcm.close()
+
+class WavePlayback(PCMPlayback):
+    """File-backed stand-in for the ALSA playback device.
+
+    Set realtime to pace writes like the hardware would.
+    """
+    def __init__(self, device: str, channels: int, period_size: int = PCM_PERIOD_SIZE, realtime=False):
+        super().__init__("WavePlayback", device, channels, period_size)
+
+        self._pacer = _Pacer(period_size) if realtime else None
+
+        self._wave = wave.open(device, "wb")
+        self._wave.setnchannels(channels)
+        self._wave.setsampwidth(PCM_SAMPLE_WIDTH)
+        self._wave.setframerate(PCM_RATE)
+
+    def write(self, data):
+        if self._pacer:
+            self._pacer.wait()
+
+        self._wave.writeframesraw(data)
+
+    def close(self):
+        self._wave.close()
+
+def openPlayback(device: str, channels: int, period_size: int = PCM_PERIOD_SIZE) -> PCMPlayback:
+    """Open the playback stream, a path to a .wav file replaces the ALSA PCM."""
+    if device.endswith(".wav"):
+        return WavePlayback(device, channels, period_size, realtime=True)
+    return AlsaPlayback(device, channels, period_size)
@@ -0,0 +1,199 @@
+import logging
+import threading
+
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio.tdm import TDMDemux, TDMMux
+
+# Taps of the prototype lowpass, a multiple of every supported factor
+RESAMPLER_TAPS = 32
+_KAISER_BETA = 6.0
+
+@lru_cache(maxsize=None)
+def resampler_bank(factor: int, taps: int = RESAMPLER_TAPS) -> np.ndarray:
+    """Polyphase bank (factor, taps // factor) of a windowed sinc lowpass.
+
+    The cutoff is the narrowband Nyquist frequency, phase p holds taps
+    p, p + factor, ... of the prototype. The DC gain of the prototype is 1.
+    """
+    if taps % factor:
+        raise ValueError(f"Taps {taps} not a multiple of factor {factor}")
+    n = np.arange(taps) - (taps - 1) / 2
+    prototype = np.sinc(n / factor) * np.kaiser(taps, _KAISER_BETA)
+    prototype /= prototype.sum()
+
+    bank = prototype.reshape(-1, factor).T.astype(np.float32)
+    bank.flags.writeable = False
+    return bank
+
+def _saturate(samples: np.ndarray, out: np.ndarray):
+    np.rint(samples, out=samples)
+    np.clip(samples, -32768, 32767, out=samples)
+    np.copyto(out, samples, casting="unsafe")
+
+class Decimator:
+    """Streaming lowpass and decimation of (period, channels) int16 frames.
+
+    Every channel goes through the same filter in one product over sliding
+    windows of the input, evaluated at the kept samples only. The filter
+    history is carried over from one period to the next.
+    """
+    def __init__(self, channels: int, period_size: int, factor: int = 2, taps: int = RESAMPLER_TAPS):
+        if period_size % factor:
+            raise ValueError(f"Period {period_size} not a multiple of factor {factor}")
+        self.channels = channels
+        self.period_size = period_size
+        self.factor = factor
+
+        # Whole prototype, reversed so windows of oldest to newest samples dot it
+        self._taps = np.ascontiguousarray(resampler_bank(factor, taps).T.reshape(-1)[::-1])
+        self._history = taps - factor
+        self._buffer = np.zeros((self._history + period_size, channels), dtype=np.float32)
+        self._windows = sliding_window_view(self._buffer, taps, axis=0)[::factor]
+        self._filtered = np.zeros((period_size // factor, channels), dtype=np.float32)
+        self._out = np.zeros((period_size // factor, channels), dtype=np.int16)
+        self._view = self._out[:]
+        self._view.flags.writeable = False
+
+    def process(self, frames: np.ndarray) -> np.ndarray:
+        """Read-only decimated period, valid until the next call."""
+        if self._history:
+            np.copyto(self._buffer[:self._history], self._buffer[-self._history:])
+        np.copyto(self._buffer[self._history:], frames)
+        np.matmul(self._windows, self._taps, out=self._filtered)
+        _saturate(self._filtered, self._out)
+        return self._view
+
+class Interpolator:
+    """Streaming interpolation and lowpass of (period, channels) int16 frames.
+
+    Each phase of the bank computes one of the interleaved output samples
+    straight from the narrowband input, so the inserted zeros are never
+    multiplied. The filter history is carried over from one period to the next.
+    """
+    def __init__(self, channels: int, period_size: int, factor: int = 2, taps: int = RESAMPLER_TAPS):
+        self.channels = channels
+        self.period_size = period_size
+        self.factor = factor
+
+        # Phases as columns, reversed along the taps, scaled back by the zeros inserted
+        bank = resampler_bank(factor, taps)
+        self._bank = np.ascontiguousarray(bank[:, ::-1].T * factor)
+        self._history = bank.shape[1] - 1
+        self._buffer = np.zeros((self._history + period_size, channels), dtype=np.float32)
+        self._windows = sliding_window_view(self._buffer, bank.shape[1], axis=0)
+        self._phases = np.zeros((period_size, channels, factor), dtype=np.float32)
+        self._filtered = np.zeros((period_size * factor, channels), dtype=np.float32)
+
+    def process(self, frames: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """Interpolated float32 period, saturated into out when given."""
+        if self._history:
+            np.copyto(self._buffer[:self._history], self._buffer[-self._history:])
+        np.copyto(self._buffer[self._history:], frames)
+        np.matmul(self._windows, self._bank, out=self._phases)
+        np.copyto(self._filtered.reshape(self.period_size, self.factor, self.channels),
+                  self._phases.transpose(0, 2, 1))
+        if out is not None:
+            _saturate(self._filtered, out)
+        return self._filtered
+
+class NarrowbandDemux:
+    """TDMDemux seen at rate / factor, every slot decimated at once.
+
+    Listeners are called as for TDMDemux, with the narrowband frames.
+    """
+    def __init__(self, demux: TDMDemux, factor: int = 2):
+        self._logger = logging.getLogger("NarrowbandDemux")
+
+        self.demux = demux
+        self.channels = demux.channels
+        self.period_size = demux.period_size // factor
+        self.rate = demux.rate // factor
+
+        self._decimator = Decimator(self.channels, demux.period_size, factor)
+
+        # Replaced, never modified, so the capture thread reads it without locking
+        self._listeners = ()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"NarrowbandDemux(rate={self.rate} demux={self.demux})"
+
+    def addListener(self, listener):
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+
+    def removeListener(self, listener):
+        with self._lock:
+            self._listeners = tuple(entry for entry in self._listeners if entry != listener)
+
+    def setup(self):
+        self.demux.addListener(self._process)
+
+    def close(self):
+        self.demux.removeListener(self._process)
+
+    def _process(self, frames: np.ndarray, timestamp):
+        listeners = self._listeners
+        if not listeners:
+            return
+        frames = self._decimator.process(frames)
+        for listener in listeners:
+            listener(frames, timestamp)
+
+class NarrowbandMux:
+    """TDMMux seen at rate / factor, every slot interpolated at once.
+
+    Sources render into a narrowband period as for TDMMux, the interpolated
+    result is mixed into the wideband period with saturation, so slots
+    without narrowband sources are left as they are.
+    """
+    def __init__(self, mux: TDMMux, factor: int = 2):
+        self._logger = logging.getLogger("NarrowbandMux")
+
+        self.mux = mux
+        self.channels = mux.channels
+        self.period_size = mux.period_size // factor
+        self.rate = mux.rate // factor
+        self.factor = factor
+
+        self._narrow = np.zeros((self.period_size, self.channels), dtype=np.int16)
+        self._interpolator = Interpolator(self.channels, self.period_size, factor)
+
+        # Replaced, never modified, so the playback thread reads it without locking
+        self._sources = ()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"NarrowbandMux(rate={self.rate} mux={self.mux})"
+
+    @property
+    def frame(self):
+        return self.mux.frame // self.factor
+
+    def addSource(self, source):
+        with self._lock:
+            self._sources = self._sources + (source,)
+
+    def removeSource(self, source):
+        with self._lock:
+            self._sources = tuple(entry for entry in self._sources if entry != source)
+
+    def setup(self):
+        self.mux.addSource(self)
+
+    def close(self):
+        self.mux.removeSource(self)
+
+    def render(self, out: np.ndarray, frame: int):
+        # Keeps filtering without sources so the history decays to silence
+        self._narrow.fill(0)
+        for source in self._sources:
+            source.render(self._narrow, frame // self.factor)
+
+        wide = self._interpolator.process(self._narrow)
+        wide += out
+        _saturate(wide, out)
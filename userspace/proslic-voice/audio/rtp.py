@@ -0,0 +1,384 @@
+import asyncio
+import logging
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import traceback
+
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from audio.g711 import G711Codec
+from audio.resample import NarrowbandDemux, NarrowbandMux
+from audio.tdm import TDMDemux, TDMMux
+from config import RTPCodec
+from statuses import AudioPCMFormat
+
+RTP_VERSION = 2
+RTP_HEADER = struct.Struct("!BBHII")
+RTP_MARKER = 0x80
+# One packet per 20 ms period
+RTP_PTIME = 0.02
+# Dynamic payload type announced for L16 at the stream rate
+L16_PAYLOAD_TYPE = 96
+
+# codec -> (payload type, clock rate, companding)
+_PAYLOADS = {
+    RTPCodec.PCMU: (0, 8000, AudioPCMFormat.FMT_UNKNOWN_B),
+    RTPCodec.PCMA: (8, 8000, AudioPCMFormat.FMT_UNKOWN_A),
+    RTPCodec.L16: (L16_PAYLOAD_TYPE, None, None),
+}
+
+# Packets held by the send ring and the jitter buffer
+_TX_RING = 4
+_JITTER_DEPTH = 16
+
+def parse_peer(peer: Optional[str]) -> Optional[Tuple[str, int]]:
+    """"host:port" to a socket address."""
+    if not peer:
+        return None
+    host, _, port = peer.rpartition(':')
+    return host, int(port)
+
+class JitterBuffer:
+    """Adaptive jitter buffer of fixed size frames indexed by sequence number.
+
+    The playout delay follows the RFC 3550 interarrival jitter estimate,
+    lost frames are concealed by repeating the last one 6 dB quieter each
+    time. All the storage is preallocated.
+    """
+    def __init__(self, samples: int, clock_rate: int, min_delay=1, max_delay=8, depth=_JITTER_DEPTH):
+        self.samples = samples
+        self._clock_rate = clock_rate
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._depth = depth
+
+        self._frames = np.zeros((depth, samples), dtype=np.int16)
+        self._seqs = np.full(depth, -1, dtype=np.int64)
+        self._last = np.zeros(samples, dtype=np.int16)
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.received = 0
+        self.late = 0
+        self.concealed = 0
+        self.dropped = 0
+
+        self._reset()
+
+    def _reset(self):
+        self._seqs.fill(-1)
+        self._last.fill(0)
+        self._count = 0
+        self._next_seq = None
+        self._started = False
+        self._losses = 0
+        self._jitter = 0.0
+        self._transit = None
+        self.delay = self._min_delay
+
+    def _ahead(self, seq):
+        return (seq - self._next_seq) & 0xFFFF
+
+    def frame(self, seq: int) -> Optional[np.ndarray]:
+        """Frame to decode packet seq into, None when it is late or a duplicate.
+
+        The packet only becomes playable once commit() is called.
+        """
+        with self._lock:
+            if self._next_seq is None:
+                self._next_seq = seq
+
+            ahead = self._ahead(seq)
+            if ahead >= 0x8000:
+                self.late += 1
+                return None
+            if ahead >= self._depth:
+                # Far ahead: the peer restarted or we were starved for too long
+                self._reset()
+                self._next_seq = seq
+
+            index = seq % self._depth
+            if self._seqs[index] == seq:
+                return None
+            return self._frames[index]
+
+    def commit(self, seq: int, timestamp: int, arrival: float):
+        """Makes a decoded packet playable and updates the jitter estimate."""
+        transit = arrival * self._clock_rate - timestamp
+        with self._lock:
+            # Played out (concealed) while being decoded
+            if self._next_seq is None or self._ahead(seq) >= self._depth:
+                self.late += 1
+                return
+
+            index = seq % self._depth
+            if self._seqs[index] < 0:
+                self._count += 1
+            self._seqs[index] = seq
+            self.received += 1
+
+            if self._transit is not None:
+                self._jitter += (abs(transit - self._transit) - self._jitter) / 16
+            self._transit = transit
+            # Enough frames to cover twice the jitter
+            wanted = 1 + math.ceil(2 * self._jitter / (self._clock_rate * RTP_PTIME))
+            self.delay = min(self._max_delay, max(self._min_delay, wanted))
+
+    def get(self, out: np.ndarray):
+        """Plays out one frame into out."""
+        with self._lock:
+            if not self._started:
+                if self._count < self.delay:
+                    out[:] = 0
+                    return
+                self._started = True
+
+            # Catch up when the buffer grew past the target delay
+            if self._count > self.delay + 1:
+                index = self._next_seq % self._depth
+                if self._seqs[index] == self._next_seq:
+                    self._seqs[index] = -1
+                    self._count -= 1
+                    self.dropped += 1
+                self._next_seq = (self._next_seq + 1) & 0xFFFF
+
+            index = self._next_seq % self._depth
+            if self._seqs[index] == self._next_seq:
+                self._seqs[index] = -1
+                self._count -= 1
+                self._last[:] = self._frames[index]
+                self._losses = 0
+            else:
+                np.right_shift(self._last, 1, out=self._last)
+                self._losses += 1
+                self.concealed += 1
+            out[:] = self._last
+            self._next_seq = (self._next_seq + 1) & 0xFFFF
+
+            # Nothing for a whole buffer, wait for the delay to build up again
+            if self._losses >= self._depth:
+                self._reset()
+
+class RTPStream:
+    """RTP media of one TDM slot.
+
+    Capture periods are encoded into a ring of preallocated packets and sent
+    from the bridge loop, received packets are decoded straight into the
+    jitter buffer, which the mux plays out into the slot. The streams run at
+    the codec clock rate, narrowband codecs get resampled ones.
+    """
+    def __init__(self, bridge: "RTPBridge", demux: Union[TDMDemux, NarrowbandDemux],
+                 mux: Union[TDMMux, NarrowbandMux], slot: int,
+                 codec: RTPCodec, port: int, peer: Optional[str] = None):
+        self._logger = logging.getLogger("RTPStream")
+
+        self._bridge = bridge
+        self._demux = demux
+        self._mux = mux
+        self.slot = slot
+        self.codec = codec
+        self.peer = parse_peer(peer)
+
+        if demux.period_size != mux.period_size or demux.period_size != int(demux.rate * RTP_PTIME):
+            raise ValueError(f"Audio periods must be {RTP_PTIME * 1000:.0f} ms for RTP")
+
+        self._payload_type, clock_rate, companding = _PAYLOADS[codec]
+        self._clock_rate = clock_rate or demux.rate
+        if self._clock_rate != demux.rate or self._clock_rate != mux.rate:
+            raise ValueError(f"{codec.name} needs {self._clock_rate} Hz audio streams")
+        self._codec = G711Codec(companding) if companding else None
+        self._samples = demux.period_size
+
+        # Send ring: header then payload, payload views are reused as they are
+        sample_size = 1 if self._codec else 2
+        self._packet_size = RTP_HEADER.size + self._samples * sample_size
+        self._tx = [bytearray(self._packet_size) for _ in range(_TX_RING)]
+        self._tx_views = [memoryview(packet) for packet in self._tx]
+        payload_type = np.uint8 if self._codec else ">i2"
+        self._tx_payloads = [np.frombuffer(packet, dtype=payload_type, offset=RTP_HEADER.size) for packet in self._tx]
+        self._tx_index = 0
+        self._seq = random.getrandbits(16)
+        self._timestamp = random.getrandbits(32)
+        self._ssrc = random.getrandbits(32)
+        self._marker = RTP_MARKER
+
+        # Receive buffer, larger than any expected packet
+        self._rx = bytearray(2048)
+        self._rx_views = [memoryview(self._rx)]
+        self._rx_payload = np.frombuffer(self._rx, dtype=np.uint8, offset=RTP_HEADER.size)
+        self._rx_l16 = np.frombuffer(self._rx, dtype=">i2", offset=RTP_HEADER.size, count=(len(self._rx) - RTP_HEADER.size) // 2)
+        self._jitter = JitterBuffer(self._samples, self._clock_rate)
+
+        self.sent = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(("0.0.0.0", port))
+
+    def __str__(self):
+        return f"RTPStream(slot={self.slot} codec={self.codec.name} local={self._sock.getsockname()} peer={self.peer})"
+
+    @property
+    def address(self):
+        return self._sock.getsockname()
+
+    def setup(self):
+        self._bridge.register(self._sock.fileno(), self._receive)
+        self._demux.addListener(self._capture)
+        self._mux.addSource(self)
+
+    def close(self):
+        self._demux.removeListener(self._capture)
+        self._mux.removeSource(self)
+        self._bridge.unregister(self._sock.fileno())
+        self._logger.info(f"{self} sent={self.sent} received={self._jitter.received} late={self._jitter.late} "
+                          f"concealed={self._jitter.concealed} dropped={self._jitter.dropped}")
+        self._sock.close()
+
+    def _capture(self, frames: np.ndarray, timestamp):
+        # Capture thread: encode, the loop sends
+        index = self._tx_index
+        self._tx_index = (index + 1) % _TX_RING
+
+        samples = frames[:, self.slot]
+        payload = self._tx_payloads[index]
+        if self._codec:
+            self._codec.encode(samples, out=payload)
+        else:
+            payload[:] = samples
+
+        RTP_HEADER.pack_into(self._tx[index], 0, RTP_VERSION << 6, self._marker | self._payload_type,
+                             self._seq, self._timestamp, self._ssrc)
+        self._marker = 0
+        self._seq = (self._seq + 1) & 0xFFFF
+        self._timestamp = (self._timestamp + self._samples) & 0xFFFFFFFF
+
+        self._bridge.call(self._send, index)
+
+    def _send(self, index):
+        if self.peer is None:
+            return
+        try:
+            self._sock.sendmsg([self._tx_views[index]], [], 0, self.peer)
+            self.sent += 1
+        except (BlockingIOError, OSError) as e:
+            self._logger.warning(f"RTP send failed slot={self.slot}: {e}")
+
+    def _receive(self):
+        # Bridge loop: drain the socket
+        while True:
+            try:
+                length, _, _, address = self._sock.recvmsg_into(self._rx_views)
+            except (BlockingIOError, InterruptedError):
+                return
+            arrival = time.monotonic()
+
+            if length < RTP_HEADER.size:
+                continue
+            flags, payload_type, seq, timestamp, _ = RTP_HEADER.unpack_from(self._rx)
+            if flags >> 6 != RTP_VERSION or payload_type & 0x7F != self._payload_type:
+                continue
+            # CSRC list and extension are not expected from a plain peer
+            if flags & 0x1F:
+                continue
+            if length - RTP_HEADER.size != self._packet_size - RTP_HEADER.size:
+                continue
+
+            if self.peer is None:
+                self.peer = address
+                self._logger.info(f"Learned RTP peer={address} slot={self.slot}")
+
+            frame = self._jitter.frame(seq)
+            if frame is None:
+                continue
+            if self._codec:
+                self._codec.decode(self._rx_payload[:self._samples], out=frame)
+            else:
+                frame[:] = self._rx_l16[:self._samples]
+            self._jitter.commit(seq, timestamp, arrival)
+
+    def render(self, out: np.ndarray, frame: int):
+        # Mux thread
+        self._jitter.get(out[:, self.slot])
+
+class RTPBridge:
+    """Runs the RTP streams of every channel on a single asyncio loop."""
+    def __init__(self):
+        self._logger = logging.getLogger("RTPBridge")
+
+        self._loop = asyncio.new_event_loop()
+        self._streams: List[RTPStream] = []
+        # Resampled views of the device streams, shared by the narrowband codecs
+        self._narrowband: Dict[Union[TDMDemux, TDMMux], Union[NarrowbandDemux, NarrowbandMux]] = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"RTPBridge(streams={len(self._streams)})"
+
+    def setup(self):
+        self._thread.start()
+
+    def close(self):
+        for stream in self._streams:
+            stream.close()
+        self._streams.clear()
+        for stage in self._narrowband.values():
+            stage.close()
+        self._narrowband.clear()
+
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+
+    def addStream(self, demux: TDMDemux, mux: TDMMux, slot: int, codec: RTPCodec, port: int, peer=None) -> RTPStream:
+        clock_rate = _PAYLOADS[codec][1]
+        if clock_rate and clock_rate != demux.rate:
+            if demux.rate % clock_rate:
+                raise ValueError(f"Cannot resample {demux.rate} Hz audio to {clock_rate} Hz")
+            demux = self._getNarrowband(demux, NarrowbandDemux, demux.rate // clock_rate)
+            mux = self._getNarrowband(mux, NarrowbandMux, mux.rate // clock_rate)
+
+        stream = RTPStream(self, demux, mux, slot, codec, port, peer)
+        stream.setup()
+        self._streams.append(stream)
+        self._logger.info(f"Bridging {stream}")
+        return stream
+
+    def _getNarrowband(self, stream, stage_type, factor):
+        stage = self._narrowband.get(stream)
+        if stage is None:
+            stage = stage_type(stream, factor)
+            self._logger.info(f"Resampling with {stage}")
+            stage.setup()
+            self._narrowband[stream] = stage
+        return stage
+
+    def register(self, fd, callback):
+        self._loop.call_soon_threadsafe(self._loop.add_reader, fd, callback)
+
+    def unregister(self, fd):
+        if self._thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._remove_reader(fd), self._loop).result()
+
+    async def _remove_reader(self, fd):
+        self._loop.remove_reader(fd)
+
+    def call(self, callback, *args):
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def _run(self):
+        self._logger.debug("Starting RTP loop")
+        try:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_forever()
+        except Exception as e:
+            self._logger.error("Unexpected error in RTP loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("RTP loop exiting...")
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from audio.pcm import PCMCapture, PCMPlayback
+from audio.g711 import codec_for
+from statuses import AudioPCMFormat
+
+# Companded codes travel in the first (high) byte of each 16 bit slot
+_CODE_BYTE = 1
+
+def slot_view(frames: np.ndarray, slot: int) -> np.ndarray:
+    """Strided view of one TDM slot, no copy."""
+    return frames[:, slot]
+
+def slot_memoryview(period, channels: int, slot: int) -> memoryview:
+    """Same as slot_view for a raw interleaved S16 period."""
+    return memoryview(period).cast('h')[slot::channels]
+
+class TDMDemux:
+    """Reads the interleaved capture stream of a device once for every consumer.
+
+    Listeners are called from the capture thread as fn(frames, timestamp),
+    frames being a read-only (period, channels) int16 view of the period
+    just read: slot_view() gives a single slot without copying. Listeners
+    must not keep the view past the call. Companded streams are decoded to
+    linear PCM first, once for every slot.
+    """
+    def __init__(self, capture: PCMCapture, format: AudioPCMFormat = AudioPCMFormat.FMT_PCM):
+        self._logger = logging.getLogger("TDMDemux")
+
+        self.capture = capture
+        self.channels = capture.channels
+        self.period_size = capture.period_size
+        self.rate = capture.rate
+
+        self._codec = codec_for(format)
+        if self._codec:
+            self._linear = np.zeros((self.period_size, self.channels), dtype=np.int16)
+
+        # Replaced, never modified, so the capture thread reads it without locking
+        self._listeners = ()
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"TDMDemux(capture={self.capture})"
+
+    def addListener(self, listener):
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+
+    def removeListener(self, listener):
+        with self._lock:
+            self._listeners = tuple(entry for entry in self._listeners if entry != listener)
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.capture.close()
+
+    def _run(self):
+        self._logger.debug("Starting TDM capture thread")
+        try:
+            while not self._stop_event.is_set():
+                data = self.capture.read()
+                if not data:
+                    break
+                timestamp = time.time()
+
+                frames = np.frombuffer(data, dtype="<i2").reshape(-1, self.channels)
+                if self._codec:
+                    codes = frames.view(np.uint8).reshape(len(frames), self.channels, 2)[:, :, _CODE_BYTE]
+                    frames = self._codec.decode(codes, out=self._linear[:len(frames)])
+                for listener in self._listeners:
+                    listener(frames, timestamp)
+        except Exception as e:
+            self._logger.error("Unexpected error in TDM capture loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("TDM capture thread exiting...")
+
+class TDMMux:
+    """Builds the interleaved playback stream of a device from its sources.
+
+    Every period the shared (period, channels) int16 buffer is cleared, then
+    each source writes its own slots with source.render(out, frame), frame
+    being the stream position. The buffer is written out as is, so sources
+    write into slot_view(out, slot) rather than allocating periods. Sources
+    always render linear PCM, companded streams are encoded on the way out.
+
+    Started before the chip is set up it also keeps BCLK running, sources
+    join the running stream later without reopening it.
+    """
+    def __init__(self, playback: PCMPlayback, format: AudioPCMFormat = AudioPCMFormat.FMT_PCM):
+        self._logger = logging.getLogger("TDMMux")
+
+        self.playback = playback
+        self.channels = playback.channels
+        self.period_size = playback.period_size
+        self.rate = playback.rate
+
+        # Preallocated output period and its raw view
+        self._out = np.zeros((self.period_size, self.channels), dtype=np.int16)
+        self._out_bytes = memoryview(self._out).cast('B')
+        self._frame = 0
+
+        self._codec = codec_for(format)
+        if self._codec:
+            self._wire = np.zeros((self.period_size, self.channels, 2), dtype=np.uint8)
+            self._out_bytes = memoryview(self._wire).cast('B')
+            # Companded silence is not all zeros
+            self._codec.encode(self._out, out=self._wire[:, :, _CODE_BYTE])
+
+        # Replaced, never modified, so the playback thread reads it without locking
+        self._sources = ()
+        self._lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"TDMMux(playback={self.playback})"
+
+    @property
+    def frame(self):
+        """Position of the next period to be rendered."""
+        return self._frame
+
+    def addSource(self, source):
+        with self._lock:
+            self._sources = self._sources + (source,)
+
+    def removeSource(self, source):
+        with self._lock:
+            self._sources = tuple(entry for entry in self._sources if entry != source)
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.playback.close()
+
+    def _run(self):
+        self._logger.debug("Starting TDM playback thread")
+        try:
+            silent = True
+            while not self._stop_event.is_set():
+                sources = self._sources
+                # Without sources the same silent period is written again,
+                # only keeping the clock running
+                if sources or not silent:
+                    self._out.fill(0)
+                    for source in sources:
+                        source.render(self._out, self._frame)
+                    silent = not sources
+
+                    if self._codec:
+                        self._codec.encode(self._out, out=self._wire[:, :, _CODE_BYTE])
+                self._frame += self.period_size
+                self.playback.write(self._out_bytes)
+        except Exception as e:
+            self._logger.error("Unexpected error in TDM playback loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("TDM playback thread exiting...")
@@ -0,0 +1,195 @@
+import logging
+import math
+import re
+import threading
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from audio.pcm import PCM_RATE
+from audio.tdm import TDMMux
+
+# Full scale sine is +3.14 dBm0 (G.711)
+_FULL_SCALE_DBM0 = 3.14
+# Tables are repeated up to at least this many seconds
+_MIN_TABLE_SECONDS = 0.1
+
+@dataclass(frozen=True)
+class ToneSegment:
+    on: float
+    off: float
+    # Index in ToneSpec.tones
+    tone: int
+
+@dataclass(frozen=True)
+class ToneSpec:
+    """Call progress tone like "425@-5;10(.2/.2/1,.6/1/1)".
+
+    Tones are "freq[+freq]@level" (dBm0) separated by ',', then the total
+    duration in seconds (0 plays forever) and the cadence as
+    "on/off/tone" segments, tone being the 1-based index of the tone.
+    """
+    tones: Tuple[Tuple[Tuple[float, ...], float], ...]
+    duration: float
+    cadence: Tuple[ToneSegment, ...]
+
+    @property
+    def cycle(self):
+        return sum(segment.on + segment.off for segment in self.cadence)
+
+    @property
+    def continuous(self):
+        return all(segment.off == 0 for segment in self.cadence) and len(set(s.tone for s in self.cadence)) == 1
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def parse(spec: str) -> "ToneSpec":
+        match = re.fullmatch(r"\s*([\d.+@,\-\s]+);\s*([\d.]+)\s*\(([\d./,\s]+)\)\s*", spec)
+        if not match:
+            raise ValueError(f"Invalid tone format: {spec}")
+
+        tones = []
+        for tone in match.group(1).split(','):
+            freqs, _, level = tone.partition('@')
+            tones.append((tuple(float(freq) for freq in freqs.split('+')), float(level or 0)))
+
+        cadence = []
+        for segment in match.group(3).split(','):
+            values = segment.split('/')
+            if len(values) != 3:
+                raise ValueError(f"Cadence segments must be on/off/tone: {spec}")
+            on, off, tone = float(values[0]), float(values[1]), int(values[2])
+            if not 1 <= tone <= len(tones):
+                raise ValueError(f"Cadence refers to unknown tone={tone}: {spec}")
+            cadence.append(ToneSegment(on, off, tone - 1))
+
+        parsed = ToneSpec(tuple(tones), float(match.group(2)), tuple(cadence))
+        if parsed.cycle <= 0:
+            raise ValueError("Cycle duration must be positive")
+        return parsed
+
+@lru_cache(maxsize=16)
+def wavetable(spec: str, rate=PCM_RATE) -> np.ndarray:
+    """Loopable linear PCM buffer holding whole cadence cycles of the tone.
+
+    Continuous tones hold a whole number of periods of every frequency so
+    the loop point is seamless.
+    """
+    tone = ToneSpec.parse(spec)
+
+    def synthesize(index, length):
+        freqs, level = tone.tones[index]
+        amplitude = 32767 * 10 ** ((level - _FULL_SCALE_DBM0) / 20)
+        n = np.arange(length)
+        return sum(amplitude * np.sin(2 * np.pi * freq * n / rate) for freq in freqs)
+
+    if tone.continuous:
+        # Smallest length holding whole periods of every frequency
+        freqs, _ = tone.tones[tone.cadence[0].tone]
+        length = rate // math.gcd(rate, *(int(round(freq)) for freq in freqs))
+        table = synthesize(tone.cadence[0].tone, length)
+    else:
+        parts = []
+        for segment in tone.cadence:
+            parts.append(synthesize(segment.tone, int(round(segment.on * rate))))
+            parts.append(np.zeros(int(round(segment.off * rate))))
+        table = np.concatenate(parts)
+
+    # Long enough to wrap at most once per period
+    table = np.tile(table, max(1, math.ceil(_MIN_TABLE_SECONDS * rate / len(table))))
+
+    table = np.clip(np.round(table), -32768, 32767).astype(np.int16)
+    # Shared by every channel, must never be modified
+    table.flags.writeable = False
+    return table
+
+class ToneEngine:
+    """Renders call progress tones into the TDM slots of a playback stream.
+
+    Tones run on the stream clock and cadences start where play() was called,
+    slots playing the same tone from the same cadence phase are written with
+    one copy per period whatever the number of channels. They are rendered
+    as linear PCM, the mux takes care of companding.
+    """
+    def __init__(self, mux: TDMMux):
+        self._logger = logging.getLogger("ToneEngine")
+
+        self._mux = mux
+
+        # slot -> (spec, start frame, end frame or None)
+        self._playing: Dict[int, Tuple[str, int, Optional[int]]] = {}
+        # (spec, frame the table starts at modulo its length) -> (table, slots), rebuilt on play() and stop() only
+        self._groups: Dict[Tuple[str, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"ToneEngine(mux={self._mux})"
+
+    def setup(self):
+        self._mux.addSource(self)
+
+    def close(self):
+        self._mux.removeSource(self)
+
+    def play(self, slot: int, spec: str):
+        # Parse and synthesize now, not in the audio thread
+        tone = ToneSpec.parse(spec)
+        wavetable(spec, self._mux.rate)
+
+        with self._lock:
+            start = self._mux.frame
+            end = None
+            if tone.duration > 0:
+                end = start + int(tone.duration * self._mux.rate)
+            self._playing[slot] = (spec, start, end)
+            self._regroup()
+        self._logger.debug(f"Playing tone={spec} slot={slot}")
+
+    def stop(self, slot: int):
+        with self._lock:
+            if self._playing.pop(slot, None) is not None:
+                self._regroup()
+                self._logger.debug(f"Stopped tone slot={slot}")
+
+    def isPlaying(self, slot: int):
+        with self._lock:
+            return slot in self._playing
+
+    def handleInterrupt(self, slot: int, flags):
+        """Cadences run on the stream clock, OSC1 timer IRQs (FSK caller ID) are not ours."""
+        pass
+
+    def _regroup(self):
+        slots: Dict[Tuple[str, int], list] = {}
+        for slot, (spec, start, _) in self._playing.items():
+            table = wavetable(spec, self._mux.rate)
+            # Without a cadence any phase sounds the same, the slots share one copy
+            phase = 0 if ToneSpec.parse(spec).continuous else start % len(table)
+            slots.setdefault((spec, phase), []).append(slot)
+        self._groups = {
+            (spec, phase): (wavetable(spec, self._mux.rate), np.array(group))
+            for (spec, phase), group in slots.items()
+        }
+
+    def render(self, out: np.ndarray, frame: int):
+        period = len(out)
+
+        with self._lock:
+            expired = [slot for slot, (_, _, end) in self._playing.items()
+                       if end is not None and end <= frame]
+            for slot in expired:
+                del self._playing[slot]
+            if expired:
+                self._regroup()
+            groups = self._groups
+
+        for (_, phase), (table, slots) in groups.items():
+            # Tables are at least one period long, so at most one wrap
+            pos = (frame - phase) % len(table)
+            count = min(period, len(table) - pos)
+            out[:count, slots] = table[pos:pos + count, np.newaxis]
+            if count < period:
+                out[count:, slots] = table[:period - count, np.newaxis]
@@ -4,6 +4,8 @@ import time
 
 from manager import PhoneManager
 from voice_channel import VoiceChannel
+from statuses import CallProgressTones
+from core.drivers import import_report
 
 class PhoneCLI(cmd.Cmd):
     intro = "Welcome to the ProSLIC CLI. Type help or ? to list commands.\n"
@@ -29,8 +31,8 @@ class PhoneCLI(cmd.Cmd):
             print(f"Channel {idx}: {status.name}")
 
     def do_start_ring(self, arg):
-        """Start ring: start_ring <channel> [caller]"""
-        args = arg.split()
+        """Start ring: start_ring <channel> [caller] (number or Name <number>)"""
+        args = arg.split(maxsplit=1)
         if len(args) < 1:
             print("Usage: start_ring <channel> [caller]")
             return
@@ -79,8 +81,8 @@ class PhoneCLI(cmd.Cmd):
             if tone_type not in ("dial", "ringing", "busy"):
                 print("Error: tone_type must be one of (dial, ringing, busy)")
                 return
-            # self._getChannel(channel).setTone(tone_type)
-            print(f"Not implemented yet.")
+            if not self._getChannel(channel).setTone(CallProgressTones[tone_type.upper()]):
+                print(f"Unable to play {tone_type} tone on channel {channel}.")
         except ValueError:
             print("Error: Channel must be an integer.")
 
@@ -91,11 +93,105 @@ class PhoneCLI(cmd.Cmd):
             return
         try:
             channel = int(arg)
-            # self._getChannel(channel).stopTone()
-            print(f"Not implemented yet.")
+            self._getChannel(channel).stopTone()
         except ValueError:
             print("Error: Channel must be an integer.")
 
+    def do_conference(self, arg):
+        """Start conference: conference <channel> <channel> [channel ...]"""
+        args = arg.split()
+        if len(args) < 2:
+            print("Usage: conference <channel> <channel> [channel ...]")
+            return
+        try:
+            conference = self.manager.createConference([int(channel) for channel in args])
+            print(f"Conference {conference} started.")
+        except ValueError as e:
+            print(f"Error: {e}")
+        except (IndexError, RuntimeError) as e:
+            print(f"Unable to start conference: {e}")
+
+    def do_end_conference(self, arg):
+        """End conference: end_conference <conference>"""
+        if not arg:
+            print("Usage: end_conference <conference>")
+            return
+        try:
+            self.manager.destroyConference(int(arg))
+        except ValueError:
+            print("Error: Conference must be an integer.")
+
+    def do_telemetry(self, arg):
+        """Show telemetry: telemetry <channel> [tier] (0 raw, higher tiers are longer averages)"""
+        args = arg.split()
+        if len(args) not in (1, 2):
+            print("Usage: telemetry <channel> [tier]")
+            return
+        try:
+            channel = int(args[0])
+            tier = int(args[1]) if len(args) > 1 else 0
+            telemetry = self.manager.getTelemetry(channel, tier)
+        except ValueError:
+            print("Error: Channel and tier must be integers.")
+            return
+        except IndexError as e:
+            print(f"Error: {e}")
+            return
+
+        if telemetry is None:
+            print(f"No telemetry on channel {channel}.")
+            return
+        names, snapshot = telemetry
+        if not len(snapshot["time"]):
+            print("No samples yet.")
+            return
+
+        span = snapshot["time"][-1] - snapshot["time"][0]
+        print(f"Channel {channel} tier {tier}: {len(snapshot['time'])} entries over {span:.0f}s")
+        for column, name in enumerate(names):
+            print(f"  {name:<12} last={snapshot['mean'][-1, column]:.0f} min={snapshot['min'][:, column].min()} "
+                  f"max={snapshot['max'][:, column].max()} mean={snapshot['mean'][:, column].mean():.1f}")
+
+    def do_faults(self, arg):
+        """Show line faults: faults [channel]"""
+        try:
+            channels = [int(arg)] if arg else range(self.manager.getChannelCount())
+            for channel in channels:
+                faults = self.manager.getFaults(channel)
+                if faults is None:
+                    print(f"Channel {channel}: no faults")
+                    continue
+                print(f"Channel {channel}: {faults}")
+                print(f"  first={time.ctime(faults.first)} last={time.ctime(faults.last)} ({faults.last_flag.name})")
+                if faults.isolated:
+                    print(f"  re-arming in {max(0.0, faults.rearm_at - time.monotonic()):.0f}s")
+        except ValueError:
+            print("Error: Channel must be an integer.")
+        except IndexError as e:
+            print(f"Error: {e}")
+
+    def do_reload(self, arg):
+        """Reload the configuration, busy lines are reconfigured once idle."""
+        if self.manager.reloadConfig():
+            print("Configuration applied")
+        else:
+            print("Configuration applied, some channels are busy and will follow once idle")
+
+    def do_io_stats(self, arg):
+        """Show the wait of the device accesses per priority class (io_actor devices only)."""
+        for device, metrics in self.manager.getIOMetrics().items():
+            if metrics is None:
+                print(f"{device}: no I/O actor")
+                continue
+            print(f"{device}:")
+            for priority, entry in metrics.items():
+                print(f"  {priority.name:<10} {entry}")
+
+    def do_imports(self, arg):
+        """Show the import time of the drivers and IRQ readers loaded."""
+        for entry, seconds in import_report().items():
+            print(f"{entry:<40} {seconds * 1000:8.1f}ms")
+
     def do_exit(self, arg):
         """Exit the CLI."""
         print("Goodbye!")
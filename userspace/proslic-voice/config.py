@@ -1,20 +1,49 @@
 import os
+import json
+import hashlib
 import logging
 import traceback
 
-from dataclasses import dataclass
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields
 from enum import Enum
-
-from uci import Uci, UciException, UciExceptionNotFound # pyuci
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
 
 from statuses import LineTermination, LoopbackMode, AudioPCMFormat
+from utils.resources import ProSLIC_CommonRamAddrs
 
 class IRQMode(Enum):
     NONE = 'none'
     GPIO = 'gpio'
     DEVICE = 'device'
 
-@dataclass
+class DTMFMode(Enum):
+    NONE = 'none'
+    SOFTWARE = 'software'
+    HARDWARE = 'hardware'
+
+class ToneMode(Enum):
+    NONE = 'none'
+    SOFTWARE = 'software'
+    HARDWARE = 'hardware'
+
+class CallerIDMode(Enum):
+    NONE = 'none'
+    SDMF = 'sdmf'
+    MDMF = 'mdmf'
+
+class RTPCodec(Enum):
+    NONE = 'none'
+    PCMU = 'pcmu'
+    PCMA = 'pcma'
+    L16 = 'l16'
+
+class FSKStandard(Enum):
+    BELL202 = 'bell202'
+    V23 = 'v23'
+
+@dataclass(frozen=True)
 class HookConfig:
     min_hook_timeout: float
     min_digit: float
@@ -23,7 +52,7 @@ class HookConfig:
     max_flash: float
     min_inter_digit: float
 
-@dataclass
+@dataclass(frozen=True)
 class DeviceConfig:
     path: str
     irq: IRQMode
@@ -32,8 +61,23 @@ class DeviceConfig:
     # Optional
     irq_gpiochip: str = '/dev/gpiochip0'
     irq_gpio: int = -1
-
-@dataclass
+    # Interleaved channels (TDM slots) of audio_device
+    audio_channels: int = 2
+    # Keep audio_device playing so BCLK runs, the chip needs it to respond
+    audio_clock: bool = True
+    dtmf: DTMFMode = DTMFMode.NONE
+    tone_mode: ToneMode = ToneMode.NONE
+    # RAM sampled on every channel, none disables telemetry
+    telemetry: Tuple[ProSLIC_CommonRamAddrs, ...] = ()
+    telemetry_rate: float = 1.0
+    # Isolate lines on thermal, HVIC, power and VBAT alarms
+    protection: bool = True
+    # Calibration results reused on the next start, empty always calibrates
+    calibration_cache: str = '/etc/proslic/calibration.json'
+    # A single thread accesses the device, by priority, instead of every thread locking it
+    io_actor: bool = False
+
+@dataclass(frozen=True)
 class FXSConfig:
     # name: str
     audio_slot: int
@@ -43,6 +87,37 @@ class FXSConfig:
     tone_dial: str
     hook_config: HookConfig
     loopback: LoopbackMode = LoopbackMode.NONE  # Optional
+    # Default accepts any number, completed on dial_timeout
+    dial_plan: str = "."  # Optional
+    dial_timeout: float = 5.0  # Optional
+    tone_ringing: str = None  # Optional
+    cid: CallerIDMode = CallerIDMode.NONE  # Optional
+    cid_standard: FSKStandard = FSKStandard.BELL202  # Optional
+    # RTP media bridge of audio_slot, rtp_peer is learned from the first packet when unset
+    rtp_codec: RTPCodec = RTPCodec.NONE  # Optional
+    rtp_port: int = 0  # Optional
+    rtp_peer: str = None  # Optional
+
+def config_hash(config) -> str:
+    """Short digest of a DeviceConfig or FXSConfig, tells what changed across restarts."""
+    return hashlib.sha1(repr(config).encode()).hexdigest()[:16]
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Whole configuration package parsed and validated at once, sections in file order."""
+    log_level: Optional[int]
+    global_config: Mapping[str, str]
+    devices: Tuple[DeviceConfig, ...]
+    fxs: Tuple[FXSConfig, ...]
+    # section type -> section names
+    sections: Mapping[str, Tuple[str, ...]]
+    # section name -> index in devices or fxs
+    device_index: Mapping[str, int]
+    fxs_index: Mapping[str, int]
+
+def config_changes(old, new) -> List[str]:
+    """Names of the fields that differ between two configurations of the same type."""
+    return [entry.name for entry in fields(old) if getattr(old, entry.name) != getattr(new, entry.name)]
 
 # Mapping for Enums
 _logger_map = {
@@ -56,6 +131,43 @@ _irq_map = {
     "gpio": IRQMode.GPIO,
     "device": IRQMode.DEVICE,
 }
+_dtmf_map = {
+    "none": DTMFMode.NONE,
+    "software": DTMFMode.SOFTWARE,
+    "hardware": DTMFMode.HARDWARE,
+}
+_tone_map = {
+    "none": ToneMode.NONE,
+    "software": ToneMode.SOFTWARE,
+    "hardware": ToneMode.HARDWARE,
+}
+_cid_map = {
+    "none": CallerIDMode.NONE,
+    "sdmf": CallerIDMode.SDMF,
+    "mdmf": CallerIDMode.MDMF,
+}
+_rtp_map = {
+    "none": RTPCodec.NONE,
+    "pcmu": RTPCodec.PCMU,
+    "pcma": RTPCodec.PCMA,
+    "l16": RTPCodec.L16,
+}
+_fsk_map = {
+    "bell202": FSKStandard.BELL202,
+    "v23": FSKStandard.V23,
+}
+_telemetry_map = {
+    "vtip": ProSLIC_CommonRamAddrs.MADC_VTIPC,
+    "vring": ProSLIC_CommonRamAddrs.MADC_VRINGC,
+    "vbat": ProSLIC_CommonRamAddrs.MADC_VBAT,
+    "vlong": ProSLIC_CommonRamAddrs.MADC_VLONG,
+    "vdc": ProSLIC_CommonRamAddrs.MADC_VDC,
+    "ilong": ProSLIC_CommonRamAddrs.MADC_ILONG,
+    "itip": ProSLIC_CommonRamAddrs.MADC_ITIP,
+    "iring": ProSLIC_CommonRamAddrs.MADC_IRING,
+    "iloop": ProSLIC_CommonRamAddrs.MADC_ILOOP,
+    "vdiff": ProSLIC_CommonRamAddrs.VDIFF_SENSE,
+}
 _codec_map = {
     "pcm": AudioPCMFormat.FMT_PCM,
     "alaw": AudioPCMFormat.FMT_UNKOWN_A,
@@ -73,177 +185,377 @@ _loopback_map = {
     "loopback_b": LoopbackMode.LOOPBACK_B
 }
 
-class Config:
-    def __init__(self, config_file="voip"):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
 
-        self.config_file = config_file
-        self.uc = Uci()        
+def _option(options: Mapping, name: str) -> str:
+    value = options.get(name)
+    if value is None:
+        raise ValueError(f"Missing option: {name}")
+    return value
+
+def parse_device_config(dev_cfg: Mapping) -> DeviceConfig:
+    """DeviceConfig of the options of a device section"""
+    irq = _irq_map.get(dev_cfg.get("irq", 'none').lower())
+    if not irq:
+        raise ValueError(f"Unknown irq: {dev_cfg['irq']}")
+
+    audio_codec = _codec_map.get(_option(dev_cfg, "audio_codec").lower())
+    if not audio_codec:
+        raise ValueError(f"Unknown audio_codec: {dev_cfg['audio_codec']}")
+
+    dtmf = _dtmf_map.get(dev_cfg.get("dtmf", 'none').lower())
+    if not dtmf:
+        raise ValueError(f"Unknown dtmf: {dev_cfg['dtmf']}")
+
+    tone_mode = _tone_map.get(dev_cfg.get("tone_mode", 'none').lower())
+    if not tone_mode:
+        raise ValueError(f"Unknown tone_mode: {dev_cfg['tone_mode']}")
+
+    # UCI list, or a space separated option
+    telemetry_names = dev_cfg.get("telemetry", [])
+    if isinstance(telemetry_names, str):
+        telemetry_names = telemetry_names.split()
+    telemetry = []
+    for name in telemetry_names:
+        ram = _telemetry_map.get(name.lower())
+        if not ram:
+            raise ValueError(f"Unknown telemetry: {name}")
+        telemetry.append(ram)
+
+    return DeviceConfig(
+        path=_option(dev_cfg, "path"),
+        irq=irq,
+        audio_codec=audio_codec,
+        audio_device=_option(dev_cfg, "audio_device"),
+        irq_gpiochip=dev_cfg.get("irq_gpiochip", ''),
+        irq_gpio=int(dev_cfg.get("irq_gpio", -1)),
+        audio_channels=int(dev_cfg.get("audio_channels", 2)),
+        audio_clock=dev_cfg.get("audio_clock", "1") == "1",
+        dtmf=dtmf,
+        tone_mode=tone_mode,
+        telemetry=tuple(telemetry),
+        telemetry_rate=float(dev_cfg.get("telemetry_rate", 1.0)),
+        protection=dev_cfg.get("protection", "1") == "1",
+        calibration_cache=dev_cfg.get("calibration_cache", '/etc/proslic/calibration.json'),
+        io_actor=dev_cfg.get("io_actor", "0") == "1",
+    )
+
+def parse_fxs_config(fxs_cfg: Mapping) -> FXSConfig:
+    """FXSConfig of the options of a fxs section"""
+    impedance = _impedance_map.get(fxs_cfg.get('impedance', '').upper())
+    if not impedance:
+        raise ValueError(f"Unknown impedance: {fxs_cfg.get('impedance')}")
+
+    loopback = _loopback_map.get(
+        fxs_cfg.get("loopback", "none").lower(),
+          LoopbackMode.NONE
+    )
+
+    cid = _cid_map.get(fxs_cfg.get("cid", "none").lower())
+    if not cid:
+        raise ValueError(f"Unknown cid: {fxs_cfg['cid']}")
+
+    cid_standard = _fsk_map.get(fxs_cfg.get("cid_standard", "bell202").lower())
+    if not cid_standard:
+        raise ValueError(f"Unknown cid_standard: {fxs_cfg['cid_standard']}")
+
+    rtp_codec = _rtp_map.get(fxs_cfg.get("rtp_codec", "none").lower())
+    if not rtp_codec:
+        raise ValueError(f"Unknown rtp_codec: {fxs_cfg['rtp_codec']}")
+
+    # Optional hook config
+    hook_config = HookConfig(
+        min_hook_timeout = float(fxs_cfg.get("min_hook_timeout", 0.850)),
+        min_digit        = float(fxs_cfg.get("min_digit", 0.020)),
+        max_digit        = float(fxs_cfg.get("max_digit", 0.080)),
+        min_flash        = float(fxs_cfg.get("min_flash", 0.100)),
+        max_flash        = float(fxs_cfg.get("max_flash", 0.800)),
+        min_inter_digit  = float(fxs_cfg.get("min_inter_digit", 0.090)),
+    )
+
+    return FXSConfig(
+        # name=fxs_cfg["name"],
+        audio_slot=int(fxs_cfg.get("audio_slot", 0)),
+        impedance=impedance,
+        ring_pattern=fxs_cfg.get("ring_pattern"),
+        tone_busy=fxs_cfg.get("tone_busy"),
+        tone_dial=fxs_cfg.get("tone_dial"),
+        hook_config=hook_config,
+        loopback=loopback,
+        dial_plan=fxs_cfg.get("dial_plan", "."),
+        dial_timeout=float(fxs_cfg.get("dial_timeout", 5.0)),
+        tone_ringing=fxs_cfg.get("tone_ringing", "425@-5;60(1/4/1)"),
+        cid=cid,
+        cid_standard=cid_standard,
+        rtp_codec=rtp_codec,
+        rtp_port=int(fxs_cfg.get("rtp_port", 0)),
+        rtp_peer=fxs_cfg.get("rtp_peer"),
+    )
+
+# Written when no configuration exists, (type, name, options)
+_DEFAULT_SECTIONS = [
+    ("global", "globals", {"log_level": "debug"}),
+    ("device", "proslic", {
+        "path": "/dev/proslic",
+        "irq": "device",
+        "audio_codec": "pcm",
+        "audio_device": "hw:0,0",
+    }),
+    ("fxs", "Phone1", {
+        "audio_slot": "0",
+        "impedance": "TBR21",
+        "ring_pattern": "60(2/4)",
+        "tone_busy": "425@-5;20(.5/.5/1)",
+        "tone_dial": "425@-5;10(.2/.2/1,.6/1/1)",
+    }),
+]
+
+class ConfigBackend(ABC):
+    """Source of the configuration sections as UCI would return them.
+
+    sections() lists (type, name, options) in file order, options are
+    strings or lists of strings, FileNotFoundError when there is none.
+    """
+    path: str
 
-    def begin(self):
-        """Initialize config and returns set of device paths"""
-        try:
-            self.logger.info("Loading configuration")
-            self.uc.get(self.config_file)
+    @abstractmethod
+    def sections(self) -> List[Tuple[str, str, Dict]]:
+        pass
 
-            level = self.getLogLevel()
-            logging.basicConfig(level=level)
+    @abstractmethod
+    def setOption(self, section: str, name: str, value: str):
+        pass
 
-            device_paths = set()
-            device_sections = self._findSections("device")
+    @abstractmethod
+    def createDefault(self):
+        pass
 
-            for section in device_sections:
-                device_paths.add(self.uc.get(self.config_file, section, "path"))
+class UciBackend(ConfigBackend):
+    def __init__(self, config_file="voip"):
+        self.logger = logging.getLogger("UciBackend")
 
-            return device_paths
-        except UciExceptionNotFound as e:
-            self.logger.warning(f"Config '{self.config_file}' not found. Creating defaults...")
-            self._create_default_config()            
-            return False
+        # Only needed on OpenWrt, the C extension is not imported elsewhere
+        import uci # pyuci
+        self._uci = uci
+        self.config_file = config_file
+        self.uc = uci.Uci()
+        self.path = os.path.join(self.uc.confdir(), config_file)
 
-    def getLogLevel(self):
-        """Return log level"""
+    def sections(self) -> List[Tuple[str, str, Dict]]:
+        # A new context, the previous one caches the package as first read
+        self.uc = self._uci.Uci()
         try:
-            glb = self._findSection("global")
-            level_str = self.uc.get(self.config_file, glb, "log_level").lower()
-            level = _logger_map.get(level_str)
-            if not level:
-                raise ValueError(f"Unknown log_level: {level_str}")
-        except UciExceptionNotFound as e:
-            self.logger.error(e)
-            # Write missing configuration
-            self.uc.set(self.config_file, glb, "log_level", 'info')
-            self.uc.commit()
-            level = logging.INFO
-            pass
+            package = self.uc.get_all(self.config_file)
+        except self._uci.UciExceptionNotFound as e:
+            raise FileNotFoundError(f"UCI config '{self.config_file}' not found") from e
 
-        return level
+        # Type comes with the options when the binding provides it
+        return [(options.get(".type") or self.uc.get(self.config_file, name), name, options)
+                for name, options in package.items()]
 
-    def getGlobalConfig(self):
-        """Return global device config dict"""
-        name = self.findSection("global")
-
-        if name:
-            return self.uc.get_all(self.config_file, "cfg013fd6")
-        return None
-    
-    def getDeviceConfig(self, index):
-        """Return dict of DEVICE configuration"""
-        device_sections = self._findSections('device')
-        if index >= len(device_sections):
-            raise IndexError(f"No DEVICE configuration for index {index}")
-    
-        dev_cfg = self.uc.get_all(self.config_file, device_sections[index])
+    def setOption(self, section: str, name: str, value: str):
+        self.uc.set(self.config_file, section, name, value)
+        self.uc.commit(self.config_file)
 
-        irq = _irq_map.get(dev_cfg.get("irq", 'none').lower())
+    def createDefault(self):
+        self.logger.debug("createDefault()")
+        try:
+            # Crete empty file
+            with open(self.path, 'w') as fp:
+                pass
 
-        audio_codec = _codec_map.get(dev_cfg.get("audio_codec").lower())
-        if not audio_codec:
-            raise ValueError(f"Unknown audio_codec: {dev_cfg['audio_codec']}")
+            for section_type, section, options in _DEFAULT_SECTIONS:
+                self.uc.set(self.config_file, section, section_type)
+                for name, value in options.items():
+                    self.uc.set(self.config_file, section, name, value)
 
-        return DeviceConfig(
-            path=dev_cfg["path"],
-            irq=irq,
-            audio_codec=audio_codec,
-            audio_device=dev_cfg["audio_device"],
-            irq_gpiochip=dev_cfg.get("irq_gpiochip", ''),
-            irq_gpio=int(dev_cfg.get("irq_gpio", -1)),
-        )
+            self.uc.commit(self.config_file)
 
-    def getFXSConfig(self, index):
-        """Return dict of FXS channel configuration"""
-        fxs_sections = self._findSections('fxs')
-        if index >= len(fxs_sections):
-            raise IndexError(f"No FXS configuration for index {index}")
-        
-        fxs_cfg = self.uc.get_all(self.config_file, fxs_sections[index])        
-    
-        impedance = _impedance_map.get(fxs_cfg.get('impedance', '').upper())
-        if not impedance:
-            raise ValueError(f"Unknown impedance: {fxs_cfg.get('impedance')}")
+        except self._uci.UciException as e:
+            self.uc.revert(self.config_file)
+            self.logger.critical(e)
+            traceback.print_exc()
 
-        loopback = _loopback_map.get(
-            fxs_cfg.get("loopback", "none").lower(),
-              LoopbackMode.NONE
-        )
+class FileBackend(ConfigBackend):
+    """JSON or TOML file, one table per section type.
+
+    A type holds a single section or a list of them, named by their "name"
+    key or after their type and position:
+
+        {"global": {"log_level": "info"},
+         "device": [{"path": "/dev/proslic", "audio_codec": "pcm", ...}],
+         "fxs": [{"name": "Phone1", "impedance": "TBR21", ...}]}
+
+    Values may be native numbers and booleans, they are read as UCI strings.
+    TOML needs Python 3.11 and is read only.
+    """
+    def __init__(self, path: str):
+        self.logger = logging.getLogger("FileBackend")
+        self.path = path
+        self._toml = path.endswith(".toml")
+
+    def _read(self) -> Dict:
+        if self._toml:
+            import tomllib
+            with open(self.path, "rb") as fp:
+                return tomllib.load(fp)
+        with open(self.path) as fp:
+            return json.load(fp)
+
+    def _write(self, data: Dict):
+        if self._toml:
+            raise ValueError(f"Cannot write TOML config {self.path}")
+        # Replaced at once, readers never see half a file
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as fp:
+            json.dump(data, fp, indent=4)
+        os.replace(temp, self.path)
+
+    @staticmethod
+    def _string(value):
+        if isinstance(value, bool):
+            return "1" if value else "0"
+        if isinstance(value, list):
+            return [FileBackend._string(entry) for entry in value]
+        return str(value)
+
+    def sections(self) -> List[Tuple[str, str, Dict]]:
+        sections = []
+        for section_type, entries in self._read().items():
+            if isinstance(entries, dict):
+                entries = [entries]
+            for index, entry in enumerate(entries):
+                options = {name: self._string(value) for name, value in entry.items() if name != "name"}
+                sections.append((section_type, str(entry.get("name", f"{section_type}{index}")), options))
+        return sections
+
+    def setOption(self, section: str, name: str, value: str):
+        data = self._read()
+        for section_type, entries in data.items():
+            for index, entry in enumerate([entries] if isinstance(entries, dict) else entries):
+                if str(entry.get("name", f"{section_type}{index}")) == section:
+                    entry[name] = value
+                    self._write(data)
+                    return
+        raise KeyError(f"No section {section} in {self.path}")
+
+    def createDefault(self):
+        data = {}
+        for section_type, section, options in _DEFAULT_SECTIONS:
+            data.setdefault(section_type, []).append({"name": section, **options})
+        try:
+            self._write(data)
+        except (OSError, ValueError) as e:
+            self.logger.critical(e)
 
-        # Optional hook config
-        hook_config = HookConfig(
-            min_hook_timeout = float(fxs_cfg.get("min_hook_timeout", 0.850)),
-            min_digit        = float(fxs_cfg.get("min_digit", 0.020)),
-            max_digit        = float(fxs_cfg.get("max_digit", 0.080)),
-            min_flash        = float(fxs_cfg.get("min_flash", 0.100)),
-            max_flash        = float(fxs_cfg.get("max_flash", 0.800)),
-            min_inter_digit  = float(fxs_cfg.get("min_inter_digit", 0.090)),
-        )
+def config_backend(config_file="voip") -> ConfigBackend:
+    """File named by PROSLIC_CONFIG when set, UCI otherwise."""
+    path = os.environ.get("PROSLIC_CONFIG")
+    if path:
+        return FileBackend(path)
+    return UciBackend(config_file)
 
-        return FXSConfig(
-            # name=fxs_cfg["name"],
-            audio_slot=int(fxs_cfg.get("audio_slot", 0)),
-            impedance=impedance,
-            ring_pattern=fxs_cfg.get("ring_pattern"),
-            tone_busy=fxs_cfg.get("tone_busy"),
-            tone_dial=fxs_cfg.get("tone_dial"),
-            hook_config=hook_config,
-            loopback=loopback,
-        )
+class Config:
+    def __init__(self, config_file="voip", backend: Optional[ConfigBackend] = None):
+        self.logger = logging.getLogger(__name__)
+        # self.logger.setLevel(logging.DEBUG)
 
-    def _create_default_config(self):
-        """Creates a default UCI configuration"""
+        self.backend = backend or config_backend(config_file)
+        # Replaced as a whole by reloads, never modified
+        self._snapshot: Optional[ConfigSnapshot] = None
 
-        self.logger.debug("_create_default_config()")
+    def begin(self):
+        """Initialize config and returns the device paths, in order"""
         try:
-            path = self.uc.confdir()
+            self.logger.info(f"Loading configuration from {self.backend.path}")
+            self._snapshot = self._load()
+        except FileNotFoundError as e:
+            self.logger.warning(f"Config '{self.backend.path}' not found. Creating defaults...")
+            self.backend.createDefault()
+            return False
 
-            # Crete empty file
-            with open(os.path.join(path, self.config_file), 'w') as fp:
-                pass
+        if self._snapshot.log_level is None:
+            self.logger.error(f"Missing log_level in config '{self.backend.path}'")
+            # Write missing configuration
+            glb = self._snapshot.sections.get("global")
+            if glb:
+                try:
+                    self.backend.setOption(glb[0], "log_level", 'info')
+                except (OSError, ValueError) as e:
+                    self.logger.warning(e)
+        logging.basicConfig(level=self.getLogLevel())
 
-            # Create the nodes
-            glb = self.uc.add(self.config_file, "global")
-            dev = self.uc.add(self.config_file, "device")
-            fxs = self.uc.add(self.config_file, "fxs")
-
-            # Write global configuration
-            self.uc.set(self.config_file, glb, "log_level", "debug")
-
-            # Add one device configuration
-            self.uc.set(self.config_file, dev, "proslic")
-            self.uc.set(self.config_file, dev, "path", "/dev/proslic")
-            self.uc.set(self.config_file, dev, "irq", "device")
-            self.uc.set(self.config_file, dev, "audio_codec", "pcm")
-            self.uc.set(self.config_file, dev, "audio_device", "hw:0,0")
-
-            # Add one default FXS channel
-            self.uc.set(self.config_file, fxs, "Phone1")
-            self.uc.set(self.config_file, fxs, "audio_slot", "0")
-            self.uc.set(self.config_file, fxs, "impedance", "TBR21")
-            self.uc.set(self.config_file, fxs, "ring_pattern", "60(2/4)")
-            self.uc.set(self.config_file, fxs, "tone_busy", "425@-5;20(.5/.5/1)")
-            self.uc.set(self.config_file, fxs, "tone_dial", "425@-5;10(.2/.2/1,.6/1/1)")
+        return [device.path for device in self._snapshot.devices]
 
-            self.uc.commit(self.config_file)
+    def reload(self):
+        """Parses the configuration file again, the current configuration stays on errors."""
+        self._snapshot = self._load()
 
-        except UciException as e:
-            self.uc.revert(self.config_file)
-            self.logger.critical(e)
-            traceback.print_exc()
-    
-    def _findSection(self, type):
-        configs = self.uc.get_all(self.config_file)
+    def getPath(self):
+        return self.backend.path
 
-        for section_key, section_data in configs.items():
-            if self.uc.get(self.config_file, section_key) == type:
-                return section_key
+    def getSnapshot(self) -> ConfigSnapshot:
+        return self._snapshot
 
+    def getLogLevel(self):
+        """Return log level"""
+        if self._snapshot.log_level is None:
+            return logging.INFO
+        return self._snapshot.log_level
+
+    def getGlobalConfig(self):
+        """Return global device config dict"""
+        if "global" in self._snapshot.sections:
+            return self._snapshot.global_config
         return None
     
-    def _findSections(self, type):
-        configs = self.uc.get_all(self.config_file)
-        keys = []
-        for section_key, section_data in configs.items():
-            if self.uc.get(self.config_file, section_key) == type:
-                keys.append(section_key)
-
-        return keys
+    def getDeviceConfig(self, index):
+        """Return DEVICE configuration"""
+        if index >= len(self._snapshot.devices):
+            raise IndexError(f"No DEVICE configuration for index {index}")
+        return self._snapshot.devices[index]
+
+    def getFXSConfig(self, index):
+        """Return FXS channel configuration"""
+        if index >= len(self._snapshot.fxs):
+            raise IndexError(f"No FXS configuration for index {index}")
+        return self._snapshot.fxs[index]
+
+    def _load(self) -> ConfigSnapshot:
+        """Reads the whole package once, every section is validated."""
+        package = {}
+        sections: Dict[str, List[str]] = {}
+        for section_type, name, options in self.backend.sections():
+            package[name] = options
+            sections.setdefault(section_type, []).append(name)
+
+        global_config = dict(package[sections["global"][0]]) if "global" in sections else {}
+        log_level = None
+        if "log_level" in global_config:
+            log_level = _logger_map.get(global_config["log_level"].lower())
+            if not log_level:
+                raise ValueError(f"Unknown log_level: {global_config['log_level']}")
+
+        devices = []
+        for name in sections.get("device", []):
+            try:
+                devices.append(parse_device_config(package[name]))
+            except ValueError as e:
+                raise ValueError(f"Invalid device section '{name}': {e}") from e
+        fxs = []
+        for name in sections.get("fxs", []):
+            try:
+                fxs.append(parse_fxs_config(package[name]))
+            except ValueError as e:
+                raise ValueError(f"Invalid fxs section '{name}': {e}") from e
+
+        snapshot = ConfigSnapshot(
+            log_level=log_level,
+            global_config=MappingProxyType(global_config),
+            devices=tuple(devices),
+            fxs=tuple(fxs),
+            sections=MappingProxyType({key: tuple(names) for key, names in sections.items()}),
+            device_index=MappingProxyType({name: index for index, name in enumerate(sections.get("device", []))}),
+            fxs_index=MappingProxyType({name: index for index, name in enumerate(sections.get("fxs", []))}),
+        )
+        self.logger.debug(f"Loaded {len(snapshot.devices)} devices and {len(snapshot.fxs)} fxs")
+        return snapshot
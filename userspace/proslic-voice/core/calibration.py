@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+import os
+
+from typing import Dict, Optional, Sequence
+
+# Bump when the init sequence changes what the calibration depends on
+CALIBRATION_VERSION = 1
+
+# channel -> RAM address -> value
+CalibrationSnapshot = Dict[int, Dict[int, int]]
+
+def calibration_key(chip_id: int, blob, rams: Sequence[int]) -> str:
+    """Entry of a chip id, blob and set of calibration RAM."""
+    presets = hashlib.sha1()
+    presets.update(repr((CALIBRATION_VERSION, list(blob.data), sorted(blob.configuration.items()), list(rams))).encode())
+    return f"{chip_id:02x}-{blob.id:x}-{presets.hexdigest()[:16]}"
+
+class CalibrationCache:
+    """Calibration results kept on disk to skip calibrating on warm starts.
+
+    A single JSON file holds one entry per key, entries of other chips or
+    blobs are left as they are. A missing, stale or unreadable file only
+    means calibrating again.
+    """
+    def __init__(self, path: str):
+        self._logger = logging.getLogger("CalibrationCache")
+        self.path = path
+
+    def __str__(self):
+        return f"CalibrationCache(path={self.path})"
+
+    def load(self, key: str) -> Optional[CalibrationSnapshot]:
+        entry = self._read().get(key)
+        if entry is None:
+            return None
+        return {int(channel): {int(addr): value for addr, value in rams.items()}
+                for channel, rams in entry.items()}
+
+    def store(self, key: str, snapshot: CalibrationSnapshot):
+        entries = self._read()
+        entries[key] = {str(channel): {str(addr): value for addr, value in rams.items()}
+                        for channel, rams in snapshot.items()}
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Replaced at once, a power cut never leaves half a file
+            temp = f"{self.path}.tmp"
+            with open(temp, "w") as fp:
+                json.dump({"version": CALIBRATION_VERSION, "entries": entries}, fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(temp, self.path)
+            self._logger.info(f"Stored calibration key={key}")
+        except OSError as e:
+            self._logger.warning(f"Cannot store calibration in {self.path}: {e}")
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self._logger.warning(f"Ignoring unreadable calibration cache {self.path}: {e}")
+            return {}
+
+        if data.get("version") != CALIBRATION_VERSION:
+            self._logger.info(f"Ignoring calibration cache version={data.get('version')}")
+            return {}
+        return data.get("entries", {})
@@ -0,0 +1,102 @@
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import traceback
+
+from typing import Callable
+
+# <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_EVENT = struct.Struct("iIII")
+
+# Events closer than this are one change, UCI writes and renames in a row
+CONFIG_SETTLE = 0.2
+# Changes left for busy lines are tried again this often
+CONFIG_RETRY = 1.0
+
+class ConfigWatcher:
+    """Calls reload() whenever a configuration file is written or replaced.
+
+    UCI commits by renaming a new file over the old one, so the directory is
+    watched with inotify rather than the file. While reload() or retry()
+    return False, retry() is called again every CONFIG_RETRY seconds.
+    """
+    def __init__(self, path: str, reload: Callable[[], bool], retry: Callable[[], bool]):
+        self._logger = logging.getLogger("ConfigWatcher")
+
+        self.path = path
+        self._name = os.fsencode(os.path.basename(path))
+        self._reload = reload
+        self._retry = retry
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"inotify_init1: {os.strerror(code)}")
+        if libc.inotify_add_watch(self._fd, os.fsencode(os.path.dirname(path) or "."),
+                                  _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE) < 0:
+            code = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(code, f"inotify_add_watch {path}: {os.strerror(code)}")
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"ConfigWatcher(path={self.path})"
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        os.close(self._fd)
+
+    def _changed(self, timeout) -> bool:
+        """True when the file changed within timeout, later events of the same change included."""
+        changed = False
+        while select.select([self._fd], [], [], timeout)[0]:
+            try:
+                data = os.read(self._fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _IN_EVENT.unpack_from(data, offset)
+                offset += _IN_EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                changed |= name == self._name
+            if not changed:
+                return False
+            timeout = CONFIG_SETTLE
+        return changed
+
+    def _run(self):
+        self._logger.debug(f"Watching {self.path}")
+        try:
+            applied = True
+            while not self._stop_event.is_set():
+                # The stop event is checked on the retry period
+                if self._changed(CONFIG_RETRY):
+                    self._logger.info(f"{self.path} changed, reloading")
+                    applied = self._reload()
+                elif not applied:
+                    applied = self._retry()
+        except Exception as e:
+            self._logger.error("Unexpected error in config watcher")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("Config watcher exiting...")
@@ -1,37 +1,40 @@
 import time
 import logging
-import fcntl
-import struct
 import threading
 import queue
 
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from typing import Tuple, List, Any
-
-from utils.resources import CHANNEL_COUNT, PROSLIC_RETRIES, ProSLIC_CommonREGs, ProSLIC_CommonRamAddrs, ProSLIC_IRQ1, ProSLIC_IRQ2, ProSLIC_IRQ3
+from concurrent.futures import Future
+from typing import Dict, Tuple, List, Any, Optional
+
+from utils.resources import CHANNEL_COUNT, PROSLIC_RETRIES, DTMF_DIGIT_MAP, ProSLIC_CommonREGs, ProSLIC_CommonRamAddrs, ProSLIC_IRQ1, ProSLIC_IRQ2, ProSLIC_IRQ3
+from utils.resources import REG_IRQ0, REG_IRQ1, REG_IRQ2, REG_IRQ3, REG_LINEFEED, REG_LCRRTP, REG_AUTO, REG_TONDTMF, REG_FSKDAT, REG_RAM_ADDR_HI, RAM_BLOB_DATA_ADDR, RAM_BLOB_DATA_DATA
+from core.calibration import CalibrationSnapshot
+from core.transport import IoctlTransport
+from core.io_actor import IO_CHUNK, DeviceIOActor, IOClassMetrics, IOPriority, atomic, current_io_budget, current_io_priority, io_priority
 from exceptions import TimeoutError, InitializationError, BlobInvalidError, BlobUploadError, BlobVerifyError, InvalidCalibrationError
 from statuses import Linefeed, InterrupFlags, LineTermination, LoopbackMode, AudioPCMFormat
 
-# Matches struct proslic_access in driver
-IOCTL_READ_REG = 0x80087001  # _IOR('p', 1, struct proslic_access)
-IOCTL_WRITE_REG = 0x40087002
-IOCTL_READ_RAM  = 0x80087003
-IOCTL_WRITE_RAM = 0x40087004
-#
-IOCTL_RESET_DEVICE = 0x40087007
-
-# struct proslic_access { __u8 channel; __u16 address; __u32 data; }
-STRUCT_FMT = "BHI"
-
 IRQResult = namedtuple("IRQResult", ["IRQ1", "IRQ2", "IRQ3", "IRQ4"])
+# ID and ENHANCE of every channel found, reset tells if the chip was reset first
+ProbeResult = namedtuple("ProbeResult", ["chip_id", "channel_ids", "enhance", "reset"])
 
 class SiDevice(ABC):
 
     LOW_TO_HIGH_IRQ_MAP = {
-        ProSLIC_IRQ1.IRQ_FSKBUF_AVAIL: None,  # if not used
+        ProSLIC_IRQ1.IRQ_OSC1_T1: InterrupFlags.TONE_ON_END,
+        ProSLIC_IRQ1.IRQ_OSC1_T2: InterrupFlags.TONE_OFF_END,
+        ProSLIC_IRQ1.IRQ_FSKBUF_AVAIL: InterrupFlags.FSK_BUFFER,
+        ProSLIC_IRQ1.IRQ_VBAT: InterrupFlags.VBAT,
         ProSLIC_IRQ2.IRQ_LOOP_STATUS: InterrupFlags.LOOP,
         ProSLIC_IRQ2.IRQ_DTMF: InterrupFlags.DTMF,
+        ProSLIC_IRQ3.IRQ_P_HVIC: InterrupFlags.HVIC,
+        ProSLIC_IRQ3.IRQ_P_THERM: InterrupFlags.THERMAL,
+        ProSLIC_IRQ3.IRQ_PQ3: InterrupFlags.POWER,
+        ProSLIC_IRQ3.IRQ_PQ4: InterrupFlags.POWER,
+        ProSLIC_IRQ3.IRQ_PQ5: InterrupFlags.POWER,
+        ProSLIC_IRQ3.IRQ_PQ6: InterrupFlags.POWER,
         # Add more here as needed
     }
     
@@ -42,22 +45,33 @@ class SiDevice(ABC):
         self.name = name
         self._interupt_queue = interupt_queue
         self.dev = device
+        self._transport = IoctlTransport(device)
 
         self.numChannels = 0
+        # Set by setup() when given a probe
+        self.probeResult: Optional[ProbeResult] = None
 
-        self._lock = threading.Lock()
+        # Reentrant, atomic methods hold it across their accesses
+        self._lock = threading.RLock()
+        # Owns the device instead of the lock once enabled
+        self._actor: Optional[DeviceIOActor] = None
 
     def __str__(self):
         return f"SiDevice(name={self.name} id={self._device_id})"
 
     # FIXME: 2025 Ghidra: part specific function, global wrapper method exist
-    def setup(self):
+    def setup(self, probe: Optional[ProbeResult] = None):
         try:
-            # HW Reset
-            self.reset()
-
-            # Probe channel count
-            self.numChannels = self.getChannelCount()
+            if probe is not None and probe.reset:
+                # Chip reset and channels counted by probe()
+                self.probeResult = probe
+                self.numChannels = len(probe.channel_ids)
+            else:
+                # HW Reset
+                self.reset()
+
+                # Probe channel count
+                self.numChannels = self.getChannelCount()
             self.logger.info(f"Found {self.numChannels} channels")
 
             return True
@@ -66,36 +80,105 @@ class SiDevice(ABC):
             self.logger.error(e)
             raise InitializationError(self)
 
-    def reset(self):
+    def enableIOActor(self):
+        """Every access goes through a single I/O thread, by priority of the calling thread."""
+        if self._actor is None:
+            self._actor = DeviceIOActor(f"{self.name}-{self._device_id}")
+            self._actor.setup()
+            self.logger.info(f"Accessing the device through {self._actor}")
+
+    def getIOMetrics(self) -> Optional[Dict[IOPriority, IOClassMetrics]]:
+        return self._actor.getMetrics() if self._actor is not None else None
+
+    def submit(self, fn, *args, priority = None, budget = None, **kwargs) -> Future:
+        """Future of fn run alone on the device, at the priority and budget of the calling thread by default."""
+        if self._actor is not None:
+            if priority is None:
+                priority, budget = current_io_priority(), current_io_budget() if budget is None else budget
+            return self._actor.submit(priority, fn, *args, budget=budget, **kwargs)
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(self._run(fn, *args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        actor = self._actor
+        if actor is not None:
+            return actor.call(fn, *args, **kwargs)
         with self._lock:
-            buf = struct.pack(STRUCT_FMT, 0, 0, 0)
-            fcntl.ioctl(self.dev, IOCTL_RESET_DEVICE, buf)
-            self.logger.info("Reset")
+            return fn(*args, **kwargs)
 
+    @atomic
+    def reset(self):
+        self._transport.reset()
+        self.logger.info("Reset")
+
+    @atomic
     def readRegister(self, channel, reg):
-        with self._lock:
-            buf = struct.pack(STRUCT_FMT, channel, reg, 0)
-            result = fcntl.ioctl(self.dev, IOCTL_READ_REG, buf)
-            _, _, data = struct.unpack(STRUCT_FMT, result)
-            return data & 0xFF
+        return self._transport.readRegister(channel, reg)
 
+    @atomic
     def writeRegister(self, channel, reg, value):
-        with self._lock:
-            buf = struct.pack(STRUCT_FMT, channel, reg, value & 0xFF)
-            fcntl.ioctl(self.dev, IOCTL_WRITE_REG, buf)
+        self._transport.writeRegister(channel, reg, value)
 
+    @atomic
     def readRam(self, channel, addr):
-        with self._lock:
-            buf = struct.pack(STRUCT_FMT, channel, addr, 0)
-            result = fcntl.ioctl(self.dev, IOCTL_READ_RAM, buf)
-            _, _, data = struct.unpack(STRUCT_FMT, result)
-            return data
+        return self._transport.readRam(channel, addr)
 
+    @atomic
     def writeRam(self, channel, addr, value):
-        with self._lock:
-            buf = struct.pack(STRUCT_FMT, channel, addr, value)
-            fcntl.ioctl(self.dev, IOCTL_WRITE_RAM, buf)
+        self._transport.writeRam(channel, addr, value)
+
+    @atomic
+    def updateRegister(self, channel, reg, set_mask = 0, clear_mask = 0):
+        """Sets then clears bits of a register as one job, returns the value written."""
+        value = (self.readRegister(channel, reg) | set_mask) & ~clear_mask & 0xFF
+        self.writeRegister(channel, reg, value)
+        return value
+
+    def runChunked(self, fn, items, chunk = IO_CHUNK):
+        """Yields fn(part) of consecutive parts of items, each part is one job so urgent work runs in between."""
+        items = list(items)
+        for start in range(0, len(items), chunk):
+            yield self._run(fn, items[start:start + chunk])
+
+    def readRams(self, channel, addrs) -> List[int]:
+        """Reads back to back, IO_CHUNK at a time, the driver has no batch ioctl."""
+        def read(part):
+            return [self.readRam(channel, addr) for addr in part]
+        return [value for part in self.runChunked(read, addrs) for value in part]
     
+    def writeRams(self, channel, values):
+        """Writes (addr, value) pairs back to back, IO_CHUNK at a time."""
+        def write(part):
+            for addr, value in part:
+                self.writeRam(channel, addr, value)
+        for _ in self.runChunked(write, values):
+            pass
+
+    def probe(self, reset = True) -> ProbeResult:
+        """Reset, then read ID and ENHANCE of every channel once, for the driver's setup()."""
+        if reset:
+            self.reset()
+
+        ids = []
+        enhance = []
+        for idx in range(CHANNEL_COUNT):
+            id = self.readRegister(idx, ProSLIC_CommonREGs.ID.value)
+            if (id == 0xFF):
+                break
+            ids.append(id)
+            enhance.append(self.readRegister(idx, ProSLIC_CommonREGs.ENHANCE.value))
+            self.logger.debug(f"Found device with ID: {hex(id)} on chan: {idx}")
+
+        if not ids:
+            raise InitializationError(self)
+        return ProbeResult(ids[0], tuple(ids), tuple(enhance), reset)
+
     def getChipInfo(self, channel = 0):
         return self.readRegister(channel, ProSLIC_CommonREGs.ID.value)
     
@@ -244,17 +327,22 @@ class SiDevice(ABC):
         if len(blob.data) == 0:
             raise BlobInvalidError(self, blob)
 
+        def write(part):
+            for data in part:
+                self.writeRam(
+                    channel, RAM_BLOB_DATA_DATA, data)
+
         # We suppose this is a auto increment register
         # if we read it after each write it get auto-incremented.
         self.writeRam(
-            channel, ProSLIC_CommonRamAddrs.BLOB_DATA_ADDR.value, 0x00)
+            channel, RAM_BLOB_DATA_ADDR, 0x00)
 
-        for data in blob.data:
-            self.writeRam(
-                channel, ProSLIC_CommonRamAddrs.BLOB_DATA_DATA.value, data)
+        with io_priority(IOPriority.BULK):
+            for _ in self.runChunked(write, blob.data):
+                pass
 
         # Signaling write completed
-        self.writeRegister(channel, ProSLIC_CommonREGs.RAM_ADDR_HI.value, 0x00)
+        self.writeRegister(channel, REG_RAM_ADDR_HI, 0x00)
 
         self.logger.info(f"Blob data loaded! chan={channel}")
         return True
@@ -279,19 +367,27 @@ class SiDevice(ABC):
         # Disable blob (before reading)?
         self.writeRegister(channel, ProSLIC_CommonREGs.JMPEN.value, 0x00)
 
+        def read(part):
+            return [self.readRam(channel, RAM_BLOB_DATA_DATA) for _ in part]
+
         self.writeRam(
-            channel, ProSLIC_CommonRamAddrs.BLOB_DATA_ADDR.value, 0x00)
-
-        for idx, data in enumerate(blob.data):
-            readData = self.readRam(
-                channel, ProSLIC_CommonRamAddrs.BLOB_DATA_DATA.value)
-            if readData != data:
-                self.logger.debug(f"Blob data mismatch: expected = {hex(data)}, received = {hex(readData)} offset = {idx}")
-                correct = False
-                break
+            channel, RAM_BLOB_DATA_ADDR, 0x00)
+
+        idx = 0
+        with io_priority(IOPriority.BULK):
+            for part in self.runChunked(read, blob.data):
+                for readData in part:
+                    data = blob.data[idx]
+                    if readData != data:
+                        self.logger.debug(f"Blob data mismatch: expected = {hex(data)}, received = {hex(readData)} offset = {idx}")
+                        correct = False
+                        break
+                    idx += 1
+                if not correct:
+                    break
 
         # Signaling read completed
-        self.writeRegister(channel, ProSLIC_CommonREGs.RAM_ADDR_HI.value, 0x00)
+        self.writeRegister(channel, REG_RAM_ADDR_HI, 0x00)
 
         # Do we have to do something if the blob is wrong?
         if not correct:
@@ -300,6 +396,7 @@ class SiDevice(ABC):
         self.logger.info(f"Blob data verified! chan={channel}")
         return True
 
+    @io_priority(IOPriority.BULK)
     def calibrate(self, data):
         # Validate data array to have correct length
         if len(data) > 4:
@@ -335,6 +432,33 @@ class SiDevice(ABC):
         else:
             return True     
 
+    # Part specific RAM holding calibration results, none disables the cache
+    def getCalibrationRams(self) -> List[int]:
+        return []
+
+    @io_priority(IOPriority.BULK)
+    def saveCalibration(self) -> CalibrationSnapshot:
+        rams = self.getCalibrationRams()
+        return {channel: dict(zip(rams, self.readRams(channel, rams))) for channel in range(self.numChannels)}
+
+    @io_priority(IOPriority.BULK)
+    def restoreCalibration(self, snapshot: CalibrationSnapshot):
+        """Writes back saved results, False when they do not fit this device."""
+        rams = self.getCalibrationRams()
+        if sorted(snapshot) != list(range(self.numChannels)):
+            return False
+        for channel, values in snapshot.items():
+            if sorted(values) != sorted(rams):
+                return False
+
+        for channel, values in snapshot.items():
+            self.writeRams(channel, values.items())
+            # Cheap check, the RAM must read back as written
+            if self.readRams(channel, list(values)) != list(values.values()):
+                self.logger.warning(f"Calibration read back mismatch chan={channel}")
+                return False
+        return True
+
     # FIXME: this shoudld pass a configuration object or something to apply
     # binary had lot of pointers, data was probably loaded from a struct.
     @abstractmethod
@@ -364,6 +488,7 @@ class SiDevice(ABC):
         pass
             
     # FIXME: use ghidra to decompile method
+    @atomic
     def setPCMTimeslot(self, channel, slot=0):
         # 2025 Ghidra: Chip follow PCM-A timings, data is send/received after
         # 1 clk pulse the chip seems to support only 16-bit of data per channel.
@@ -389,6 +514,7 @@ class SiDevice(ABC):
 
         pass
         
+    @atomic
     def enablePCM(self, channel):
         pcmMode = self.readRegister(channel, ProSLIC_CommonREGs.PCMMODE.value)
 
@@ -396,16 +522,88 @@ class SiDevice(ABC):
         self.writeRegister(
             channel, ProSLIC_CommonREGs.PCMMODE.value, pcmMode | 0x10)
         
+    # Oscillator registers and RAM are laid out the same for OSC1 and OSC2
+    def setupOscillator(self, channel, osc, freq, amp, phase = 0):
+        base = ProSLIC_CommonRamAddrs.OSC1FREQ.value + 3 * osc
+        self.writeRam(channel, base, freq)
+        self.writeRam(channel, base + 1, amp)
+        self.writeRam(channel, base + 2, phase)
+
+    def setOscillatorActiveTimer(self, channel, osc, ticks):
+        reg = ProSLIC_CommonREGs.O1TALO.value + 4 * osc
+        self.writeRegister(channel, reg, ticks & 0xFF)
+        self.writeRegister(channel, reg + 1, ticks >> 8)
+
+    def setOscillatorInactiveTimer(self, channel, osc, ticks):
+        reg = ProSLIC_CommonREGs.O1TILO.value + 4 * osc
+        self.writeRegister(channel, reg, ticks & 0xFF)
+        self.writeRegister(channel, reg + 1, ticks >> 8)
+
+    # OCON: bit 0 enables OSC1, bits 1-2 its active/inactive timers, bits 4-6 same for OSC2
+    @atomic
+    def startOscillators(self, channel, enable):
+        value = self.readRegister(channel, ProSLIC_CommonREGs.OCON.value)
+        self.writeRegister(channel, ProSLIC_CommonREGs.OCON.value, (value & ~0x77) | (enable & 0x77))
+
+    @atomic
+    def stopOscillators(self, channel):
+        value = self.readRegister(channel, ProSLIC_CommonREGs.OCON.value)
+        self.writeRegister(channel, ProSLIC_CommonREGs.OCON.value, value & ~0x77)
+
+    # FSK runs on OSC1: FSKFREQ/FSKAMP 0 and 1 are the space and mark
+    # tones, the OSC1 active timer is the bit time
+    @atomic
+    def setupFSK(self, channel, space, mark, bitTicks, depth):
+        # Flush the FIFO
+        self.writeRegister(channel, ProSLIC_CommonREGs.FSKDEPTH.value, 0x08)
+
+        self.setOscillatorActiveTimer(channel, 0, bitTicks)
+        self.setOscillatorInactiveTimer(channel, 0, 0)
+
+        # Start and stop bits are added by the chip (no 8-bit mode)
+        omode = self.readRegister(channel, ProSLIC_CommonREGs.OMODE.value)
+        self.writeRegister(channel, ProSLIC_CommonREGs.OMODE.value, omode & ~0x80)
+        self.writeRegister(channel, ProSLIC_CommonREGs.FSKDEPTH.value, depth & 0x07)
+
+        self.writeRam(channel, ProSLIC_CommonRamAddrs.FSKFREQ0.value, space[0])
+        self.writeRam(channel, ProSLIC_CommonRamAddrs.FSKAMP0.value, space[1])
+        self.writeRam(channel, ProSLIC_CommonRamAddrs.FSKFREQ1.value, mark[0])
+        self.writeRam(channel, ProSLIC_CommonRamAddrs.FSKAMP1.value, mark[1])
+
+    @atomic
+    def enableFSK(self, channel):
+        self.writeRegister(channel, ProSLIC_CommonREGs.OCON.value, 0x00)
+        omode = self.readRegister(channel, ProSLIC_CommonREGs.OMODE.value)
+        self.writeRegister(channel, ProSLIC_CommonREGs.OMODE.value, omode | 0x0A)
+        # OSC1 with its active timer clocking the bits
+        self.writeRegister(channel, ProSLIC_CommonREGs.OCON.value, 0x05)
+
+    @atomic
+    def disableFSK(self, channel):
+        self.writeRegister(channel, ProSLIC_CommonREGs.OCON.value, 0x00)
+        omode = self.readRegister(channel, ProSLIC_CommonREGs.OMODE.value)
+        self.writeRegister(channel, ProSLIC_CommonREGs.OMODE.value, omode & ~0x08)
+
+    def writeFSKData(self, channel, data):
+        for value in data:
+            self.writeRegister(channel, REG_FSKDAT, value)
+
+    def readDTMFDigit(self, channel = 0):
+        value = self.readRegister(channel, REG_TONDTMF)
+        return DTMF_DIGIT_MAP[value & 0x0F]
+
+    @atomic
     def getHookState(self, channel = 0):
-        value = self.readRegister(channel, ProSLIC_CommonREGs.LCRRTP.value)
+        value = self.readRegister(channel, REG_LCRRTP)
         self.logger.debug(f"Hook register read value={hex(value)}")
         if value & 0x02:
             return False
         return True
         
+    @atomic
     def setLineFeed(self, channel, state: Linefeed):
-        valueAuto = self.readRegister(channel, ProSLIC_CommonREGs.AUTO.value)        
-        valueLineFeed = self.readRegister(channel, ProSLIC_CommonREGs.LINEFEED.value)
+        valueAuto = self.readRegister(channel, REG_AUTO)        
+        valueLineFeed = self.readRegister(channel, REG_LINEFEED)
 
         # State 4 is ringing, why is it special?
         # Already RINGING nothing to do
@@ -424,14 +622,14 @@ class SiDevice(ABC):
             #     channel, ProSLIC_CommonREGs.IRQEN1.value, valIRQ & ~0x80)
             
             self.writeRegister(
-                channel, ProSLIC_CommonREGs.LINEFEED.value, state.value)
+                channel, REG_LINEFEED, state.value)
             return False       
         else:
             # Supposing mask is 0xFB: 0x3f become 3b as captured
-            self.writeRegister(channel, ProSLIC_CommonREGs.AUTO.value, valueAuto & 0xFB)
-            self.writeRegister(channel, ProSLIC_CommonREGs.LINEFEED.value, state.value)
+            self.writeRegister(channel, REG_AUTO, valueAuto & 0xFB)
+            self.writeRegister(channel, REG_LINEFEED, state.value)
             # Restore old AUTO value
-            self.writeRegister(channel, ProSLIC_CommonREGs.AUTO.value, valueAuto)
+            self.writeRegister(channel, REG_AUTO, valueAuto)
 
             # This is setting a value from a struct, unknown
             # self.writeRegister(
@@ -443,6 +641,7 @@ class SiDevice(ABC):
     def stopRing(self, channel = 0):
         self.setLineFeed(channel, Linefeed.IDLE.value)
         
+    @atomic
     def setLoopback(self, channel, mode: LoopbackMode):
         regTemp = self.readRegister(channel, ProSLIC_CommonREGs.LOOPBACK.value)
         newValue = regTemp
@@ -471,13 +670,14 @@ class SiDevice(ABC):
     def disableIRQ(self, channel = 0):
         return False
 
+    @atomic
     def getInterruptChannels(self, pendingIRQ = None) -> List[Tuple[int, int]]:
         channels = []
 
         # Try to read status if a provided value is not set
         if pendingIRQ == None:
             # IRQ0 is shared between channels, so read from Channel 0
-            pendingIRQ = self.readRegister(0, ProSLIC_CommonREGs.IRQ0.value)
+            pendingIRQ = self.readRegister(0, REG_IRQ0)
 
         # No IRQ raised return empty
         if not pendingIRQ:
@@ -493,8 +693,10 @@ class SiDevice(ABC):
 
         return channels       
 
+    # Returns the raised flags mapped to their data (None when there is nothing to read)
+    @atomic
     def handleIRQ(self, channel, pendingRegisters):
-        flags = []
+        flags = {}
 
         # Mask pendingRegisters, we assume shift already happened
         # pendingRegisters contains what register has a IRQ that is pending
@@ -513,17 +715,13 @@ class SiDevice(ABC):
             #         logger.info("Off Hook channel={channel}")
 
             # Skipping IRQ as it is user set (firmware dependent?)
-            register_enums = [
-                ProSLIC_CommonREGs.IRQ1,
-                ProSLIC_CommonREGs.IRQ2,
-                ProSLIC_CommonREGs.IRQ3,
-            ]
+            registers = [REG_IRQ1, REG_IRQ2, REG_IRQ3]
             interrupt_masks = [ProSLIC_IRQ1, ProSLIC_IRQ2, ProSLIC_IRQ3]
-            for register, register_masks in zip(register_enums, interrupt_masks):
+            for register, register_masks in zip(registers, interrupt_masks):
                 # value = 0x00
                 # # Read IRQn Register only when a previus IRQ0 states has an pending interrupt      
                 # if pendingRegisters & (1 << idx):
-                value = self.readRegister(channel, register.value)
+                value = self.readRegister(channel, register)
 
                 # Skip mapping if no flags are present
                 if not value:
@@ -536,14 +734,33 @@ class SiDevice(ABC):
                     # Flag is set map to hi-level flags
                     flag = self.LOW_TO_HIGH_IRQ_MAP.get(irq_mask)
                     if flag is not None and flag not in flags:
-                        flags.append(flag)
+                        flags[flag] = None
+
+            # Fetch the decoded digit while servicing the IRQ
+            if InterrupFlags.DTMF in flags:
+                flags[InterrupFlags.DTMF] = self.readDTMFDigit(channel)
 
             return flags
         except Exception as e:
             self.logger.exception(e)
 
-    def close(self):
-        self.reset()
+    def adopt(self, numChannels, chipId):
+        """Takes over a chip left running by a previous daemon, no reset."""
+        for channel in range(numChannels):
+            if self.getChipInfo(channel) != chipId:
+                self.logger.warning(f"Chip id mismatch chan={channel}, cannot adopt")
+                return False
+        self.numChannels = numChannels
+        self.logger.info(f"Adopted {self.numChannels} channels")
+        return True
+
+    # The chip keeps running when handed over to another daemon
+    def close(self, reset = True):
+        if reset:
+            self.reset()
+        if self._actor is not None:
+            self._actor.close()
+            self._actor = None
 
     def delay(self, ms = 100):
         time.sleep(ms / 1000)
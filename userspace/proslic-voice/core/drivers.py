@@ -0,0 +1,45 @@
+import importlib
+import logging
+import time
+
+from typing import Dict, Optional, Type
+
+from config import IRQMode
+
+# "module:Class" entries, a module is imported the first time one of its entries is used
+
+# Chip ID read at probe -> device driver
+CHIP_DRIVERS = {
+    0xCB: "devices.si3228:Si3228x",
+}
+
+# IRQMode -> IRQ reader, IRQMode.NONE has none
+IRQ_READERS = {
+    IRQMode.GPIO: "irqs.gpio_reader:IRQGPIOReader",
+    IRQMode.DEVICE: "irqs.char_reader:IRQCharDevReader",
+}
+
+_logger = logging.getLogger("Drivers")
+# entry -> seconds spent importing its module, modules imported along included
+_import_times: Dict[str, float] = {}
+
+def load_entry(entry: str) -> Type:
+    module_name, _, name = entry.partition(":")
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if entry not in _import_times:
+        _import_times[entry] = time.perf_counter() - start
+        _logger.debug(f"Loaded {entry} in {_import_times[entry] * 1000:.1f}ms")
+    return getattr(module, name)
+
+def chip_driver(chip_id: int) -> Optional[Type]:
+    entry = CHIP_DRIVERS.get(chip_id)
+    return load_entry(entry) if entry else None
+
+def irq_reader(mode: IRQMode) -> Optional[Type]:
+    entry = IRQ_READERS.get(mode)
+    return load_entry(entry) if entry else None
+
+def import_report() -> Dict[str, float]:
+    """Seconds spent importing each entry loaded so far, slowest first."""
+    return dict(sorted(_import_times.items(), key=lambda item: item[1], reverse=True))
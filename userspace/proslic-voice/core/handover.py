@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+
+from typing import Callable, Optional, Tuple
+
+HANDOVER_SOCKET = "/var/run/proslic-voice.sock"
+HANDOVER_VERSION = 1
+# Requested by the successor, answered with the state and the device fd
+_HANDOVER_REQUEST = b"HANDOVER %d\n" % HANDOVER_VERSION
+_HANDOVER_TIMEOUT = 5.0
+_HANDOVER_MAX_STATE = 1 << 16
+
+def request_handover(path: str = HANDOVER_SOCKET) -> Optional[Tuple[int, dict]]:
+    """(device fd, state) of the running daemon, None when there is none."""
+    logger = logging.getLogger("Handover")
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(_HANDOVER_TIMEOUT)
+            sock.connect(path)
+            sock.sendall(_HANDOVER_REQUEST)
+            data, fds, _, _ = socket.recv_fds(sock, _HANDOVER_MAX_STATE, 1)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    except OSError as e:
+        logger.warning(f"Handover from {path} failed: {e}")
+        return None
+
+    if len(fds) != 1:
+        for fd in fds:
+            os.close(fd)
+        logger.warning(f"Handover from {path} without the device")
+        return None
+    try:
+        state = json.loads(data)
+    except ValueError as e:
+        os.close(fds[0])
+        logger.warning(f"Handover from {path} with invalid state: {e}")
+        return None
+    if state.get("version") != HANDOVER_VERSION:
+        os.close(fds[0])
+        logger.warning(f"Handover from {path} with state version={state.get('version')}")
+        return None
+
+    logger.info(f"Took over the device from {path}")
+    return fds[0], state
+
+class HandoverServer:
+    """Hands the live device over to a successor daemon.
+
+    handover() must stop using the device, leaving the chip as it is, and
+    return a duplicate of its fd with the state, done() is called once the
+    successor got them. A handover() that raises must leave the daemon
+    running, the server then waits for the next successor.
+    """
+    def __init__(self, handover: Callable[[], Tuple[int, dict]], done: Callable[[], None], path: str = HANDOVER_SOCKET):
+        self._logger = logging.getLogger("Handover")
+
+        self.path = path
+        self._handover = handover
+        self._done = done
+
+        # A stale socket of a daemon that did not exit cleanly
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        os.chmod(path, 0o600)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"HandoverServer(path={self.path})"
+
+    def setup(self):
+        self._sock.listen(1)
+        self._thread.start()
+
+    def close(self):
+        # Wakes up accept(), the path may belong to a successor already
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def _run(self):
+        self._logger.debug("Waiting for a successor")
+        try:
+            while True:
+                conn, _ = self._sock.accept()
+                with conn:
+                    conn.settimeout(_HANDOVER_TIMEOUT)
+                    try:
+                        request = conn.recv(len(_HANDOVER_REQUEST))
+                    except OSError:
+                        request = None
+                    if request != _HANDOVER_REQUEST:
+                        self._logger.warning("Ignoring invalid handover request")
+                        continue
+
+                    self._logger.info("Handing over to a successor")
+                    try:
+                        fd, state = self._handover()
+                    except Exception as e:
+                        # Nothing was handed over, the daemon still runs
+                        self._logger.error(f"Handover aborted: {e}")
+                        self._logger.exception(e)
+                        continue
+                    # Past this point the device is released, exit whatever happens
+                    try:
+                        socket.send_fds(conn, [json.dumps(state).encode()], [fd])
+                        # The successor closes once it got everything
+                        conn.recv(1)
+                    except OSError as e:
+                        self._logger.error(f"Handover failed, the chip is left running: {e}")
+                    finally:
+                        os.close(fd)
+                        self._done()
+                return
+        except OSError:
+            # Closed
+            pass
+        except Exception as e:
+            self._logger.error("Unexpected error in handover server")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("Handover server exiting...")
@@ -0,0 +1,178 @@
+import functools
+import itertools
+import logging
+import queue
+import threading
+import time
+import traceback
+
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Dict, Optional
+
+class IOPriority(IntEnum):
+    IRQ = 0
+    RING = 1
+    CONFIG = 2
+    TELEMETRY = 3
+    # Blob upload, calibration, split in chunks that yield to everything else
+    BULK = 4
+
+# Seconds a job may wait before it misses its deadline, classes without one never miss
+IO_BUDGETS = {
+    # Pulse dial breaks last 60ms, an edge must be read well within that
+    IOPriority.IRQ: 0.005,
+    IOPriority.RING: 0.020,
+}
+# Accesses per job of chunked bulk work
+IO_CHUNK = 32
+# Latest jobs per class kept for the percentiles
+IO_METRICS_WINDOW = 1024
+
+# Priority and budget of the accesses of the current thread
+_context = threading.local()
+
+def set_io_priority(priority: IOPriority, budget: Optional[float] = None):
+    """Priority of every access made by the calling thread from now on, budget defaults to IO_BUDGETS."""
+    _context.priority = priority
+    _context.budget = IO_BUDGETS.get(priority) if budget is None else budget
+
+@contextmanager
+def io_priority(priority: IOPriority, budget: Optional[float] = None):
+    """Priority of the accesses made by the calling thread within the block."""
+    previous = (current_io_priority(), current_io_budget())
+    set_io_priority(priority, budget)
+    try:
+        yield
+    finally:
+        _context.priority, _context.budget = previous
+
+def current_io_priority() -> IOPriority:
+    return getattr(_context, "priority", IOPriority.CONFIG)
+
+def current_io_budget() -> Optional[float]:
+    return getattr(_context, "budget", None)
+
+class IOClassMetrics:
+    """Queueing and run time of the jobs of a priority class."""
+    def __init__(self):
+        self.count = 0
+        self.misses = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self._waits = deque(maxlen=IO_METRICS_WINDOW)
+
+    def __str__(self):
+        if not self.count:
+            return "IOClassMetrics(count=0)"
+        return (f"IOClassMetrics(count={self.count} misses={self.misses} "
+                f"wait_mean={self.wait_total / self.count * 1000:.2f}ms wait_p99={self.waitPercentile(99) * 1000:.2f}ms "
+                f"wait_max={self.wait_max * 1000:.2f}ms run_mean={self.run_total / self.count * 1000:.2f}ms)")
+
+    def record(self, wait, run, missed):
+        self.count += 1
+        self.misses += missed
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += run
+        self._waits.append(wait)
+
+    def waitPercentile(self, percent) -> float:
+        """Wait of the latest IO_METRICS_WINDOW jobs, 0 without jobs."""
+        if not self._waits:
+            return 0.0
+        waits = sorted(self._waits)
+        return waits[min(len(waits) - 1, int(len(waits) * percent / 100))]
+
+def atomic(method):
+    """Runs a method making several accesses as a single job of its device."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._run(method, self, *args, **kwargs)
+    return wrapper
+
+class DeviceIOActor:
+    """Single owner of a device, runs the accesses of every thread in priority order.
+
+    Within a priority, jobs with a deadline run earliest deadline first,
+    ahead of the others, which run in submission order. Each job runs to
+    completion, so a job of several accesses is atomic without a lock held
+    by its caller, bulk work is submitted in chunks to let urgent jobs in.
+    Jobs submitted from within a job run inline.
+    """
+    def __init__(self, name: str):
+        self._logger = logging.getLogger("DeviceIOActor")
+
+        self.name = name
+        self._queue = queue.PriorityQueue()
+        # Keeps submission order within a priority, futures are never compared
+        self._sequence = itertools.count()
+        # Only updated by the worker
+        self._metrics: Dict[IOPriority, IOClassMetrics] = {priority: IOClassMetrics() for priority in IOPriority}
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"io-{name}", daemon=True)
+
+    def __str__(self):
+        return f"DeviceIOActor(name={self.name} pending={self._queue.qsize()})"
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        # Ahead of every job, wakes the worker up
+        self._queue.put((-1, 0.0, next(self._sequence), 0.0, None, None))
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+        while True:
+            try:
+                _, _, _, _, future, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None:
+                future.cancel()
+
+    def getMetrics(self) -> Dict[IOPriority, IOClassMetrics]:
+        return self._metrics
+
+    def submit(self, priority: IOPriority, fn, *args, budget: Optional[float] = None, **kwargs) -> Future:
+        """Future of fn, budget is the longest it should wait to start."""
+        if self._stop_event.is_set():
+            raise RuntimeError(f"{self} is closed")
+        future = Future()
+        submitted = time.monotonic()
+        deadline = submitted + budget if budget is not None else float("inf")
+        self._queue.put((priority, deadline, next(self._sequence), submitted, future,
+                         functools.partial(fn, *args, **kwargs)))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Result of fn run at the priority and budget of the calling thread."""
+        if threading.current_thread() is self._thread:
+            return fn(*args, **kwargs)
+        return self.submit(current_io_priority(), fn, *args, budget=current_io_budget(), **kwargs).result()
+
+    def _run(self):
+        self._logger.debug(f"Starting I/O thread of {self.name}")
+        try:
+            while not self._stop_event.is_set():
+                priority, deadline, _, submitted, future, job = self._queue.get()
+                if future is None or not future.set_running_or_notify_cancel():
+                    continue
+                start = time.monotonic()
+                try:
+                    future.set_result(job())
+                except BaseException as e:
+                    future.set_exception(e)
+                self._metrics[priority].record(start - submitted, time.monotonic() - start, start > deadline)
+        except Exception as e:
+            self._logger.error("Unexpected error in I/O loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("I/O thread exiting...")
@@ -31,6 +31,12 @@ class IrqReader(ABC):
     def __str__(self):
         return f"{self._name}(device={self._device})"
 
+    @classmethod
+    @abstractmethod
+    def create(cls, interrupt_queue: queue.Queue, device_id: Any, config, device_file) -> "IrqReader":
+        """Reader of a DeviceConfig, as picked from the IRQ_READERS registry."""
+        pass
+
     @abstractmethod
     def _callback_irq(self):
         """This method is called when the fd notify data (IRQ) is availabe."""
@@ -92,11 +98,15 @@ class IrqReader(ABC):
             traceback.print_exc()
         self._logger.info("Background thread exiting...")
 
-    def _emit(self, data = None):
+    def _emit(self, data = None, timestamp = None):
+        # Prefer the kernel timestamp of the IRQ when the backend provides one
+        if timestamp is None:
+            timestamp = time.time()
+
         # Push the data to the IRQ process queue of PhoneManager
         self._interrupt_queue.put({
             "device": self._device,
-            "timestamp": time.time(),
+            "timestamp": timestamp,
             "source": self._name,
             "data": data
         })
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+from typing import Dict, Optional
+
+from statuses import InterrupFlags
+
+FAULT_FLAGS = (InterrupFlags.THERMAL, InterrupFlags.HVIC, InterrupFlags.POWER, InterrupFlags.VBAT)
+# Isolation time of the first fault, doubled by every fault that follows a re-arm
+PROTECTION_BACKOFF = 1.0
+PROTECTION_BACKOFF_MAX = 300.0
+# Strikes are forgotten once a line stayed healthy this long
+PROTECTION_STABLE = 600.0
+
+class LineFaults:
+    def __init__(self):
+        self.counts = {flag: 0 for flag in FAULT_FLAGS}
+        self.first = None
+        self.last = None
+        self.last_flag = None
+        self.strikes = 0
+        self.isolated = False
+        self.rearm_at = None
+        self._timer = None
+
+    def __str__(self):
+        counts = " ".join(f"{flag.name.lower()}={count}" for flag, count in self.counts.items())
+        return f"LineFaults({counts} strikes={self.strikes} isolated={self.isolated})"
+
+class LineProtection:
+    """Isolates lines raising thermal, HVIC, power or VBAT alarms.
+
+    Runs in the IRQ thread before the channel sees its flags: the line goes
+    to Linefeed.NOP at once and is re-armed after an exponential backoff.
+    A fault that persists raises the IRQ again and doubles the backoff.
+    """
+    def __init__(self):
+        self._logger = logging.getLogger("LineProtection")
+
+        self._faults: Dict[object, LineFaults] = {}
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        isolated = sum(faults.isolated for faults in self._faults.values())
+        return f"LineProtection(lines={len(self._faults)} isolated={isolated})"
+
+    def getFaults(self, vc) -> Optional[LineFaults]:
+        return self._faults.get(vc)
+
+    def handleInterrupt(self, vc, flags, timestamp) -> bool:
+        """True when the line is isolated and the flags must not reach it."""
+        with self._lock:
+            faults = self._faults.get(vc)
+            raised = [flag for flag in FAULT_FLAGS if flag in flags] if flags else []
+            if not raised:
+                return faults is not None and faults.isolated
+
+            if faults is None:
+                faults = self._faults[vc] = LineFaults()
+            for flag in raised:
+                faults.counts[flag] += 1
+            if faults.first is None:
+                faults.first = timestamp
+            elif timestamp - faults.last > PROTECTION_STABLE:
+                faults.strikes = 0
+            faults.last = timestamp
+            faults.last_flag = raised[0]
+
+            if faults.isolated:
+                return True
+            # FIXME: VBAT sags while ringing, the original firmware masks IRQ_VBAT then
+            if raised == [InterrupFlags.VBAT] and vc.isRinging():
+                self._logger.debug(f"Ignoring VBAT alarm while ringing on {vc}")
+                return False
+
+            delay = min(PROTECTION_BACKOFF * 2 ** faults.strikes, PROTECTION_BACKOFF_MAX)
+            faults.strikes += 1
+            faults.isolated = True
+            faults.rearm_at = time.monotonic() + delay
+            faults._timer = threading.Timer(delay, self._rearm, (vc, faults))
+            faults._timer.daemon = True
+            faults._timer.start()
+
+        vc.isolate()
+        self._logger.error(f"{'/'.join(flag.name for flag in raised)} fault on {vc}, "
+                           f"isolated for {delay:.1f}s (strike {faults.strikes})")
+        return True
+
+    def close(self):
+        with self._lock:
+            for faults in self._faults.values():
+                if faults._timer is not None:
+                    faults._timer.cancel()
+
+    def _rearm(self, vc, faults: LineFaults):
+        with self._lock:
+            if not faults.isolated:
+                return
+            faults.isolated = False
+            faults.rearm_at = None
+            faults._timer = None
+        self._logger.warning(f"Re-arming {vc} after {faults.last_flag.name} fault")
+        vc.restore()
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+import traceback
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from core.device import SiDevice
+from core.io_actor import IOPriority, set_io_priority
+from utils.resources import ProSLIC_CommonRamAddrs
+
+# (entries, samples of the previous tier per entry), at 1 Hz: 10 min raw, 1 h of 10 s, 2 days of 10 min
+TELEMETRY_TIERS = ((600, 1), (360, 10), (288, 60))
+# Share of the time the sampler may keep the SPI bus busy
+TELEMETRY_DUTY = 0.05
+# Back off while IRQs are waiting
+_IRQ_BACKOFF = 0.005
+
+# MADC and sense RAM hold 29 bit two's complement values
+_RAM_MASK = (1 << 29) - 1
+_RAM_SIGN = 1 << 28
+
+class TelemetryRing:
+    """Fixed size min/max/mean ring of (channels, width) samples."""
+    def __init__(self, capacity: int, channels: int, width: int):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.float64)
+        self.min = np.zeros((capacity, channels, width), dtype=np.int32)
+        self.max = np.zeros((capacity, channels, width), dtype=np.int32)
+        self.mean = np.zeros((capacity, channels, width), dtype=np.float32)
+        # Entries pushed so far, the next one goes to total % capacity
+        self.total = 0
+
+    def push(self, when, minimum, maximum, mean):
+        index = self.total % self.capacity
+        self.time[index] = when
+        self.min[index] = minimum
+        self.max[index] = maximum
+        self.mean[index] = mean
+        self.total += 1
+
+    def last(self, count):
+        """Slice of the count entries just pushed, they never wrap around."""
+        end = (self.total - 1) % self.capacity + 1
+        return slice(end - count, end)
+
+    def ordered(self, channel):
+        """Copies of the entries of a channel, oldest first."""
+        count = min(self.total, self.capacity)
+        order = (np.arange(count) + self.total - count) % self.capacity
+        return {
+            "time": self.time[order],
+            "min": self.min[order, channel],
+            "max": self.max[order, channel],
+            "mean": self.mean[order, channel],
+        }
+
+class TelemetrySampler:
+    """Samples a set of RAM locations of every channel of a device.
+
+    Each cycle reads a channel at a time under a single device lock, raw
+    samples go to the first tier and every tier folds into the next one
+    as min/max/mean once it filled a block. The sampler stays under
+    TELEMETRY_DUTY of bus time and steps aside while IRQs are pending.
+    """
+    def __init__(self, device: SiDevice, channels: int, rams: List[ProSLIC_CommonRamAddrs], rate: float = 1.0,
+                 irq_pending: Optional[Callable[[], bool]] = None):
+        self._logger = logging.getLogger("TelemetrySampler")
+
+        self.device = device
+        self.channels = channels
+        self.rams = list(rams)
+        self.names = [ram.name for ram in self.rams]
+        self.interval = 1.0 / rate
+        self._addrs = [ram.value for ram in self.rams]
+        self._irq_pending = irq_pending or (lambda: False)
+
+        for (capacity, _), (_, factor) in zip(TELEMETRY_TIERS, TELEMETRY_TIERS[1:]):
+            if capacity % factor:
+                raise ValueError(f"Tier of {capacity} entries cannot fold by {factor}")
+        self._tiers = [TelemetryRing(capacity, channels, len(self._addrs)) for capacity, _ in TELEMETRY_TIERS]
+        self._sample = np.zeros((channels, len(self._addrs)), dtype=np.int64)
+        self._lock = threading.Lock()
+
+        self.overruns = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __str__(self):
+        return f"TelemetrySampler(device={self.device} rams={self.names} interval={self.interval}s)"
+
+    def setup(self):
+        self._stop_event.clear()
+        self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def latest(self, channel) -> Dict[str, int]:
+        with self._lock:
+            raw = self._tiers[0]
+            if not raw.total:
+                return {}
+            index = (raw.total - 1) % raw.capacity
+            return dict(zip(self.names, raw.min[index, channel].tolist()))
+
+    def snapshot(self, channel, tier=0) -> Dict[str, np.ndarray]:
+        """time, min, max and mean of a tier, oldest first, one column per RAM."""
+        if not 0 <= tier < len(self._tiers):
+            raise IndexError(f"Tier {tier} out of range (0-{len(self._tiers) - 1})")
+        with self._lock:
+            return self._tiers[tier].ordered(channel)
+
+    def _read(self) -> float:
+        """Reads every channel, returns the seconds spent reading, backoffs excluded."""
+        busy = 0.0
+        for channel in range(self.channels):
+            while self._irq_pending() and not self._stop_event.is_set():
+                time.sleep(_IRQ_BACKOFF)
+            start = time.monotonic()
+            self._sample[channel] = self.device.readRams(channel, self._addrs)
+            busy += time.monotonic() - start
+
+        # Sign extend
+        np.bitwise_and(self._sample, _RAM_MASK, out=self._sample)
+        np.bitwise_xor(self._sample, _RAM_SIGN, out=self._sample)
+        np.subtract(self._sample, _RAM_SIGN, out=self._sample)
+        return busy
+
+    def _store(self, when):
+        with self._lock:
+            self._tiers[0].push(when, self._sample, self._sample, self._sample)
+            for tier, upper, (_, factor) in zip(self._tiers, self._tiers[1:], TELEMETRY_TIERS[1:]):
+                if tier.total % factor:
+                    break
+                block = tier.last(factor)
+                upper.push(tier.time[block.stop - 1], tier.min[block].min(axis=0),
+                           tier.max[block].max(axis=0), tier.mean[block].mean(axis=0))
+
+    def _run(self):
+        self._logger.debug("Starting telemetry thread")
+        set_io_priority(IOPriority.TELEMETRY)
+        try:
+            deadline = time.monotonic()
+            while not self._stop_event.is_set():
+                busy = self._read()
+                self._store(time.time())
+
+                # Stretch the interval rather than exceed the bus budget
+                interval = self.interval
+                if busy > interval * TELEMETRY_DUTY:
+                    interval = busy / TELEMETRY_DUTY
+                    self.overruns += 1
+                deadline = max(deadline + interval, time.monotonic())
+                self._stop_event.wait(deadline - time.monotonic())
+        except Exception as e:
+            self._logger.error("Unexpected error in telemetry loop")
+            self._logger.exception(e)
+            traceback.print_exc()
+        self._logger.info("Telemetry thread exiting...")
@@ -0,0 +1,58 @@
+import fcntl
+import struct
+
+# Matches struct proslic_access in driver
+IOCTL_READ_REG = 0x80087001  # _IOR('p', 1, struct proslic_access)
+IOCTL_WRITE_REG = 0x40087002
+IOCTL_READ_RAM  = 0x80087003
+IOCTL_WRITE_RAM = 0x40087004
+#
+IOCTL_RESET_DEVICE = 0x40087007
+
+# struct proslic_access { __u8 channel; __u16 address; __u32 data; }
+STRUCT_FMT = "BHI"
+ACCESS_STRUCT = struct.Struct(STRUCT_FMT)
+# Native alignment puts data after one byte of padding, at 4
+DATA_OFFSET = struct.calcsize("BH")
+
+class IoctlTransport:
+    """Accesses through a single preallocated struct proslic_access.
+
+    The ioctl writes its result back into the buffer, data is read through a
+    memoryview so an access allocates nothing but the returned int. Not thread
+    safe, its device serializes every access.
+    """
+    def __init__(self, device):
+        # Resolved once, file objects are looked up on every ioctl otherwise
+        self._fd = device.fileno() if hasattr(device, "fileno") else device
+        self._buffer = bytearray(ACCESS_STRUCT.size)
+        self._data = memoryview(self._buffer)[DATA_OFFSET:DATA_OFFSET + 4].cast("I")
+
+    def __str__(self):
+        return f"IoctlTransport(fd={self._fd})"
+
+    def read(self, request, channel, addr):
+        buffer = self._buffer
+        ACCESS_STRUCT.pack_into(buffer, 0, channel, addr, 0)
+        fcntl.ioctl(self._fd, request, buffer, True)
+        return self._data[0]
+
+    def write(self, request, channel, addr, value):
+        buffer = self._buffer
+        ACCESS_STRUCT.pack_into(buffer, 0, channel, addr, value)
+        fcntl.ioctl(self._fd, request, buffer, True)
+
+    def readRegister(self, channel, reg):
+        return self.read(IOCTL_READ_REG, channel, reg) & 0xFF
+
+    def writeRegister(self, channel, reg, value):
+        self.write(IOCTL_WRITE_REG, channel, reg, value & 0xFF)
+
+    def readRam(self, channel, addr):
+        return self.read(IOCTL_READ_RAM, channel, addr)
+
+    def writeRam(self, channel, addr, value):
+        self.write(IOCTL_WRITE_RAM, channel, addr, value)
+
+    def reset(self):
+        self.write(IOCTL_RESET_DEVICE, 0, 0, 0)
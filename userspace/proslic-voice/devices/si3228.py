@@ -2,15 +2,15 @@ import traceback
 import queue
 
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
-from core.device import SiDevice
+from core.device import SiDevice, ProbeResult
+from core.calibration import CalibrationCache, calibration_key
 from core.irq_reader import IrqReader
-from config import DeviceConfig, IRQMode
+from core.drivers import irq_reader
+from config import DeviceConfig
 from statuses import LineTermination, AudioPCMFormat
-from irqs.gpio_reader import IRQGPIOReader
-from irqs.char_reader import IRQCharDevReader
-from utils.resources import PROSLIC_RETRIES, ProSLIC_CommonREGs
+from utils.resources import PROSLIC_RETRIES, ProSLIC_CommonREGs, ProSLIC_CommonRamAddrs
 
 from blobs.si32282 import Si32282Blob
 
@@ -22,28 +22,34 @@ class Si3228x(SiDevice):
 
         self._config = config
         self._irqReader : IrqReader = None
+        self._calibration_cache = CalibrationCache(config.calibration_cache) if config.calibration_cache else None
 
-        if config.irq == IRQMode.GPIO:
-            self._irqReader = IRQGPIOReader(self._interupt_queue, device_id, config.irq_gpio, config.irq_gpiochip)
-        elif config.irq == IRQMode.DEVICE:
-            self._irqReader = IRQCharDevReader(self._interupt_queue, device_id, device)
+        if config.io_actor:
+            self.enableIOActor()
 
-    def setup(self):
+        # Only the backend configured is imported, gpiod is not needed without GPIO IRQs
+        reader = irq_reader(config.irq)
+        if reader:
+            self._irqReader = reader.create(self._interupt_queue, device_id, config, device)
+
+    def setup(self, probe: Optional[ProbeResult] = None):
         try:
             self.logger.debug("setup()")
             
             if self._irqReader:
                 self._irqReader.setup()
 
-            super().setup()
+            super().setup(probe)
 
             if self.numChannels == 0:
                 self.logger.debug(f"{self.NAME} No channels available, exit!")
 
-            self.logger.debug(f"identifyChannel()")
-            for channel in range(self.numChannels):
-                self.getChipInfo(channel)
-                self.identifyChannel(channel)
+            # ID and ENHANCE were read by the probe, identifyChannel() is repeated below
+            if self.probeResult is None:
+                self.logger.debug(f"identifyChannel()")
+                for channel in range(self.numChannels):
+                    self.getChipInfo(channel)
+                    self.identifyChannel(channel)
 
             self.logger.debug(f"identifyChannel BIS()")
             for channel in range(self.numChannels):
@@ -62,21 +68,32 @@ class Si3228x(SiDevice):
             for channel in range(self.numChannels):
                 self.configure(channel)
 
+            # Results of a previous start replace both calibrations
+            calibration = None
+            if self._calibration_cache:
+                chipId = self.probeResult.chip_id if self.probeResult else self.getChipInfo(0)
+                calibration = calibration_key(chipId, blob, self.getCalibrationRams())
+            restored = self._restoreCalibration(calibration)
+
             # First calibration
-            self.logger.debug(f"calibrate()")
-            if not self.calibrate([0x00, 0x00, 0x01, 0x80]):
-                self.logger.debug(f"second calibration() failed")
-                return False
+            if not restored:
+                self.logger.debug(f"calibrate()")
+                if not self.calibrate([0x00, 0x00, 0x01, 0x80]):
+                    self.logger.debug(f"second calibration() failed")
+                    return False
 
             self.logger.debug(f"enableDCDCRegulator()")
             for channel in range(self.numChannels):
                 self.enableDCDCRegulator(channel)
 
             # Second calibration
-            self.logger.debug(f"calibrate()")
-            if not self.calibrate([0x00, 0xC0, 0x18, 0x80]):
-                self.logger.debug(f"second calibration() failed")
-                return False
+            if not restored:
+                self.logger.debug(f"calibrate()")
+                if not self.calibrate([0x00, 0xC0, 0x18, 0x80]):
+                    self.logger.debug(f"second calibration() failed")
+                    return False
+                if calibration:
+                    self._calibration_cache.store(calibration, self.saveCalibration())
 
             for channel in range(self.numChannels):
                 self.writeRegister(channel, ProSLIC_CommonREGs.ENHANCE.value, 0x10)
@@ -93,13 +110,41 @@ class Si3228x(SiDevice):
             traceback.print_exc()
             return False
     
-    def close(self):
+    def adopt(self, numChannels, chipId):
+        if not super().adopt(numChannels, chipId):
+            return False
+        blobId = self.readRam(0, ProSLIC_CommonRamAddrs.BLOB_ID.value)
+        if blobId != Si32282Blob.id:
+            self.logger.warning(f"Running blob id={hex(blobId)} is not {hex(Si32282Blob.id)}, cannot adopt")
+            return False
+
+        if self._irqReader:
+            self._irqReader.setup()
+        return True
+
+    def close(self, reset = True):
         if self._irqReader:
             self._irqReader.close()
-        return super().close()
+        return super().close(reset)
+
+    def getCalibrationRams(self):
+        return SI3228x_CALIBRATION_RAMS
+
+    def _restoreCalibration(self, key):
+        if not key:
+            return False
+        snapshot = self._calibration_cache.load(key)
+        if snapshot is None:
+            self.logger.info(f"No stored calibration key={key}")
+            return False
+        if not self.restoreCalibration(snapshot):
+            self.logger.warning(f"Stored calibration key={key} does not fit, calibrating")
+            return False
+        self.logger.info(f"Restored calibration key={key}")
+        return True
 
     # Chip variant specific vesion add call to ENHANCE
-    def getChipInfo(self, channel):
+    def getChipInfo(self, channel = 0):
         value = super().getChipInfo(channel)
 
         # No idea why this is also called
@@ -2024,4 +2069,29 @@ class SI3228x_RAMs(Enum):
     DCDC_UV_DEBOUNCE = 1641  # 0x0669
     DCDC_OV_MAN = 1642  # 0x066A
     DCDC_OV_DEBOUNCE = 1643  # 0x066B
-    ANALOG3_TEST_MUX = 1644  # 0x066C
\ No newline at end of file
+    ANALOG3_TEST_MUX = 1644  # 0x066C
+
+# FIXME: picked from the RAM names, the exact set written by CALR0-2 is unknown
+SI3228x_CALIBRATION_RAMS = [ram.value for ram in (
+    SI3228x_RAMs.CMDAC_FWD,
+    SI3228x_RAMs.CMDAC_RVS,
+    SI3228x_RAMs.CAL_TRNRD_DACT,
+    SI3228x_RAMs.CAL_TRNRD_DACR,
+    SI3228x_RAMs.CAL_LB_OFFSET_FWD,
+    SI3228x_RAMs.CAL_LB_OFFSET_RVS,
+    SI3228x_RAMs.CAL_DCDAC_CODE,
+    SI3228x_RAMs.CAL_DCDAC_15MA,
+    SI3228x_RAMs.DCDAC_OFFSET,
+    SI3228x_RAMs.DC_ADC_OS,
+    SI3228x_RAMs.ACADC_OFFSET,
+    SI3228x_RAMs.ACDAC_OFFSET,
+    SI3228x_RAMs.MADC_VTIPC_OS,
+    SI3228x_RAMs.MADC_VRINGC_OS,
+    SI3228x_RAMs.MADC_VBAT_OS,
+    SI3228x_RAMs.MADC_VLONG_OS,
+    SI3228x_RAMs.MADC_VDC_OS,
+    SI3228x_RAMs.MADC_ILONG_OS,
+    SI3228x_RAMs.MADC_ILOOP_OS,
+    SI3228x_RAMs.MADC_ILOOP_SCALE,
+    SI3228x_RAMs.DC_HOLD_DAC_OS,
+)]
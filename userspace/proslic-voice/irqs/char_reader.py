@@ -14,6 +14,10 @@ class IRQCharDevReader(IrqReader):
 
         pass
 
+    @classmethod
+    def create(cls, interrupt_queue, device_id, config, device_file):
+        return cls(interrupt_queue, device_id, device_file)
+
     def setup(self):
         self._logger.debug("setup()")
         super().setup()
@@ -30,10 +34,13 @@ class IRQCharDevReader(IrqReader):
 
             # Read the interrupt data to clear IRQ0 to easily identify wich registers/channel to query
             data = self._dev_file.read(1)
-            self._logger.debug(f"IRQ received: value={hex(data)}")
+            if not data:
+                return
+            self._logger.debug(f"IRQ received: value={hex(data[0])}")
 
             # Push the data to the IRQ process queue of PhoneManager
-            self.emit(data)
+            # FIXME: the char device has no IRQ timestamp, time of read is used
+            self._emit(data[0])
         except BlockingIOError:
             # No data to read yet
             pass
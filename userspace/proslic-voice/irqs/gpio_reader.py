@@ -1,7 +1,7 @@
 import gpiod
 import queue
 
-from gpiod.line import Edge
+from gpiod.line import Clock, Edge
 from typing import Any
 
 from core.irq_reader import IrqReader
@@ -16,15 +16,20 @@ class IRQGPIOReader(IrqReader):
 
         pass
 
+    @classmethod
+    def create(cls, interrupt_queue, device_id, config, device_file):
+        return cls(interrupt_queue, device_id, config.irq_gpio, config.irq_gpiochip)
+
     def setup(self):
         self._logger.debug("setup()")
 
         # Setup the IRQ GPIO
         self._gpio = gpiod.request_lines(
             self._gpio_chip, 
-            consumer = self.name,
+            consumer = self._name,
             config = {
-                self._gpio_pin: gpiod.LineSettings(edge_detection=Edge.FALLING)
+                # Realtime clock so edge timestamps match time.time()
+                self._gpio_pin: gpiod.LineSettings(edge_detection=Edge.FALLING, event_clock=Clock.REALTIME)
             }
         )
 
@@ -45,5 +50,5 @@ class IRQGPIOReader(IrqReader):
             # self._logger.debug(f"gpio: {event.line_offset} type: Falling event #{event.line_seqno}")
 
             # Push the data to the IRQ process queue of PhoneManager
-            self._emit()
+            self._emit(timestamp=event.timestamp_ns / 1e9)
             break
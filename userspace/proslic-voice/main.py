@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import logging
 import signal
 import traceback
@@ -7,6 +8,7 @@ import traceback
 from config import Config
 from manager import PhoneManager
 from cli import PhoneCLI
+from core.handover import HandoverServer, request_handover
 
 # Device node
 DEVICE = "/dev/proslic"
@@ -31,6 +33,12 @@ def signal_handler(sig, frame):
     if cli:
         cli.do_exit(None)
 
+def handed_over():
+    # The successor owns the chip now, skip every cleanup
+    logging.getLogger(__name__).info("Handed over, exiting")
+    logging.shutdown()
+    os._exit(0)
+
 def begin():
     global cli
 
@@ -38,7 +46,16 @@ def begin():
     logger = logging.getLogger(__name__)
     logger.debug("begin()")
 
-    with open(DEVICE, "r+b", buffering=0) as devfile:
+    # A running daemon hands its live device over, nothing is reset
+    handover = request_handover()
+    if handover:
+        fd, state = handover
+        devfile = os.fdopen(fd, "r+b", buffering=0)
+    else:
+        state = None
+        devfile = open(DEVICE, "r+b", buffering=0)
+
+    with devfile:
         devices = config.begin()
 
         if not devices:
@@ -46,11 +63,18 @@ def begin():
         
         logger.debug(f"Device paths: {devices}")
         pm = PhoneManager(config, devfile)
+        server = None
         try:
             logger.info("Starting PhoneManager...")
-            if not pm.begin(devices):
+            if not pm.begin(devices, state):
                 logger.critical(f"Unable to initialize PhoneManager")
                 return
+
+            try:
+                server = HandoverServer(pm.handover, handed_over)
+                server.setup()
+            except OSError as e:
+                logger.warning(f"Hot restart unavailable: {e}")
             
             logger.info(f"PhoneManager Initialized with {pm.getChannelCount()} channels")
 
@@ -65,6 +89,8 @@ def begin():
         finally:
             # Cleanup
             logger.error(f"[Main] cleanup")
+            if server:
+                server.close()
             pm.close()
             logging.shutdown()
         return
@@ -1,16 +1,39 @@
+import os
 import time
 import logging
 import queue
 import threading
 import traceback
 
-from typing import List, Dict, Tuple, Optional
+from dataclasses import replace
 
-from config import Config
+from typing import List, Dict, Tuple, Optional, Union
+
+from config import Config, DeviceConfig, FXSConfig, DTMFMode, ToneMode, CallerIDMode, RTPCodec, config_hash, config_changes
 from core.device import SiDevice
 from core.dummy import DummyDevice
 from voice_channel import VoiceChannel
-from devices.si3228 import Si3228x
+from audio.pcm import openCapture, openPlayback
+from audio.tdm import TDMDemux, TDMMux
+from audio.dtmf import DTMFCapture
+from audio.tones import ToneEngine
+from audio.oscillator import OscillatorToneEngine
+from audio.fsk import CallerIDFeeder
+from audio.rtp import RTPBridge
+from audio.conference import ConferenceMixer
+from core.telemetry import TelemetrySampler
+from core.protection import LineProtection, LineFaults
+from core.handover import HANDOVER_VERSION
+from core.config_watcher import ConfigWatcher
+from core.drivers import chip_driver, import_report
+from core.io_actor import IOClassMetrics, IOPriority, set_io_priority
+from utils.resources import ProSLIC_CommonREGs
+from exceptions import RingUnhookException
+
+# Device settings a reload applies, the others take a restart
+_RELOAD_DEVICE_FIELDS = ("telemetry", "telemetry_rate", "calibration_cache")
+# Line settings the RTP streams are bound to, they take a restart
+_RESTART_FXS_FIELDS = ("rtp_codec", "rtp_port", "rtp_peer")
 
 class PhoneManager:
 
@@ -22,8 +45,28 @@ class PhoneManager:
 
         self._config = config
         self._devices: List[SiDevice] = []
+        # Configuration the devices run with, updated by reloads
+        self._dev_configs: List[DeviceConfig] = []
         self._channels: List[VoiceChannel] = []
         self._channel_map: Dict[Tuple[int, int], int] = {}
+        # One capture and one playback stream per device, shared by the audio features
+        self._demuxes: Dict[int, TDMDemux] = {}
+        self._muxes: Dict[int, TDMMux] = {}
+        self._dtmf_captures: Dict[int, DTMFCapture] = {}
+        self._tone_engines: Dict[int, Union[ToneEngine, OscillatorToneEngine]] = {}
+        # Shared by every line sending caller ID
+        self._cid_feeder: Optional[CallerIDFeeder] = None
+        # One loop for the RTP streams of every channel
+        self._rtp_bridge: Optional[RTPBridge] = None
+        # Conferences of any channels, across devices
+        self._conference_mixer: Optional[ConferenceMixer] = None
+        self._telemetry: Dict[int, TelemetrySampler] = {}
+        # Runs in the IRQ thread ahead of the channels
+        self._protection = LineProtection()
+        # Reloads the configuration on changes, lines still busy wait here
+        self._config_watcher: Optional[ConfigWatcher] = None
+        self._pending_lines: Dict[int, FXSConfig] = {}
+        self._reload_lock = threading.RLock()
 
         # IRQ handler threading
         self._irq_queue = queue.Queue()
@@ -31,31 +74,49 @@ class PhoneManager:
         self._irq_stop_event = threading.Event()
         self._irq_lock = threading.Lock()
 
-    def begin(self, device_paths):
+    def begin(self, device_paths, handover: Optional[dict] = None):
         fxs_index = 0
         device_index = 0
+        # State of a previous daemon, the chip and lines are adopted where nothing changed
+        adoptable_devices = {state["index"]: state for state in handover["devices"]} if handover else {}
+        adoptable_lines = {(state["device"], state["channel"]): state for state in handover["channels"]} if handover else {}
+        resume_ring = []
         try:
             for path in device_paths:
                 self.logger.info(f"Initializing device at {path}")
                 dev_config = self._config.getDeviceConfig(device_index)
                 self.logger.debug(dev_config)
 
+                # BCLK must run before the chip is touched, the stream is reused by the audio features
+                if dev_config.audio_clock:
+                    self._getMux(device_index, dev_config)
+
+                adopted = adoptable_devices.get(device_index)
+                if adopted and adopted["config"] != config_hash(dev_config):
+                    self.logger.warning(f"Configuration of device at {path} changed, initializing it again")
+                    adopted = None
+
                 #FIXME: open and use path
-                dummy = DummyDevice(-1, self._irq_queue, self.devfile)
-                dummy.setup()
+                # The only reset of the boot, the driver's setup() reuses the probe.
+                # A running chip is probed as it is.
+                probe = DummyDevice(-1, self._irq_queue, self.devfile).probe(reset=not adopted)
+                self.logger.info(f"Found chip with id={hex(probe.chip_id)} channels={len(probe.channel_ids)}")
 
-                chip_id = dummy.getChipInfo()
-                self.logger.info(f"Found chip with id={hex(chip_id)}")
+                driver = chip_driver(probe.chip_id)
+                if driver is None:
+                    raise RuntimeError(f"Unknown chip id={hex(probe.chip_id)} at {path}")
+                device = driver(device_index, self._irq_queue, dev_config, self.devfile)
 
-                if chip_id == 0xCB:
-                    device = Si3228x(device_index, self._irq_queue, dev_config, self.devfile)
+                if adopted and device.adopt(adopted["channels"], adopted["chip_id"]):
+                    self.logger.info(f"Adopted running device at {path}")
                 else:
-                    raise RuntimeError(f"Unknown chip id={hex(chip_id)} at {path}")
-
-                if not device.setup():
-                    self.logger.fatal(f"Cannot initialize device={dev_config}")
-                    raise RuntimeError(f"Cannot initialize device at {path}")
+                    # Without a reset, setup() resets the chip itself
+                    adopted = None
+                    if not device.setup(probe):
+                        self.logger.fatal(f"Cannot initialize device={dev_config}")
+                        raise RuntimeError(f"Cannot initialize device at {path}")
                 self._devices.append(device)
+                self._dev_configs.append(dev_config)
 
                 for channel in range(device.numChannels):
                     self.logger.info(f"Mapping device={device} channel={channel} -> PhoneManager channel={fxs_index}")
@@ -63,7 +124,15 @@ class PhoneManager:
                         fxs_config = self._config.getFXSConfig(fxs_index)
 
                         vc = VoiceChannel(channel, device, fxs_config)
-                        vc.begin(dev_config)
+                        line = adoptable_lines.get((device_index, channel)) if adopted else None
+                        if line and self._canAdoptLine(device, channel, fxs_config, line):
+                            vc.adopt()
+                            if line["ringing"]:
+                                resume_ring.append(vc)
+                        else:
+                            vc.begin(dev_config)
+                        if fxs_config.cid != CallerIDMode.NONE:
+                            vc.setCallerIDFeeder(self._getCallerIDFeeder())
 
                         self._channels.append(vc)
                         self._channel_map[(device_index, channel)] = fxs_index
@@ -72,6 +141,16 @@ class PhoneManager:
                     except IndexError as e:
                         self.logger.error(e)
                         self.logger.fatal(f"Cannot find configuration for fxs={fxs_index}")
+
+                if dev_config.dtmf == DTMFMode.SOFTWARE:
+                    self._setupDTMFCapture(device_index, dev_config)
+                if dev_config.tone_mode == ToneMode.SOFTWARE:
+                    self._setupToneEngine(device_index, dev_config)
+                elif dev_config.tone_mode == ToneMode.HARDWARE:
+                    self._setupOscillatorTones(device_index, device)
+                self._setupRTPStreams(device_index, dev_config)
+                if dev_config.telemetry:
+                    self._setupTelemetry(device_index, device, dev_config)
                 #
                 device_index += 1
 
@@ -83,6 +162,18 @@ class PhoneManager:
             with self._irq_lock:
                 self._irq_stop_event.clear()
                 self._irq_thread.start()
+
+            # Stopped by the previous daemon while handing over, caller ID is not sent again
+            for vc in resume_ring:
+                try:
+                    vc.startRing()
+                except RingUnhookException:
+                    pass
+
+            report = ", ".join(f"{entry}={seconds * 1000:.1f}ms" for entry, seconds in import_report().items())
+            self.logger.info(f"Drivers loaded: {report or 'none'}")
+
+            self._startConfigWatcher()
             
             return True
         except Exception as e:
@@ -92,19 +183,195 @@ class PhoneManager:
             self.close()
             return False
 
-    def close(self):
+    def handover(self) -> Tuple[int, dict]:
+        """Releases the running chip to a successor, returns a duplicate of the device fd and the state.
+
+        On failure the daemon keeps running and the exception is raised.
+        """
+        self.logger.info("Handing over all channels and devices...")
+        # Read while nothing is released yet
+        devices = [{
+            "index": device_id,
+            "chip_id": device.getChipInfo(0),
+            "channels": device.numChannels,
+            "config": config_hash(self._dev_configs[device_id]),
+        } for device_id, device in enumerate(self._devices)]
+
+        if self._config_watcher is not None:
+            self._config_watcher.close()
+            self._config_watcher = None
+        self._stopIRQ()
+        try:
+            ringing = [vc.isRinging() for vc in self._channels]
+            for vc in self._channels:
+                vc.release()
+
+            channels = [{
+                "device": device_id,
+                "channel": channel,
+                "config": config_hash(self._channels[index].getFXSConfig()),
+                "linefeed": self._devices[device_id].readRegister(channel, ProSLIC_CommonREGs.LINEFEED.value),
+                "ringing": bool(ringing[index]),
+            } for (device_id, channel), index in self._channel_map.items()]
+
+            # The IRQ reader closes the original
+            fd = os.dup(self.devfile.fileno())
+        except Exception:
+            # Released lines are left idle, hook and IRQs are served again
+            self.logger.error("Handover failed, resuming")
+            self._startIRQ()
+            self._startConfigWatcher()
+            raise
+
+        # Past this point the successor owns the chip
+        try:
+            self.close(handover=True)
+        except Exception as e:
+            self.logger.error("Error while closing for the handover")
+            self.logger.exception(e)
+        return fd, {"version": HANDOVER_VERSION, "devices": devices, "channels": channels}
+
+    def close(self, handover=False):
         self.logger.info("Closing all channels and devices...")
 
-        # Stop IRQ Thread
+        if self._config_watcher is not None:
+            self._config_watcher.close()
+            self._config_watcher = None
+        self._stopIRQ()
+        self._protection.close()
+
+        for sampler in self._telemetry.values():
+            sampler.close()
+        for capture in self._dtmf_captures.values():
+            capture.close()
+        for engine in self._tone_engines.values():
+            engine.close()
+        if self._cid_feeder is not None:
+            self._cid_feeder.close()
+        if self._rtp_bridge is not None:
+            self._rtp_bridge.close()
+        if self._conference_mixer is not None:
+            self._conference_mixer.close()
+        for demux in self._demuxes.values():
+            demux.close()
+        for mux in self._muxes.values():
+            mux.close()
+
+        # Handed over lines stay powered, the chip is not reset
+        if not handover:
+            for vc in self._channels:
+                vc.close()
+        for dev in self._devices:
+            dev.close(reset=not handover)
+
+    def _stopIRQ(self):
         with self._irq_lock:
             self._irq_stop_event.set()
             if self._irq_thread.is_alive():
                 self._irq_thread.join()
 
-        for vc in self._channels:
-            vc.close()
-        for dev in self._devices:
-            dev.close()
+    def _startConfigWatcher(self):
+        try:
+            self._config_watcher = ConfigWatcher(self._config.getPath(), self.reloadConfig, self.applyPendingConfig)
+            self._config_watcher.setup()
+        except OSError as e:
+            self.logger.warning(f"Configuration hot reload unavailable: {e}")
+
+    def _startIRQ(self):
+        with self._irq_lock:
+            if self._irq_thread.is_alive():
+                return
+            self._irq_stop_event.clear()
+            # A thread cannot be started twice
+            self._irq_thread = threading.Thread(target=self._irq_run, daemon=True)
+            self._irq_thread.start()
+
+    def _canAdoptLine(self, device, channel, fxs_config, line):
+        if line["config"] != config_hash(fxs_config):
+            self.logger.warning(f"Configuration of channel={channel} changed, initializing it again")
+            return False
+        # Nothing touched the line while no daemon was running
+        linefeed = device.readRegister(channel, ProSLIC_CommonREGs.LINEFEED.value)
+        if linefeed != line["linefeed"]:
+            self.logger.warning(f"Linefeed of channel={channel} is {hex(linefeed)}, expected {hex(line['linefeed'])}")
+            return False
+        return True
+
+    def reloadConfig(self) -> bool:
+        """Applies what changed in the configuration, False while busy lines wait for the change."""
+        with self._reload_lock:
+            try:
+                self._config.reload()
+                dev_configs = [self._config.getDeviceConfig(index) for index in range(len(self._devices))]
+                fxs_configs = [self._config.getFXSConfig(index) for index in range(len(self._channels))]
+            except Exception as e:
+                self.logger.error(f"Ignoring invalid configuration: {e}")
+                return True
+
+            for device_id, dev_config in enumerate(dev_configs):
+                live = self._dev_configs[device_id]
+                changes = config_changes(live, dev_config)
+                fixed = [name for name in changes if name not in _RELOAD_DEVICE_FIELDS]
+                if fixed:
+                    self.logger.warning(f"Restart to apply {', '.join(fixed)} of device={device_id}")
+                if len(fixed) < len(changes):
+                    self._reconfigureDevice(device_id, replace(dev_config, **{name: getattr(live, name) for name in fixed}))
+
+            self._pending_lines.clear()
+            for index, fxs_config in enumerate(fxs_configs):
+                live = self._channels[index].getFXSConfig()
+                changes = config_changes(live, fxs_config)
+                fixed = [name for name in changes if name in _RESTART_FXS_FIELDS or
+                         (name == "audio_slot" and live.rtp_codec != RTPCodec.NONE)]
+                if fixed:
+                    self.logger.warning(f"Restart to apply {', '.join(fixed)} of channel={index}")
+                if len(fixed) < len(changes):
+                    self._pending_lines[index] = replace(fxs_config, **{name: getattr(live, name) for name in fixed})
+            return self.applyPendingConfig()
+
+    def applyPendingConfig(self) -> bool:
+        """Reconfigures the lines that became idle, False while some are still busy."""
+        with self._reload_lock:
+            for index, fxs_config in list(self._pending_lines.items()):
+                vc = self._channels[index]
+                if not vc.isIdle():
+                    continue
+                del self._pending_lines[index]
+                try:
+                    self._reconfigureLine(index, vc, fxs_config)
+                except ValueError as e:
+                    self.logger.error(f"Cannot reconfigure channel={index}: {e}")
+            if self._pending_lines:
+                self.logger.debug(f"Channels {sorted(self._pending_lines)} busy, reconfigured once idle")
+            return not self._pending_lines
+
+    def _reconfigureDevice(self, device_id, dev_config):
+        changes = config_changes(self._dev_configs[device_id], dev_config)
+        self.logger.info(f"Reconfiguring device={device_id}: {', '.join(changes)}")
+        self._dev_configs[device_id] = dev_config
+
+        if "telemetry" in changes or "telemetry_rate" in changes:
+            sampler = self._telemetry.pop(device_id, None)
+            if sampler is not None:
+                sampler.close()
+            if dev_config.telemetry:
+                self._setupTelemetry(device_id, self._devices[device_id], dev_config)
+
+    def _reconfigureLine(self, index, vc: VoiceChannel, fxs_config: FXSConfig):
+        changes = config_changes(vc.getFXSConfig(), fxs_config)
+        vc.reconfigure(fxs_config, changes)
+
+        device_id = next(device for (device, _), mapped in self._channel_map.items() if mapped == index)
+        dev_config = self._dev_configs[device_id]
+        if "audio_slot" in changes:
+            # Software audio features follow the slot
+            if dev_config.dtmf == DTMFMode.SOFTWARE:
+                self._dtmf_captures.pop(device_id).close()
+                self._setupDTMFCapture(device_id, dev_config)
+            if dev_config.tone_mode == ToneMode.SOFTWARE:
+                vc.setToneEngine(self._tone_engines[device_id], fxs_config.audio_slot)
+        if fxs_config.cid != CallerIDMode.NONE:
+            vc.setCallerIDFeeder(self._getCallerIDFeeder())
 
     def getChannelCount(self):
         return len(self._channels)
@@ -114,6 +381,133 @@ class PhoneManager:
             return self._channels[channel]
         raise IndexError(f"Channel {channel} out of range (0-{self.getChannelCount() - 1})")
 
+    def createConference(self, channels: List[int]) -> int:
+        if len(set(channels)) < 2:
+            raise ValueError("A conference needs at least two channels")
+        for channel in channels:
+            self.getChannel(channel)
+
+        streams = []
+        for (device_id, _), index in self._channel_map.items():
+            if index in channels:
+                dev_config = self._dev_configs[device_id]
+                streams.append((self._getDemux(device_id, dev_config), self._getMux(device_id, dev_config),
+                                self._channels[index].getAudioSlot()))
+
+        if self._conference_mixer is None:
+            self._conference_mixer = ConferenceMixer(streams[0][0].period_size)
+        conference = self._conference_mixer.create()
+        try:
+            for demux, mux, slot in streams:
+                self._conference_mixer.join(conference, demux, mux, slot)
+        except Exception:
+            self._conference_mixer.destroy(conference)
+            raise
+        self.logger.info(f"Conference {conference} with channels {sorted(set(channels))}")
+        return conference
+
+    def getTelemetry(self, channel: int, tier=0):
+        """(RAM names, snapshot of the tier) of a channel, None without telemetry."""
+        self.getChannel(channel)
+        for (device_id, device_channel), index in self._channel_map.items():
+            if index == channel and device_id in self._telemetry:
+                sampler = self._telemetry[device_id]
+                return sampler.names, sampler.snapshot(device_channel, tier)
+        return None
+
+    def getIOMetrics(self) -> Dict[str, Optional[Dict[IOPriority, IOClassMetrics]]]:
+        """Per class job metrics of every device, None without an I/O actor."""
+        return {str(device): device.getIOMetrics() for device in self._devices}
+
+    def getFaults(self, channel: int) -> Optional[LineFaults]:
+        return self._protection.getFaults(self.getChannel(channel))
+
+    def destroyConference(self, conference: int):
+        if self._conference_mixer is not None:
+            self._conference_mixer.destroy(conference)
+
+    def _getDeviceChannels(self, device_id) -> List[VoiceChannel]:
+        return [self._channels[index] for (mapped_device, _), index in self._channel_map.items()
+                if mapped_device == device_id]
+
+    def _getCallerIDFeeder(self):
+        if self._cid_feeder is None:
+            self._cid_feeder = CallerIDFeeder()
+            self._cid_feeder.setup()
+        return self._cid_feeder
+
+    def _getDemux(self, device_id, dev_config) -> TDMDemux:
+        demux = self._demuxes.get(device_id)
+        if demux is None:
+            demux = TDMDemux(openCapture(dev_config.audio_device, dev_config.audio_channels), dev_config.audio_codec)
+            self.logger.info(f"Capturing audio with {demux}")
+            demux.setup()
+            self._demuxes[device_id] = demux
+        return demux
+
+    def _getMux(self, device_id, dev_config) -> TDMMux:
+        mux = self._muxes.get(device_id)
+        if mux is None:
+            mux = TDMMux(openPlayback(dev_config.audio_device, dev_config.audio_channels), dev_config.audio_codec)
+            self.logger.info(f"Playing audio with {mux}")
+            mux.setup()
+            self._muxes[device_id] = mux
+        return mux
+
+    def _setupDTMFCapture(self, device_id, dev_config):
+        # One detector covers all the TDM slots of the device
+        slot_map = {vc.getAudioSlot(): vc for vc in self._getDeviceChannels(device_id)}
+
+        dtmf = DTMFCapture(self._getDemux(device_id, dev_config), sorted(slot_map), lambda slot, digit, timestamp:
+            slot_map[slot].handle_dtmf(digit, timestamp))
+        self.logger.info(f"Software DTMF detection on {dtmf}")
+
+        dtmf.setup()
+        self._dtmf_captures[device_id] = dtmf
+
+    def _setupToneEngine(self, device_id, dev_config):
+        # One engine streams the tones of all the TDM slots of the device
+        engine = ToneEngine(self._getMux(device_id, dev_config))
+        self.logger.info(f"Software call progress tones on {engine}")
+
+        for vc in self._getDeviceChannels(device_id):
+            vc.setToneEngine(engine, vc.getAudioSlot())
+
+        engine.setup()
+        self._tone_engines[device_id] = engine
+
+    def _setupOscillatorTones(self, device_id, device):
+        engine = OscillatorToneEngine(device)
+        self.logger.info(f"On-chip call progress tones on {engine}")
+
+        for vc in self._getDeviceChannels(device_id):
+            vc.setToneEngine(engine, vc.getChannelId())
+
+        engine.setup()
+        self._tone_engines[device_id] = engine
+
+    def _setupRTPStreams(self, device_id, dev_config):
+        for vc in self._getDeviceChannels(device_id):
+            fxs_config = vc.getFXSConfig()
+            if fxs_config.rtp_codec == RTPCodec.NONE:
+                continue
+
+            if self._rtp_bridge is None:
+                self._rtp_bridge = RTPBridge()
+                self._rtp_bridge.setup()
+            self._rtp_bridge.addStream(
+                self._getDemux(device_id, dev_config), self._getMux(device_id, dev_config),
+                vc.getAudioSlot(), fxs_config.rtp_codec, fxs_config.rtp_port, fxs_config.rtp_peer)
+
+    def _setupTelemetry(self, device_id, device, dev_config):
+        # Steps aside while IRQs wait to be serviced
+        sampler = TelemetrySampler(device, device.numChannels, dev_config.telemetry, dev_config.telemetry_rate,
+                                   lambda: not self._irq_queue.empty())
+        self.logger.info(f"Sampling telemetry with {sampler}")
+
+        sampler.setup()
+        self._telemetry[device_id] = sampler
+
     def _device_lookup_by_id(self, index) -> Optional[SiDevice]:    
         return self._devices[index] if index < len(self._devices) else None
 
@@ -124,6 +518,8 @@ class PhoneManager:
         return None
 
     def _irq_run(self):
+        # Ahead of every other access when the device has an I/O actor
+        set_io_priority(IOPriority.IRQ)
         while not self._irq_stop_event.is_set():
             # Process IRQ queue
             try:
@@ -145,8 +541,10 @@ class PhoneManager:
                         self.logger.warning(f"No channel mapped for device={device} channel={channel}")
                         continue
                     
-                    # Forward flags to the right VoiceChannel
+                    # Forward flags to the right VoiceChannel, faults first
                     flags = device.handleIRQ(channel, pending_registers)
+                    if self._protection.handleInterrupt(vc, flags, timestamp):
+                        continue
                     vc.handle_interrupt(flags, timestamp)
             except queue.Empty:
                 continue
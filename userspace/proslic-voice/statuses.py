@@ -14,6 +14,17 @@ class HookStatus(Enum):
 
 class InterrupFlags(Enum):
     LOOP = 1 << 0
+    DTMF = 1 << 1
+    # Oscillator cadence timers, active (tone on) and inactive (tone off) expired
+    TONE_ON_END = 1 << 2
+    TONE_OFF_END = 1 << 3
+    # FSK FIFO is below its threshold
+    FSK_BUFFER = 1 << 4
+    # Line protection alarms: overheating, high voltage controller, output transistors power, battery voltage
+    THERMAL = 1 << 5
+    HVIC = 1 << 6
+    POWER = 1 << 7
+    VBAT = 1 << 8
 
 class AudioPCMFormat(Enum):
     FMT_UNKOWN_A = 0
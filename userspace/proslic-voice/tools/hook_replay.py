@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Offline replay of hook edge traces through HookPulseDetector.
+
+Traces are either extracted from a logic analyzer SPI capture (reads of
+LCRRTP, see docs/sequences/hook_sequence.csv) or synthesized from a phone
+population. The detector runs on a virtual clock so traces replay much
+faster than real time.
+
+Run from the proslic-voice directory:
+    python -m tools.hook_replay --csv ../../docs/sequences/hook_sequence.csv --labels FF
+    python -m tools.hook_replay --synthetic 200 --sweep
+"""
+import argparse
+import csv
+import difflib
+import logging
+import time
+
+from dataclasses import dataclass, field, fields, replace
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import HookConfig
+from statuses import HookStatus
+from utils.hook_decoder import HookPulseDetector, HookEvent
+from utils.resources import ProSLIC_CommonREGs
+
+# Same defaults as parse_fxs_config()
+DEFAULT_HOOK_CONFIG = HookConfig(
+    min_hook_timeout = 0.850,
+    min_digit        = 0.020,
+    max_digit        = 0.080,
+    min_flash        = 0.100,
+    max_flash        = 0.800,
+    min_inter_digit  = 0.090,
+)
+
+# Default sweep grid, name -> (start, stop, num)
+DEFAULT_GRID = {
+    "min_digit":        (0.010, 0.030, 3),
+    "max_digit":        (0.070, 0.100, 4),
+    "min_flash":        (0.080, 0.110, 4),
+    "min_inter_digit":  (0.090, 0.250, 5),
+    "min_hook_timeout": (0.600, 1.000, 3),
+}
+
+# Polling interval of VoiceChannel._hook_run()
+HOOK_TICK = 0.05
+
+# Label token for a hook flash, digits use '0'-'9'
+FLASH_TOKEN = 'F'
+
+# Integer codes used by the vectorized sweep
+_CODE_PAD = -1
+_CODE_INVALID = -2
+_CODE_FLASH = 10
+
+# SPI opcode of a register read (see docs/proslic_decoder/decoder.py)
+_SPI_OP_READ = 0x60
+_SPI_CHANNEL_ADDR = {0: 0x00, 1: 0x10}
+
+@dataclass
+class HookTrace:
+    """Hook edges of a single call attempt with the expected tokens."""
+    initial: HookStatus
+    edges: List[Tuple[float, HookStatus]]
+    labels: str = ""
+    start: float = 0.0
+    end: float = 0.0
+
+@dataclass
+class PhonePopulation:
+    """Ranges the phone parameters are uniformly drawn from, one phone per trace."""
+    pps: Tuple[float, float] = (9.0, 11.0)
+    break_ratio: Tuple[float, float] = (0.58, 0.70)
+    inter_digit: Tuple[float, float] = (0.35, 0.90)
+    flash: Tuple[float, float] = (0.085, 0.130)
+    flash_probability: float = 0.1
+    # Standard deviation of the IRQ latency added to every edge
+    jitter: float = 0.002
+
+@dataclass
+class ReplayReport:
+    traces: int = 0
+    edges: int = 0
+    exact: int = 0
+    tokens: int = 0
+    matched_tokens: int = 0
+    virtual_time: float = 0.0
+    wall_time: float = 0.0
+    mismatches: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def accuracy(self):
+        return self.exact / self.traces if self.traces else 0.0
+
+    @property
+    def token_accuracy(self):
+        return self.matched_tokens / self.tokens if self.tokens else 0.0
+
+    @property
+    def events_per_sec(self):
+        return self.edges / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def speedup(self):
+        return self.virtual_time / self.wall_time if self.wall_time else 0.0
+
+class VirtualClock:
+    """Drop-in replacement for time.time() that only moves when told to."""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def pulses_to_token(count):
+    if 1 <= count <= 10:
+        return str(count % 10)
+    return '?'
+
+def load_spi_capture(csv_file, channel=0, labels=""):
+    """Extract the hook edges of a channel from a Logic 2 SPI capture.
+
+    The IRQ handler reads LCRRTP after every loop status IRQ, the data comes
+    back on the MISO line of the following word.
+    """
+    opcode = ((_SPI_OP_READ | _SPI_CHANNEL_ADDR[channel]) << 8) | ProSLIC_CommonREGs.LCRRTP.value
+
+    samples = []
+    with open(csv_file, newline="") as csvfile:
+        rows = csv.reader(csvfile)
+        next(rows, None)
+        pending = None
+        for row in rows:
+            timestamp, mosi, miso = float(row[0]), int(row[2], 0), int(row[3], 0)
+            if pending is not None:
+                status = HookStatus.UNHOOKED if miso & 0x02 else HookStatus.HOOKED
+                samples.append((pending, status))
+                pending = None
+            elif mosi == opcode:
+                pending = timestamp
+
+    if not samples:
+        raise ValueError(f"No LCRRTP reads for channel={channel} in {csv_file}")
+
+    # The capture starts at the first IRQ, use it as the detector setup() state
+    start, initial = samples[0]
+    edges = []
+    state = initial
+    for timestamp, status in samples[1:]:
+        if status != state:
+            edges.append((timestamp, status))
+            state = status
+
+    end = edges[-1][0] if edges else start
+    return HookTrace(initial, edges, labels, start=start, end=end + 2.0)
+
+def synthesize_traces(count, population: PhonePopulation = PhonePopulation(), seed=None, max_tokens=8):
+    """Generate labelled traces of an off-hook user dialing then hanging up."""
+    rng = np.random.default_rng(seed)
+    traces = []
+    for _ in range(count):
+        pps = rng.uniform(*population.pps)
+        ratio = rng.uniform(*population.break_ratio)
+
+        labels = []
+        for _ in range(rng.integers(1, max_tokens + 1)):
+            if labels and rng.random() < population.flash_probability:
+                labels.append(FLASH_TOKEN)
+            else:
+                labels.append(str(rng.integers(0, 10)))
+
+        edges = []
+        t = rng.uniform(0.3, 1.0)
+        for token in labels:
+            if token == FLASH_TOKEN:
+                width = rng.uniform(*population.flash)
+                edges.append((t, HookStatus.HOOKED))
+                edges.append((t + width, HookStatus.UNHOOKED))
+                t += width + rng.uniform(*population.inter_digit)
+                continue
+
+            period = 1.0 / pps
+            for _ in range(int(token) or 10):
+                edges.append((t, HookStatus.HOOKED))
+                edges.append((t + period * ratio, HookStatus.UNHOOKED))
+                t += period
+            # The last make interval is part of the inter digit pause
+            t += rng.uniform(*population.inter_digit) - period * (1 - ratio)
+
+        # Hang up
+        edges.append((t, HookStatus.HOOKED))
+
+        times = np.array([edge[0] for edge in edges])
+        times += rng.normal(0.0, population.jitter, len(times))
+        times = np.maximum.accumulate(times)
+        edges = [(float(ts), status) for ts, (_, status) in zip(times, edges)]
+
+        traces.append(HookTrace(HookStatus.UNHOOKED, edges, "".join(labels), start=0.0, end=edges[-1][0] + 2.0))
+    return traces
+
+def replay(trace: HookTrace, config: HookConfig, tick=HOOK_TICK):
+    """Feed a trace through HookPulseDetector, returns the decoded tokens."""
+    clock = VirtualClock(trace.start)
+    decoded = []
+
+    def on_event(event, data):
+        if event == HookEvent.PULSE_DIGIT:
+            decoded.append(pulses_to_token(data))
+        elif event == HookEvent.HOOKFLASH:
+            decoded.append(FLASH_TOKEN)
+
+    detector = HookPulseDetector(config, on_event, clock)
+    detector.setup(trace.initial)
+
+    # Tick times are computed, not accumulated, to match the sweep emulation
+    k = 1
+    for timestamp, status in trace.edges + [(trace.end, None)]:
+        while trace.start + k * tick <= timestamp:
+            clock.now = trace.start + k * tick
+            detector.check_timeout()
+            k += 1
+        if status is not None:
+            clock.now = timestamp
+            detector.on_state_changed(timestamp, status)
+
+    return "".join(decoded)
+
+def run_replay(traces: List[HookTrace], config: HookConfig, tick=HOOK_TICK):
+    report = ReplayReport()
+
+    begin = time.perf_counter()
+    results = [replay(trace, config, tick) for trace in traces]
+    report.wall_time = time.perf_counter() - begin
+
+    for trace, decoded in zip(traces, results):
+        report.traces += 1
+        report.edges += len(trace.edges)
+        report.virtual_time += trace.end - trace.start
+        report.tokens += len(trace.labels)
+        matcher = difflib.SequenceMatcher(None, trace.labels, decoded, autojunk=False)
+        report.matched_tokens += sum(block.size for block in matcher.get_matching_blocks())
+        if decoded == trace.labels:
+            report.exact += 1
+        else:
+            report.mismatches.append((trace.labels, decoded))
+    return report
+
+def parse_grid(specs: List[str]) -> Dict[str, np.ndarray]:
+    """Parse name=start:stop:num entries on top of DEFAULT_GRID."""
+    grid = {name: np.linspace(*spec) for name, spec in DEFAULT_GRID.items()}
+    names = {f.name for f in fields(HookConfig)}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in names:
+            raise ValueError(f"Unknown HookConfig field: {name}")
+        start, stop, num = values.split(':')
+        grid[name] = np.linspace(float(start), float(stop), int(num))
+    return grid
+
+def _grid_points(base: HookConfig, grid: Dict[str, np.ndarray]):
+    """Cartesian product of the grid, dropping inconsistent combinations."""
+    mesh = np.meshgrid(*grid.values(), indexing='ij')
+    points = {name: axis.ravel() for name, axis in zip(grid, mesh)}
+    for f in fields(HookConfig):
+        if f.name not in points:
+            points[f.name] = np.full(mesh[0].size, getattr(base, f.name))
+
+    valid = (
+        (points["min_digit"] < points["max_digit"])
+        & (points["max_digit"] < points["min_flash"])
+        & (points["min_flash"] < points["max_flash"])
+        & (points["min_inter_digit"] < points["min_hook_timeout"])
+    )
+    return {name: values[valid] for name, values in points.items()}
+
+def _encode_labels(traces: List[HookTrace]):
+    lengths = np.array([len(trace.labels) for trace in traces])
+    codes = np.full((len(traces), lengths.max() + 1), _CODE_PAD)
+    for idx, trace in enumerate(traces):
+        codes[idx, :len(trace.labels)] = [
+            _CODE_FLASH if token == FLASH_TOKEN else int(token) for token in trace.labels]
+    return codes, lengths
+
+def sweep(traces: List[HookTrace], grid: Dict[str, np.ndarray], base: HookConfig = DEFAULT_HOOK_CONFIG, tick=HOOK_TICK):
+    """Score every grid point against the labelled traces at once.
+
+    Emulates HookPulseDetector (including the polling tick) with arrays shaped
+    (traces, grid points), stepping over the edges of all traces together.
+    Returns the grid points and the fraction of exactly decoded traces.
+    """
+    points = _grid_points(base, grid)
+    p = {name: values[np.newaxis, :] for name, values in points.items()}
+    n_traces, n_points = len(traces), len(points["min_digit"])
+
+    # Pad edges, the trace end is appended as a final pseudo-edge
+    n_edges = max(len(trace.edges) for trace in traces) + 1
+    edge_time = np.full((n_traces, n_edges), np.inf)
+    edge_unhook = np.zeros((n_traces, n_edges), dtype=bool)
+    edge_valid = np.zeros((n_traces, n_edges), dtype=bool)
+    for idx, trace in enumerate(traces):
+        count = len(trace.edges)
+        edge_time[idx, :count] = [edge[0] for edge in trace.edges]
+        edge_time[idx, count] = trace.end
+        edge_unhook[idx, :count] = [edge[1] == HookStatus.UNHOOKED for edge in trace.edges]
+        edge_valid[idx, :count] = True
+
+    start = np.array([trace.start for trace in traces])[:, np.newaxis]
+    labels, lengths = _encode_labels(traces)
+    lengths = lengths[:, np.newaxis]
+
+    transition = start.copy()
+    pulses = np.zeros((n_traces, n_points), dtype=np.int64)
+    awaiting = np.zeros((n_traces, n_points), dtype=bool)
+    pos = np.zeros((n_traces, n_points), dtype=np.int64)
+    ok = np.ones((n_traces, n_points), dtype=bool)
+
+    def emit(mask, code):
+        nonlocal ok
+        expected = np.take_along_axis(labels, np.minimum(pos, labels.shape[1] - 1), axis=1)
+        ok &= ~mask | ((pos < lengths) & (expected == code))
+        pos[...] += mask
+
+    for step in range(n_edges):
+        until = edge_time[:, step, np.newaxis]
+        active = np.isfinite(until)
+
+        # check_timeout() on the ticks before the edge
+        first_tick = start + np.ceil((transition + p["min_inter_digit"] - start) / tick) * tick
+        fires = awaiting & active & (first_tick <= until)
+        expired = fires & (first_tick - transition > p["min_hook_timeout"])
+        digit = fires & ~expired & (pulses > 0)
+        codes = np.where(pulses <= 10, pulses % 10, _CODE_INVALID)
+        emit(digit, codes)
+        hook_tick = start + (np.floor((transition + p["min_hook_timeout"] - start) / tick) + 1) * tick
+        expired |= fires & ~digit & (hook_tick <= until)
+        done = digit | expired
+        pulses[done] = 0
+        awaiting[done] = False
+
+        # on_state_changed() for the edge itself
+        edge = edge_valid[:, step, np.newaxis]
+        delta = np.round(until - transition, 3)
+        unhook = edge & edge_unhook[:, step, np.newaxis]
+        is_digit = unhook & (p["min_digit"] <= delta) & (delta <= p["max_digit"])
+        is_flash = unhook & ~is_digit & (p["min_flash"] <= delta) & (delta <= p["max_flash"])
+        pulses += is_digit
+        emit(is_flash, _CODE_FLASH)
+        awaiting = (awaiting | edge) & ~is_flash
+        pulses[is_flash] = 0
+        transition = np.where(edge[:, :1], until, transition)
+
+    ok &= pos == lengths
+    return points, ok.mean(axis=0)
+
+def suggest(points, scores):
+    """Pick the median of the best scoring region, so thresholds keep margin."""
+    best = scores >= scores.max()
+    suggestion = {}
+    for name, values in points.items():
+        candidates = np.unique(values[best])
+        suggestion[name] = round(float(candidates[len(candidates) // 2]), 3)
+    return HookConfig(**suggestion), float(scores.max()), int(best.sum())
+
+def print_report(title, config: HookConfig, report: ReplayReport, verbose=False):
+    print(f"== {title}")
+    print(f"   {config}")
+    print(f"   traces={report.traces} edges={report.edges} exact={report.exact} ({report.accuracy:.1%})")
+    print(f"   tokens={report.tokens} matched={report.matched_tokens} ({report.token_accuracy:.1%})")
+    print(f"   {report.events_per_sec:,.0f} events/s, {report.speedup:,.0f}x real time")
+    for expected, decoded in report.mismatches[:10 if not verbose else None]:
+        print(f"   MISMATCH: expected='{expected}' decoded='{decoded}'")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay hook traces through HookPulseDetector.")
+    parser.add_argument("--csv", action="append", default=[], help="Logic 2 SPI capture (CSV)")
+    parser.add_argument("--channel", type=int, default=0, help="Channel to extract from captures")
+    parser.add_argument("--labels", default="", help=f"Expected tokens of the captures, digits and '{FLASH_TOKEN}'")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of synthetic traces")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--tick", type=float, default=HOOK_TICK, help="check_timeout() polling interval (s)")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="Override a HookConfig value")
+    parser.add_argument("--sweep", action="store_true", help="Search the grid for the best thresholds")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=START:STOP:NUM")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    # The detector logs every event, keep the output readable
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    config = DEFAULT_HOOK_CONFIG
+    for override in args.set:
+        name, _, value = override.partition('=')
+        config = replace(config, **{name: float(value)})
+
+    traces = [load_spi_capture(path, args.channel, args.labels) for path in args.csv]
+    traces += synthesize_traces(args.synthetic, seed=args.seed)
+    if not traces:
+        parser.error("Nothing to replay, use --csv and/or --synthetic")
+
+    print_report("Current configuration", config, run_replay(traces, config, args.tick), args.verbose)
+
+    if args.sweep:
+        grid = parse_grid(args.grid)
+        begin = time.perf_counter()
+        points, scores = sweep(traces, grid, config, args.tick)
+        elapsed = time.perf_counter() - begin
+        print(f"== Sweep: {len(scores)} grid points x {len(traces)} traces in {elapsed:.2f}s")
+
+        suggestion, score, ties = suggest(points, scores)
+        print(f"   best accuracy={score:.1%} shared by {ties} grid points")
+        print_report("Suggested configuration", suggestion, run_replay(traces, suggestion, args.tick), args.verbose)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Microbenchmark of the register access path, ops/sec before and after IoctlTransport.
+
+"legacy" is the former access: struct.pack, ioctl returning a new bytes
+object, struct.unpack. "transport" is IoctlTransport, packing into and
+reading back from its preallocated buffer. Without a device both run a
+harmless FIONREAD on a pipe, which shares the copy in/out of a small
+argument with the proslic ioctls; with --device they read a register.
+
+Run from the proslic-voice directory:
+    python -m tools.ioctl_bench
+    python -m tools.ioctl_bench --device /dev/proslic --count 20000
+"""
+import argparse
+import fcntl
+import os
+import struct
+import termios
+import time
+
+from core.transport import IOCTL_READ_REG, STRUCT_FMT, IoctlTransport
+from utils.resources import ProSLIC_CommonREGs
+
+def legacy_read(dev, request, channel, addr):
+    buf = struct.pack(STRUCT_FMT, channel, addr, 0)
+    result = fcntl.ioctl(dev, request, buf)
+    _, _, data = struct.unpack(STRUCT_FMT, result)
+    return data
+
+def measure(fn, count, repeat):
+    """Best ops/sec of repeat runs of count calls."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        best = max(best, count / (time.perf_counter() - start))
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--device", help="proslic character device, a pipe is used otherwise")
+    parser.add_argument("--channel", type=int, default=0)
+    parser.add_argument("--count", type=int, default=200000, help="accesses per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, the best one is reported")
+    args = parser.parse_args()
+
+    if args.device:
+        dev = open(args.device, "rb", buffering=0)
+        request, addr = IOCTL_READ_REG, ProSLIC_CommonREGs.ID.value
+    else:
+        read_fd, write_fd = os.pipe()
+        dev = os.fdopen(read_fd, "rb", buffering=0)
+        # Only the first int is written back, the rest of the struct is left as is
+        request, addr = termios.FIONREAD, 0
+
+    try:
+        transport = IoctlTransport(dev)
+        results = {
+            "legacy": measure(lambda: legacy_read(dev, request, args.channel, addr), args.count, args.repeat),
+            "transport": measure(lambda: transport.read(request, args.channel, addr), args.count, args.repeat),
+        }
+    finally:
+        dev.close()
+        if not args.device:
+            os.close(write_fd)
+
+    for name, rate in results.items():
+        print(f"{name:<10} {rate:>12,.0f} ops/s")
+    print(f"speedup    {results['transport'] / results['legacy']:>12.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import re
+import time
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from config import CallerIDMode
+
+# Message types
+_SDMF_MESSAGE = 0x04
+_MDMF_MESSAGE = 0x80
+
+# MDMF parameter types
+_MDMF_DATETIME = 0x01
+_MDMF_NUMBER = 0x02
+_MDMF_NUMBER_ABSENT = 0x04
+_MDMF_NAME = 0x07
+_MDMF_NAME_ABSENT = 0x08
+
+_SDMF_NUMBER_MAX = 10
+_MDMF_NUMBER_MAX = 20
+_MDMF_NAME_MAX = 15
+
+# Withheld (private) and unavailable (out of area) callers
+CALLER_PRIVATE = 'P'
+CALLER_UNAVAILABLE = 'O'
+
+# 300 alternating bits then 180 marks, as whole bytes
+_SEIZURE = b'\x55' * 30
+_MARKS = b'\xff' * 23
+
+def parse_caller(caller: str) -> Tuple[str, Optional[str]]:
+    """Splits "number" or "Name <number>" into (number, name)."""
+    match = re.fullmatch(r"\s*(.*?)\s*<\s*([^>]*?)\s*>\s*", caller)
+    if match:
+        return match.group(2), match.group(1).strip('"') or None
+    return caller.strip(), None
+
+def _checksum(message: bytes):
+    return (-sum(message)) & 0xFF
+
+def _absent(number: str):
+    return number if number in (CALLER_PRIVATE, CALLER_UNAVAILABLE) else None
+
+@lru_cache(maxsize=32)
+def encode_message(mode: CallerIDMode, number: str, name: Optional[str], stamp: str) -> bytes:
+    """Caller ID message with its checksum, stamp is "MMDDHHMM"."""
+    if mode == CallerIDMode.SDMF:
+        body = stamp.encode("ascii") + number[:_SDMF_NUMBER_MAX].encode("ascii", "replace")
+        message = bytes((_SDMF_MESSAGE, len(body))) + body
+        return message + bytes((_checksum(message),))
+
+    params = [(_MDMF_DATETIME, stamp)]
+    if _absent(number):
+        params.append((_MDMF_NUMBER_ABSENT, number))
+    else:
+        params.append((_MDMF_NUMBER, number[:_MDMF_NUMBER_MAX]))
+    if name is None:
+        params.append((_MDMF_NAME_ABSENT, _absent(number) or CALLER_UNAVAILABLE))
+    else:
+        params.append((_MDMF_NAME, name[:_MDMF_NAME_MAX]))
+
+    body = b''.join(bytes((kind, len(value))) + value.encode("ascii", "replace") for kind, value in params)
+    message = bytes((_MDMF_MESSAGE, len(body))) + body
+    return message + bytes((_checksum(message),))
+
+@lru_cache(maxsize=32)
+def encode_transmission(mode: CallerIDMode, number: str, name: Optional[str], stamp: str) -> bytes:
+    """Whole on-hook transmission: channel seizure, marks and message."""
+    return _SEIZURE + _MARKS + encode_message(mode, number, name, stamp)
+
+def caller_id(mode: CallerIDMode, caller: str, when=None) -> bytes:
+    """Transmission for a caller string, shared by every line ringing in the same minute."""
+    number, name = parse_caller(caller)
+    stamp = time.strftime("%m%d%H%M", time.localtime(when))
+    return encode_transmission(mode, number, name, stamp)
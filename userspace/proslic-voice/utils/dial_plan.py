@@ -0,0 +1,214 @@
+import logging
+import threading
+import time
+
+from enum import Enum, auto
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+DIGITS = "0123456789"
+SYMBOLS = DIGITS + "*#"
+
+# Asterisk style wildcards
+_WILDCARDS = {
+    'X': frozenset("0123456789"),
+    'Z': frozenset("123456789"),
+    'N': frozenset("23456789"),
+}
+# One or more of any symbol, only allowed at the end of a rule
+_TAIL = '.'
+
+class DialResult(Enum):
+    INCOMPLETE = auto()
+    COMPLETE = auto()
+    IMPOSSIBLE = auto()
+
+class _Node:
+    def __init__(self):
+        self.edges: Dict[Tuple[FrozenSet[str], bool], "_Node"] = {}
+        self.rules: List[str] = []
+        self.loop = False
+        # Compiled: symbol -> reachable nodes
+        self.step: Dict[str, Tuple["_Node", ...]] = {}
+
+class DialPlan:
+    """Dial plan compiled into a trie.
+
+    Rules are separated by '|', e.g. "112|1XX|[2-9]XXXXXX|00X.":
+      0-9 * #   literal symbol
+      X Z N     any digit, 1-9, 2-9
+      [1-37]    any symbol of the set, ranges allowed
+      .         one or more of any symbol (end of rule only)
+    """
+    def __init__(self, plan: str):
+        self.plan = plan
+        self._root = _Node()
+
+        rules = [rule.strip() for rule in plan.strip().strip("()").split('|')]
+        for rule in rules:
+            if rule:
+                self._insert(rule, self._parse(rule))
+        self._compile(self._root)
+
+    def __str__(self):
+        return f"DialPlan({self.plan})"
+
+    @staticmethod
+    def _parse(rule: str) -> List[FrozenSet[str]]:
+        elements = []
+        idx = 0
+        while idx < len(rule):
+            char = rule[idx].upper()
+            if char in SYMBOLS:
+                elements.append(frozenset(char))
+            elif char in _WILDCARDS:
+                elements.append(_WILDCARDS[char])
+            elif char == _TAIL:
+                if idx != len(rule) - 1:
+                    raise ValueError(f"'{_TAIL}' must end the rule: {rule}")
+                elements.append(None)
+            elif char == '[':
+                end = rule.find(']', idx)
+                if end < 0:
+                    raise ValueError(f"Unterminated '[' in rule: {rule}")
+                elements.append(DialPlan._parse_set(rule, rule[idx + 1:end]))
+                idx = end
+            else:
+                raise ValueError(f"Invalid character '{rule[idx]}' in rule: {rule}")
+            idx += 1
+        return elements
+
+    @staticmethod
+    def _parse_set(rule: str, body: str) -> FrozenSet[str]:
+        symbols = set()
+        idx = 0
+        while idx < len(body):
+            if idx + 2 < len(body) and body[idx + 1] == '-':
+                low, high = body[idx], body[idx + 2]
+                if low not in DIGITS or high not in DIGITS or low > high:
+                    raise ValueError(f"Invalid range '{body[idx:idx + 3]}' in rule: {rule}")
+                symbols.update(DIGITS[DIGITS.index(low):DIGITS.index(high) + 1])
+                idx += 3
+            elif body[idx] in SYMBOLS:
+                symbols.add(body[idx])
+                idx += 1
+            else:
+                raise ValueError(f"Invalid character '{body[idx]}' in rule: {rule}")
+        if not symbols:
+            raise ValueError(f"Empty set in rule: {rule}")
+        return frozenset(symbols)
+
+    def _insert(self, rule: str, elements: List[Optional[FrozenSet[str]]]):
+        node = self._root
+        for element in elements:
+            # Tail is an edge on any symbol to a node looping on itself
+            loop = element is None
+            key = (frozenset(SYMBOLS) if loop else element, loop)
+            child = node.edges.get(key)
+            if child is None:
+                child = _Node()
+                child.loop = loop
+                node.edges[key] = child
+            node = child
+        node.rules.append(rule)
+
+    def _compile(self, node: _Node):
+        step: Dict[str, List[_Node]] = {}
+        for (symbols, _), child in node.edges.items():
+            for symbol in symbols:
+                step.setdefault(symbol, []).append(child)
+            self._compile(child)
+        if node.loop:
+            for symbol in SYMBOLS:
+                step.setdefault(symbol, []).append(node)
+        node.step = {symbol: tuple(nodes) for symbol, nodes in step.items()}
+
+    def start(self) -> Tuple[_Node, ...]:
+        return (self._root,)
+
+    def advance(self, active: Tuple[_Node, ...], symbol: str) -> Tuple[_Node, ...]:
+        reached = []
+        for node in active:
+            for child in node.step.get(symbol, ()):
+                if child not in reached:
+                    reached.append(child)
+        return tuple(reached)
+
+    @staticmethod
+    def evaluate(active: Tuple[_Node, ...]) -> Tuple[DialResult, Optional[str]]:
+        """Classify the active nodes, a match is complete once nothing can extend it."""
+        if not active:
+            return DialResult.IMPOSSIBLE, None
+
+        matched = next((node.rules[0] for node in active if node.rules), None)
+        if matched is not None and not any(node.step for node in active):
+            return DialResult.COMPLETE, matched
+        return DialResult.INCOMPLETE, matched
+
+class DigitCollector:
+    """Collects dialed digits of a channel and matches them against a DialPlan.
+
+    on_result is called once per dial attempt with (result, number, rule),
+    either as soon as the plan decides or after timeout seconds without digits.
+    """
+    def __init__(self, plan: DialPlan, timeout: float, on_result=None, clock=time.time):
+        self._logger = logging.getLogger("DigitCollector")
+
+        self._plan = plan
+        self._timeout = timeout
+        self.on_result = on_result
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._digits = ""
+        self._active = plan.start()
+        self._last_digit = None
+        self._done = False
+
+    @property
+    def digits(self):
+        return self._digits
+
+    def reset(self):
+        with self._lock:
+            self._digits = ""
+            self._active = self._plan.start()
+            self._last_digit = None
+            self._done = False
+
+    def push(self, digit: str, timestamp=None) -> DialResult:
+        with self._lock:
+            if self._done:
+                self._logger.debug(f"Ignoring digit={digit}, dial attempt already finished")
+                return DialResult.IMPOSSIBLE
+
+            self._digits += digit
+            self._last_digit = timestamp if timestamp is not None else self._clock()
+            self._active = self._plan.advance(self._active, digit)
+            result, rule = self._plan.evaluate(self._active)
+
+            if result == DialResult.INCOMPLETE:
+                return result
+            self._done = True
+
+        self._finish(result, rule)
+        return result
+
+    def check_timeout(self):
+        """Should be called periodically, completes the dial attempt on inter digit timeout."""
+        with self._lock:
+            if self._done or self._last_digit is None:
+                return None
+            if self._clock() - self._last_digit < self._timeout:
+                return None
+
+            _, rule = self._plan.evaluate(self._active)
+            result = DialResult.COMPLETE if rule is not None else DialResult.IMPOSSIBLE
+            self._done = True
+
+        self._finish(result, rule)
+        return result
+
+    def _finish(self, result: DialResult, rule: Optional[str]):
+        self._logger.info(f"Dial result={result.name} number={self._digits} rule={rule}")
+        if self.on_result:
+            self.on_result(result, self._digits, rule)
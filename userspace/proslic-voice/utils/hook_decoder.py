@@ -12,13 +12,17 @@ class HookEvent(Enum):
     PULSE_DIGIT = auto()
     ONHOOK_TIMEOUT = auto()
     OFFHOOK_TIMEOUT = auto()
+    # Emitted by the DTMF decoders, they share the hook event stream
+    DTMF_DIGIT = auto()
 
 class HookPulseDetector:
-    def __init__(self, config: HookConfig):
+    def __init__(self, config: HookConfig, on_event=None, clock=time.time):
         self._logger = logging.getLogger("HookPulseDetector")
         self.config = config
 
-        # self.on_event = on_event  # callback: fn(event_type, details)
+        self.on_event = on_event  # callback: fn(event_type, details)
+        # Time source, replaced by a virtual clock when replaying traces
+        self._clock = clock
 
         self._hook_state = None
         self._transition_time = None
@@ -29,7 +33,7 @@ class HookPulseDetector:
 
     def setup(self, status: HookStatus):
         self._hook_state = status
-        self._transition_time = time.time()
+        self._transition_time = self._clock()
 
     def on_state_changed(self, timestamp, new_state: HookStatus):
         self._event_time = timestamp
@@ -59,7 +63,7 @@ class HookPulseDetector:
         if not self._awaiting_timeout:
             return
 
-        now = time.time()
+        now = self._clock()
         delta = now - self._transition_time
 
         # Passed inter digit delay, so number ended or HOOKED
@@ -78,8 +82,8 @@ class HookPulseDetector:
 
     def _emit(self, event:HookEvent, data=None):
         self._logger.info(f"Detected hook event={event.name} data={data}")
-        # if self.on_event:
-        #     self.on_event(event, data)
+        if self.on_event:
+            self.on_event(event, data)
 
     def _reset(self):
         self._pulse_count = 0
@@ -40,6 +40,20 @@ class ProSLIC_CommonREGs(Enum):
     LCRRTP = 0x22
     LOOPBACK = 0x2B
     ENHANCE = 0x2F
+    OMODE = 0x30
+    OCON = 0x31
+    O1TALO = 0x32
+    O1TAHI = 0x33
+    O1TILO = 0x34
+    O1TIHI = 0x35
+    O2TALO = 0x36
+    O2TAHI = 0x37
+    O2TILO = 0x38
+    O2TIHI = 0x39
+    FSKDAT = 0x3A
+    FSKDEPTH = 0x3B
+    # ...
+    TONDTMF = 0x3C
     # ...
     AUTO = 0x50
     JMPEN = 0x51
@@ -60,6 +74,28 @@ class ProSLIC_CommonREGs(Enum):
 
 # Known RAM Addrs that *should* be shared between devices
 class ProSLIC_CommonRamAddrs(Enum):
+    MADC_VTIPC = 1
+    MADC_VRINGC = 2
+    MADC_VBAT = 3
+    MADC_VLONG = 4
+    MADC_VDC = 6
+    MADC_ILONG = 7
+    MADC_ITIP = 8
+    MADC_IRING = 9
+    MADC_ILOOP = 10
+    VDIFF_SENSE = 11
+    VTIP = 12
+    VRING = 13
+    OSC1FREQ = 26
+    OSC1AMP = 27
+    OSC1PHAS = 28
+    OSC2FREQ = 29
+    OSC2AMP = 30
+    OSC2PHAS = 31
+    FSKFREQ0 = 834
+    FSKFREQ1 = 835
+    FSKAMP0 = 836
+    FSKAMP1 = 837
     BLOB_ID = 0x1C0
     TEST_IO = 0x1C1
     BLOB_DATA_ADDR = 1358
@@ -67,6 +103,9 @@ class ProSLIC_CommonRamAddrs(Enum):
     BLOB_JMP_TABLE2 = 0x63D
     # ...
 
+# TONDTMF low nibble to digit, 0xA is '0' and 0x0 is 'D'
+DTMF_DIGIT_MAP = "D1234567890*#ABC"
+
 class ProSLIC_IRQ1(Enum):
     IRQ_OSC1_T1 = 1 << 0
     IRQ_OSC1_T2 = 1 << 1
@@ -96,3 +135,17 @@ class ProSLIC_IRQ3(Enum):
     IRQ_PQ6 = 1 << 5
     IRQ_DSP = 1 << 6
     IRQ_MADC_FS = 1 << 7
+
+# Plain int aliases for the hot paths (IRQ, hook, ring cadence, FSK, blob upload), spares an Enum lookup per access
+REG_IRQ0 = ProSLIC_CommonREGs.IRQ0.value
+REG_IRQ1 = ProSLIC_CommonREGs.IRQ1.value
+REG_IRQ2 = ProSLIC_CommonREGs.IRQ2.value
+REG_IRQ3 = ProSLIC_CommonREGs.IRQ3.value
+REG_LINEFEED = ProSLIC_CommonREGs.LINEFEED.value
+REG_LCRRTP = ProSLIC_CommonREGs.LCRRTP.value
+REG_AUTO = ProSLIC_CommonREGs.AUTO.value
+REG_TONDTMF = ProSLIC_CommonREGs.TONDTMF.value
+REG_FSKDAT = ProSLIC_CommonREGs.FSKDAT.value
+REG_RAM_ADDR_HI = ProSLIC_CommonREGs.RAM_ADDR_HI.value
+RAM_BLOB_DATA_ADDR = ProSLIC_CommonRamAddrs.BLOB_DATA_ADDR.value
+RAM_BLOB_DATA_DATA = ProSLIC_CommonRamAddrs.BLOB_DATA_DATA.value
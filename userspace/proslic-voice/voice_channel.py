@@ -4,14 +4,21 @@ import time
 
 from typing import List
 
-from config import DeviceConfig, FXSConfig, HookConfig
+from config import DeviceConfig, FXSConfig, HookConfig, DTMFMode, CallerIDMode
 from core.device import SiDevice
+from core.io_actor import IOPriority, set_io_priority
 from exceptions import RingUnhookException
-from devices.si3228 import SI3228x_REGs
 from utils.ring_pattern import RingPattern
-from utils.hook_decoder import HookPulseDetector
-from utils.resources import ProSLIC_IRQ2
-from statuses import Linefeed, HookStatus, InterrupFlags
+from utils.hook_decoder import HookPulseDetector, HookEvent
+from utils.dial_plan import DialPlan, DigitCollector, DialResult
+from utils.caller_id import caller_id
+from audio.fsk import transmission_time
+from utils.resources import ProSLIC_CommonREGs, ProSLIC_IRQ1, ProSLIC_IRQ2, ProSLIC_IRQ3
+from statuses import Linefeed, HookStatus, InterrupFlags, CallProgressTones, LoopbackMode
+
+# Caller ID starts this long after the first ring and must end this long before the next
+CID_RING_DELAY = 0.5
+CID_RING_GUARD = 0.2
 
 class VoiceChannel:
     
@@ -29,15 +36,40 @@ class VoiceChannel:
         self._ringer_thread = None
         self._ringer_stop_event = threading.Event()
         self._ringer_lock = threading.Lock()
+        # Caller ID sent in the first ring silence, set by startRing()
+        self._ringer_cid = None
+        self._cid_feeder = None
+
+        # Set by the line protection, keeps the line open
+        self._isolated = False
 
         # Hook pulses detector
-        self._hook_detector = HookPulseDetector(fxs_config.hook_config)
+        self._hook_detector = HookPulseDetector(fxs_config.hook_config, self._on_hook_event)
+
+        # Call progress tones, set when the device plays tones
+        self._tone_engine = None
+        self._tone_key = None
+        self._tone_specs = {
+            CallProgressTones.DIAL: fxs_config.tone_dial,
+            CallProgressTones.BUSY: fxs_config.tone_busy,
+            CallProgressTones.RINGING: fxs_config.tone_ringing,
+        }
+
+        # Dialed digits collector
+        self._digit_collector = DigitCollector(
+            DialPlan(fxs_config.dial_plan), fxs_config.dial_timeout, self._on_dial_result)
 
     def __str__(self):
         return f"VoiceChannel(name={self.device.name} chan={self.channel_id})"
 
     def getChannelId(self):
         return self.channel_id
+
+    def getFXSConfig(self):
+        return self._fxs_config
+
+    def getAudioSlot(self):
+        return self._fxs_config.audio_slot
     
     def begin(self, dev_config: DeviceConfig, ):
         self.logger.debug(dev_config)
@@ -54,9 +86,6 @@ class VoiceChannel:
         self.setLineFeed(Linefeed.NOP)
         self.device.setLoopback(self.channel_id, self._fxs_config.loopback)
 
-        # Configure Ring Patterns
-        self._ring_patters.append(RingPattern(self._fxs_config.ring_pattern))
-
         # Things to do to begin channel
         self.logger.debug("Enable channel by putting in IDLE state")
         self.setLineFeed(Linefeed.IDLE)
@@ -67,13 +96,37 @@ class VoiceChannel:
         self.logger.debug("Enable only Linefeed change IRQs")
         # FIXME: HARDCODED flags, pass flags to method below
         # self.device.enableIRQ(self.channel_id)
+        irqEn2 = ProSLIC_IRQ2.IRQ_LOOP_STATUS.value
+        if dev_config.dtmf == DTMFMode.HARDWARE:
+            # FIXME: DTMF decoder coefficients (DTMFDTF_*, DTMFLPF_*) are left
+            # to the values set by the blob, presets are unknown.
+            self.logger.debug("Enable DTMF decoder IRQs")
+            irqEn2 |= ProSLIC_IRQ2.IRQ_DTMF.value
         self.device.writeRegister(
-            self.channel_id, SI3228x_REGs.IRQEN2.value,
-            ProSLIC_IRQ2.IRQ_LOOP_STATUS.value
-        )
+            self.channel_id, ProSLIC_CommonREGs.IRQEN2.value, irqEn2)
+        if dev_config.protection:
+            self.logger.debug("Enable line protection IRQs")
+            # FIXME: VBAT_IRQ_TH is left to the value set by the blob
+            self.device.writeRegister(
+                self.channel_id, ProSLIC_CommonREGs.IRQEN1.value, ProSLIC_IRQ1.IRQ_VBAT.value)
+            self.device.writeRegister(
+                self.channel_id, ProSLIC_CommonREGs.IRQEN3.value,
+                ProSLIC_IRQ3.IRQ_P_HVIC.value | ProSLIC_IRQ3.IRQ_P_THERM.value | ProSLIC_IRQ3.IRQ_PQ3.value |
+                ProSLIC_IRQ3.IRQ_PQ4.value | ProSLIC_IRQ3.IRQ_PQ5.value | ProSLIC_IRQ3.IRQ_PQ6.value)
         # This should reset the device IRQ flags
         self.device.getInterruptChannels()
 
+        self._start()
+
+    def adopt(self):
+        """Takes over a line left configured and running by a previous daemon."""
+        self.logger.debug(f"Adopting channel={self.channel_id}")
+        self._start()
+
+    def _start(self):
+        # Configure Ring Patterns
+        self._ring_patters.append(RingPattern(self._fxs_config.ring_pattern))
+
         # Start the hook state detector:
         self._hook_detector.setup(self.getHookState())
         self._hook_thread = threading.Thread(target=self._hook_run, daemon=True)
@@ -81,10 +134,54 @@ class VoiceChannel:
     
     def close(self):
         # Things to do to clear channel status
+        self.stopTone()
         self.stopRing()
         self.setLineFeed(Linefeed.NOP)
 
+    def release(self):
+        """Stops driving the line but leaves it powered, for a successor to adopt."""
+        self.stopTone()
+        if self.isRinging():
+            self.stopRing()
+
+    def isIdle(self):
+        return self.getHookState() == HookStatus.HOOKED and not self.isRinging()
+
+    def reconfigure(self, fxs_config: FXSConfig, changes: List[str]):
+        """Applies the changed fields of a new configuration, the line must be idle."""
+        # Parsed first, an invalid configuration leaves the line as it is
+        ring_pattern = RingPattern(fxs_config.ring_pattern)
+        digit_collector = DigitCollector(DialPlan(fxs_config.dial_plan), fxs_config.dial_timeout, self._on_dial_result)
+        self.logger.info(f"Reconfiguring channel={self.channel_id}: {', '.join(changes)}")
+
+        if "impedance" in changes:
+            self.device.configureZsynth(self.channel_id, fxs_config.impedance)
+        if "audio_slot" in changes:
+            self.device.setPCMTimeslot(self.channel_id, fxs_config.audio_slot)
+        if "loopback" in changes:
+            # Modes are separate bits, clear the previous one
+            self.device.setLoopback(self.channel_id, LoopbackMode.NONE)
+            self.device.setLoopback(self.channel_id, fxs_config.loopback)
+        if "ring_pattern" in changes:
+            self._ring_patters[0] = ring_pattern
+        if "hook_config" in changes:
+            hook_detector = HookPulseDetector(fxs_config.hook_config, self._on_hook_event)
+            hook_detector.setup(self.getHookState())
+            self._hook_detector = hook_detector
+        if "dial_plan" in changes or "dial_timeout" in changes:
+            self._digit_collector = digit_collector
+
+        self._tone_specs = {
+            CallProgressTones.DIAL: fxs_config.tone_dial,
+            CallProgressTones.BUSY: fxs_config.tone_busy,
+            CallProgressTones.RINGING: fxs_config.tone_ringing,
+        }
+        self._fxs_config = fxs_config
+
     def startRing(self, cid = None, pattern_idx = 0):
+        if self._isolated:
+            self.logger.warning(f"Channel={self.channel_id} is isolated, not ringing")
+            return
         if self.getHookState() == HookStatus.UNHOOKED:
              raise RingUnhookException()
         
@@ -97,7 +194,8 @@ class VoiceChannel:
             pattrn = self._ring_patters[pattern_idx]
             if not pattrn:
                 raise RuntimeError(f"Unable to find registered ring pattern with index={pattern_idx}")
-            self._ringer_active_pattern = iter(pattrn)            
+            self._ringer_active_pattern = iter(pattrn)
+            self._ringer_cid = self._callerIDData(cid, pattrn) if cid else None
             
             # Create the thread
             self._ringer_stop_event.clear()
@@ -114,6 +212,8 @@ class VoiceChannel:
                 return
 
             self.logger.info("Stopping ringer thread...")
+            if self._cid_feeder is not None:
+                self._cid_feeder.cancel(self.device, self.channel_id)
             self._ringer_stop_event.set()
             self._ringer_thread.join()
 
@@ -121,6 +221,22 @@ class VoiceChannel:
             self.logger.info("Ringer thread stopped.")
         pass
 
+    def setCallerIDFeeder(self, feeder):
+        self._cid_feeder = feeder
+
+    def _callerIDData(self, cid: str, pattern: RingPattern):
+        if self._fxs_config.cid == CallerIDMode.NONE or self._cid_feeder is None:
+            self.logger.warning(f"Caller ID is disabled on channel={self.channel_id}")
+            return None
+
+        data = caller_id(self._fxs_config.cid, cid)
+        # Sent in the first silence of the pattern
+        silence = pattern.durations[1] if len(pattern.durations) > 1 else 0
+        if CID_RING_DELAY + transmission_time(data) + CID_RING_GUARD > silence:
+            self.logger.warning(f"Ring pattern={pattern.pattern_str} silence too short for caller ID")
+            return None
+        return data
+
     def isRinging(self):
         with self._ringer_lock:
             return self._ringer_thread and self._ringer_thread.is_alive()
@@ -132,8 +248,54 @@ class VoiceChannel:
             return HookStatus.UNHOOKED        
 
     def setLineFeed(self, state: Linefeed):
+        # An isolated line stays open until restored
+        if self._isolated and state != Linefeed.NOP:
+            return
         self.device.setLineFeed(self.channel_id, state)
 
+    def isIsolated(self):
+        return self._isolated
+
+    def isolate(self):
+        """Opens the line first, then stops what would drive it again."""
+        self._isolated = True
+        self.device.setLineFeed(self.channel_id, Linefeed.NOP)
+        self.stopTone()
+        if self.isRinging():
+            self.stopRing()
+
+    def restore(self):
+        self._isolated = False
+        self.setLineFeed(Linefeed.IDLE)
+        # LOOP was not forwarded while isolated, the handset may have changed state meanwhile
+        self._hook_detector.on_state_changed(time.time(), self.getHookState())
+
+    # key is the audio slot for streamed tones, the chip channel for the oscillators
+    def setToneEngine(self, engine, key):
+        self._tone_engine = engine
+        self._tone_key = key
+
+    def setTone(self, tone: CallProgressTones):
+        if self._tone_engine is None:
+            self.logger.warning(f"Tones are disabled on channel={self.channel_id}")
+            return False
+
+        spec = self._tone_specs.get(tone)
+        if not spec:
+            self.logger.warning(f"No {tone.name} tone configured on channel={self.channel_id}")
+            return False
+
+        try:
+            self._tone_engine.play(self._tone_key, spec)
+        except ValueError as e:
+            self.logger.error(f"Cannot play {tone.name} tone on channel={self.channel_id}: {e}")
+            return False
+        return True
+
+    def stopTone(self):
+        if self._tone_engine is not None:
+            self._tone_engine.stop(self._tone_key)
+
     def testRing(self, delay = 10):
         self.logger.info("Performing Ring Test")
 
@@ -156,8 +318,54 @@ class VoiceChannel:
             hook_status = self.getHookState()
             self._hook_detector.on_state_changed(timestamp, hook_status)
 
+        if InterrupFlags.DTMF in flags:
+            self.handle_dtmf(flags[InterrupFlags.DTMF], timestamp)
+
+        if InterrupFlags.FSK_BUFFER in flags and self._cid_feeder is not None:
+            self._cid_feeder.notify(self.device, self.channel_id)
+
+        # Raised when the oscillators step a tone cadence, or by OSC1 while sending caller ID
+        if self._tone_engine is not None and (InterrupFlags.TONE_ON_END in flags or InterrupFlags.TONE_OFF_END in flags):
+            self._tone_engine.handleInterrupt(self._tone_key, flags)
+
+    def handle_dtmf(self, digit: str, timestamp):
+        self.logger.debug(f"DTMF digit={digit} channel={self.channel_id} timestamp={timestamp}")
+        self._on_hook_event(HookEvent.DTMF_DIGIT, digit)
+
+    def _on_hook_event(self, event: HookEvent, data):
+        if event == HookEvent.DTMF_DIGIT:
+            self._on_digit(data)
+        elif event == HookEvent.PULSE_DIGIT:
+            # 10 pulses are digit 0
+            if not 1 <= data <= 10:
+                self.logger.warning(f"Invalid pulse count={data} channel={self.channel_id}")
+                return
+            self._on_digit(str(data % 10))
+        else:
+            # Off-hook, on-hook and hook flash all start a new dial attempt
+            self._digit_collector.reset()
+            if event == HookEvent.ONHOOK_TIMEOUT:
+                self.stopTone()
+            elif self._tone_engine is not None:
+                self.setTone(CallProgressTones.DIAL)
+
+    def _on_digit(self, digit: str):
+        # Dial tone stops on the first digit
+        if not self._digit_collector.digits:
+            self.stopTone()
+        self._digit_collector.push(digit)
+
+    def _on_dial_result(self, result: DialResult, number: str, rule):
+        if result == DialResult.COMPLETE:
+            self.logger.info(f"Dialed number={number} rule={rule} channel={self.channel_id}")
+        else:
+            self.logger.warning(f"Number={number} not in dial plan channel={self.channel_id}")
+            if self._tone_engine is not None:
+                self.setTone(CallProgressTones.BUSY)
+
     def _ringer_run(self):
         self.logger.debug("Ringer loop started.")
+        set_io_priority(IOPriority.RING)
 
         state = Linefeed.RINGING
         try:
@@ -168,6 +376,12 @@ class VoiceChannel:
                     self.logger.debug(f"Ring status={state}")
                     self.setLineFeed(state)
 
+                    # Caller ID goes in the first silence
+                    if state == Linefeed.RING_IDLE and self._ringer_cid:
+                        self._cid_feeder.send(self.device, self.channel_id, self._ringer_cid,
+                                              self._fxs_config.cid_standard, CID_RING_DELAY)
+                        self._ringer_cid = None
+
                     # Invert the state
                     if state == Linefeed.RINGING:
                         state = Linefeed.RING_IDLE
@@ -188,5 +402,6 @@ class VoiceChannel:
     def _hook_run(self, interval=0.05):
         while True:
             self._hook_detector.check_timeout()
+            self._digit_collector.check_timeout()
             time.sleep(interval)
     
\ No newline at end of file